@@ -0,0 +1,315 @@
+"""
+In-memory stand-ins for the AWS services used by the Kai lambdas.
+
+DynamoDB, S3, SQS and Cognito are provided by moto. EKS calls are answered by
+stubs registered on botocore's event system, so the cluster's endpoint can be
+pointed at the fake Kubernetes API, which is served over plain HTTP from a
+background thread.
+"""
+import json
+import os
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+import botocore.handlers
+from botocore.awsrequest import AWSResponse
+from moto import mock_aws
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+FAKE_BIN_DIR = os.path.join(BENCHMARK_DIR, "bin")
+REGION = "eu-west-1"
+
+graph_table_name = "BenchmarkGraphTable"
+graph_administrator_index_name = "administratorIndex"
+graph_state_index_name = "stateIndex"
+schema_bucket_name = "benchmark-schemas"
+idempotency_table_name = "BenchmarkIdempotencyTable"
+
+
+def configure_environment():
+    """
+    Points boto3 at a fake account and puts the fake helm binary at the
+    front of the PATH
+    """
+    os.environ.update({
+        "AWS_DEFAULT_REGION": REGION,
+        "AWS_REGION": REGION,
+        "AWS_ACCESS_KEY_ID": "benchmark",
+        "AWS_SECRET_ACCESS_KEY": "benchmark",
+        "AWS_SESSION_TOKEN": "benchmark",
+        "graph_table_name": graph_table_name,
+        "graph_administrator_index_name": graph_administrator_index_name,
+        "graph_state_index_name": graph_state_index_name,
+        "schema_bucket_name": schema_bucket_name,
+        "idempotency_table_name": idempotency_table_name,
+        "cluster_name": "BenchmarkCluster",
+        "PATH": FAKE_BIN_DIR + os.pathsep + os.environ["PATH"]
+    })
+
+
+class FakeAws:
+    """
+    Starts moto and answers the calls it cannot serve in process
+    """
+
+    def __init__(self):
+        self.mock = mock_aws()
+        self.kubernetes = FakeKubernetesApi()
+        self.stubs = {
+            "eks.DescribeCluster": self.__describe_cluster
+        }
+
+    def start(self):
+        for name in self.stubs:
+            service_id, operation_name = name.split(".")
+            botocore.handlers.BUILTIN_HANDLERS.append(
+                ("before-parameter-build.{}.{}".format(service_id, operation_name), self.__capture_params)
+            )
+            botocore.handlers.BUILTIN_HANDLERS.append(
+                ("before-call.{}.{}".format(service_id, operation_name), self.__call_stub)
+            )
+        self.mock.start()
+        self.kubernetes.start()
+
+    def stop(self):
+        self.kubernetes.stop()
+        self.mock.stop()
+
+    def create_graph_table(self, stream=False):
+        """
+        Creates the graph table. moto keeps every stream record and copies
+        them on each transaction, so the stream is only enabled when needed.
+        """
+        kwargs = {}
+        if stream:
+            kwargs["StreamSpecification"] = { "StreamEnabled": True, "StreamViewType": "NEW_IMAGE" }
+        table = boto3.client("dynamodb").create_table(
+            TableName=graph_table_name,
+            KeySchema=[ { "AttributeName": "releaseName", "KeyType": "HASH" } ],
+            AttributeDefinitions=[
+                { "AttributeName": "releaseName", "AttributeType": "S" },
+                { "AttributeName": "administrator", "AttributeType": "S" },
+                { "AttributeName": "graphReleaseName", "AttributeType": "S" },
+                { "AttributeName": "currentState", "AttributeType": "S" }
+            ],
+            BillingMode="PAY_PER_REQUEST",
+            GlobalSecondaryIndexes=[
+                {
+                    "IndexName": graph_administrator_index_name,
+                    "KeySchema": [
+                        { "AttributeName": "administrator", "KeyType": "HASH" },
+                        { "AttributeName": "graphReleaseName", "KeyType": "RANGE" }
+                    ],
+                    "Projection": { "ProjectionType": "KEYS_ONLY" }
+                },
+                {
+                    "IndexName": graph_state_index_name,
+                    "KeySchema": [
+                        { "AttributeName": "currentState", "KeyType": "HASH" },
+                        { "AttributeName": "releaseName", "KeyType": "RANGE" }
+                    ],
+                    "Projection": { "ProjectionType": "KEYS_ONLY" }
+                }
+            ],
+            **kwargs
+        )
+        if stream:
+            os.environ["graph_table_stream_arn"] = table["TableDescription"]["LatestStreamArn"]
+
+    def put_graph(self, graph_name, status, administrators, **attributes):
+        """
+        Writes a graph record, with any extra attributes given, and its
+        membership items straight to the table
+        """
+        table = boto3.resource("dynamodb").Table(graph_table_name)
+        release_name = graph_name.lower()
+        with table.batch_writer() as batch:
+            batch.put_item(Item={
+                "graphName": graph_name,
+                "releaseName": release_name,
+                "currentState": status,
+                "administrators": administrators,
+                "endpoints": {},
+                **attributes
+            })
+            for administrator in administrators:
+                batch.put_item(Item={
+                    "releaseName": release_name + "#" + administrator,
+                    "administrator": administrator,
+                    "graphReleaseName": release_name
+                })
+
+    def clear_graph_table(self):
+        """
+        Removes every item from the table. moto copies every table on each
+        transaction, so scenarios which create graphs clear them between calls
+        to stop that cost growing with each call.
+        """
+        table = boto3.resource("dynamodb").Table(graph_table_name)
+        items = table.scan(ProjectionExpression="releaseName")["Items"]
+        with table.batch_writer() as batch:
+            for item in items:
+                batch.delete_item(Key=item)
+
+    def create_user_pool(self, usernames):
+        cognito = boto3.client("cognito-idp")
+        user_pool_id = cognito.create_user_pool(PoolName="BenchmarkUserPool")["UserPool"]["Id"]
+        for username in usernames:
+            cognito.admin_create_user(UserPoolId=user_pool_id, Username=username)
+        os.environ["user_pool_id"] = user_pool_id
+        return user_pool_id
+
+    def create_idempotency_table(self):
+        boto3.client("dynamodb").create_table(
+            TableName=idempotency_table_name,
+            KeySchema=[ { "AttributeName": "idempotencyKey", "KeyType": "HASH" } ],
+            AttributeDefinitions=[ { "AttributeName": "idempotencyKey", "AttributeType": "S" } ],
+            BillingMode="PAY_PER_REQUEST"
+        )
+
+    def create_schema_bucket(self):
+        boto3.client("s3").create_bucket(
+            Bucket=schema_bucket_name,
+            CreateBucketConfiguration={ "LocationConstraint": REGION }
+        )
+
+    def create_queue(self, queue_name):
+        queue_url = boto3.client("sqs").create_queue(QueueName=queue_name)["QueueUrl"]
+        os.environ["sqs_queue_url"] = queue_url
+        return queue_url
+
+    def purge_queue(self, queue_url):
+        """
+        Removes every message from a queue. PurgeQueue can only be called once
+        a minute, so the messages are received and deleted instead.
+        """
+        sqs = boto3.client("sqs")
+        while True:
+            messages = sqs.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10).get("Messages", [])
+            if len(messages) == 0:
+                return
+            sqs.delete_message_batch(
+                QueueUrl=queue_url,
+                Entries=[ { "Id": str(i), "ReceiptHandle": m["ReceiptHandle"] } for i, m in enumerate(messages) ]
+            )
+
+    def create_readiness_queue(self):
+        queue_url = boto3.client("sqs").create_queue(QueueName="DeploymentReadinessQueue")["QueueUrl"]
+        os.environ["readiness_queue_url"] = queue_url
+        return queue_url
+
+    def __capture_params(self, params, context, **kwargs):
+        context["fake_params"] = params
+
+    def __call_stub(self, model, context, **kwargs):
+        stub = self.stubs[model.service_model.service_id.hyphenize() + "." + model.name]
+        return (AWSResponse(None, 200, {}, None), stub(context["fake_params"]))
+
+    def __describe_cluster(self, params):
+        return {
+            "cluster": {
+                "name": params["name"],
+                "endpoint": self.kubernetes.endpoint,
+                "resourcesVpcConfig": {
+                    "clusterSecurityGroupId": "sg-benchmark"
+                }
+            }
+        }
+
+
+class FakeKubernetesApi:
+    """
+    Answers the Kubernetes API requests made by the workers. Every release
+    has three ingresses which already have load balancer addresses, except
+    releases named pending... whose ingresses are only given addresses by
+    the events of a watch. Likewise namespaces have already been removed,
+    except those of pending graphs, named kai-pending..., which are removed
+    during a watch. Deleting always succeeds.
+    """
+
+    def __init__(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeKubernetesApiHandler)
+        self.server.daemon_threads = True
+        self.endpoint = "http://127.0.0.1:{}".format(self.server.server_address[1])
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeKubernetesApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, which Nagle's algorithm would delay
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        if url.path == "/api/v1/namespaces":
+            return self.__get_namespaces(query)
+        if not url.path.endswith("/ingresses"):
+            return self.__respond(404, { "kind": "Status", "code": 404 })
+        release = query.get("labelSelector", [ "release=benchmark" ])[0].split("=", 1)[1]
+
+        if query.get("watch") == [ "true" ]:
+            return self.__stream([ { "type": "MODIFIED", "object": self.__ingress(release, component, True) }
+                                   for component in self.COMPONENTS ])
+        self.__respond(200, {
+            "kind": "IngressList",
+            "metadata": { "resourceVersion": "1" },
+            "items": [ self.__ingress(release, component, not release.startswith("pending"))
+                       for component in self.COMPONENTS ]
+        })
+
+    def do_DELETE(self):
+        self.__respond(200, { "kind": "Status", "status": "Success" })
+
+    def log_message(self, format, *args):
+        pass
+
+    COMPONENTS = ("gaffer-api", "gaffer-monitor", "hdfs")
+
+    def __get_namespaces(self, query):
+        name = query.get("fieldSelector", [ "metadata.name=benchmark" ])[0].split("=", 1)[1]
+        namespace = { "metadata": { "name": name }, "status": { "phase": "Terminating" } }
+        if query.get("watch") == [ "true" ]:
+            return self.__stream([ { "type": "DELETED", "object": namespace } ])
+        self.__respond(200, {
+            "kind": "NamespaceList",
+            "metadata": { "resourceVersion": "1" },
+            "items": [ namespace ] if name.startswith("kai-pending") else []
+        })
+
+    def __ingress(self, release, component, assigned):
+        name = "{}-{}".format(release, component)
+        load_balancers = [ { "hostname": name + ".eu-west-1.elb.amazonaws.com" } ] if assigned else []
+        return {
+            "metadata": { "name": name },
+            "status": { "loadBalancer": { "ingress": load_balancers } }
+        }
+
+    def __respond(self, status, body):
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def __stream(self, events):
+        """
+        Sends each event as its own chunk, as the API server does for a watch
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for event in events:
+            content = json.dumps(event).encode("utf-8") + b"\n"
+            self.wfile.write("{:x}\r\n".format(len(content)).encode("ascii") + content + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
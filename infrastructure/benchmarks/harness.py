@@ -0,0 +1,130 @@
+"""
+Measures a single scenario in a fresh interpreter and prints the results as
+JSON. This is run by run_benchmarks.py, once to time a clean import of the
+handler module and once to time calls to it against the fakes.
+"""
+import argparse
+import gc
+import importlib
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import scenarios
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def prepare(scenario):
+    for path in reversed(scenario.paths + [ scenarios.COMMON_DIR ]):
+        sys.path.insert(0, path)
+    os.environ.update(scenario.environment)
+
+
+def time_import(scenario):
+    import fakes
+    fakes.configure_environment()
+    prepare(scenario)
+
+    start = time.perf_counter()
+    importlib.import_module(scenario.module)
+    return { "importMs": (time.perf_counter() - start) * 1000 }
+
+
+def time_calls(scenario, iterations, allocation_iterations):
+    import fakes
+    fakes.configure_environment()
+    prepare(scenario)
+
+    aws = fakes.FakeAws()
+    aws.start()
+    try:
+        calls = 1 + iterations + allocation_iterations
+        event = scenario.setup(aws, calls)
+        entrypoint = getattr(importlib.import_module(scenario.module), scenario.entrypoint)
+
+        def reset(i):
+            if scenario.reset is not None:
+                scenario.reset(aws, i)
+
+        start = time.perf_counter()
+        entrypoint(event(0), None)
+        first_call_ms = (time.perf_counter() - start) * 1000
+        reset(0)
+
+        # The phases timed during warm calls are kept to total the DynamoDB
+        # capacity they consumed
+        import metrics
+        recorded = metrics.MemorySink()
+        metrics.set_sink(recorded)
+        samples = []
+        gc.collect()
+        for i in range(1, 1 + iterations):
+            e = event(i)
+            start = time.perf_counter()
+            entrypoint(e, None)
+            samples.append((time.perf_counter() - start) * 1000)
+            reset(i)
+        metrics.set_sink(None)
+        consumed_capacity = sum(record.get("ConsumedCapacity", 0) for record in recorded.records)
+
+        # Allocations are traced separately as tracing slows every call down.
+        # Garbage is collected around each call so only what it keeps alive
+        # counts as retained, rather than whatever a collection happens to free
+        peaks = []
+        retained = 0
+        tracemalloc.start()
+        for i in range(1 + iterations, calls):
+            e = event(i)
+            gc.collect()
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            entrypoint(e, None)
+            peak = tracemalloc.get_traced_memory()[1]
+            gc.collect()
+            current = tracemalloc.get_traced_memory()[0]
+            peaks.append(peak - before)
+            retained += current - before
+            reset(i)
+        tracemalloc.stop()
+
+        return {
+            "firstCallMs": first_call_ms,
+            "warmP50Ms": percentile(samples, 0.5),
+            "warmP99Ms": percentile(samples, 0.99),
+            "warmMeanMs": sum(samples) / len(samples),
+            "peakAllocatedKiB": max(peaks) / 1024 if peaks else 0,
+            "retainedPerCallKiB": retained / max(1, len(peaks)) / 1024,
+            "capacityUnitsPerCall": consumed_capacity / max(1, iterations),
+            "iterations": iterations
+        }
+    finally:
+        aws.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("scenario")
+    parser.add_argument("--import-only", action="store_true")
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--allocation-iterations", type=int, default=10)
+    args = parser.parse_args()
+
+    scenario = scenarios.get_scenario(args.scenario)
+    if args.import_only:
+        result = time_import(scenario)
+    else:
+        result = time_calls(scenario, args.iterations, args.allocation_iterations)
+
+    # Handlers log to stdout so the result is written on a line of its own
+    sys.stdout.write("\nBENCHMARK_RESULT " + json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Runs the Lambda handler benchmark suite.
+
+Every scenario is measured in fresh interpreters so that import time and the
+first call reflect a cold start. Results can be saved as a baseline and later
+runs compared against it, for example:
+
+    python run_benchmarks.py --save baselines/baseline.json
+    python run_benchmarks.py --compare baselines/baseline.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import scenarios
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+HARNESS = os.path.join(BENCHMARK_DIR, "harness.py")
+RESULT_PREFIX = "BENCHMARK_RESULT "
+
+COLUMNS = [
+    ("importMs", "import ms"),
+    ("firstCallMs", "first call ms"),
+    ("warmP50Ms", "warm p50 ms"),
+    ("warmP99Ms", "warm p99 ms"),
+    ("peakAllocatedKiB", "peak KiB"),
+    ("retainedPerCallKiB", "retained KiB"),
+    ("capacityUnitsPerCall", "capacity units")
+]
+
+
+def run_harness(scenario_name, *args):
+    cmd = [ sys.executable, HARNESS, scenario_name ] + list(args)
+    cp = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, cwd=BENCHMARK_DIR)
+    for line in cp.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    raise RuntimeError("Benchmark {} failed:\n{}".format(scenario_name, cp.stdout))
+
+
+def run_scenario(scenario, iterations, import_repeats):
+    # Import time is noisy so the best of several clean imports is reported
+    import_times = [ run_harness(scenario.name, "--import-only")["importMs"] for _ in range(import_repeats) ]
+    result = run_harness(scenario.name, "--iterations", str(iterations))
+    result["importMs"] = min(import_times)
+    return result
+
+
+def print_results(results, baseline=None):
+    name_width = max(len(name) for name in results)
+    header = "scenario".ljust(name_width) + "".join(title.rjust(16) for _, title in COLUMNS)
+    print(header)
+    print("-" * len(header))
+    for name, result in results.items():
+        row = name.ljust(name_width)
+        for key, _ in COLUMNS:
+            cell = "{:.2f}".format(result[key])
+            if baseline is not None and name in baseline and baseline[name].get(key):
+                cell += " ({:+.0f}%)".format((result[key] - baseline[name][key]) / baseline[name][key] * 100)
+            row += cell.rjust(16)
+        print(row)
+
+
+def find_regressions(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        for key, _ in COLUMNS:
+            previous = baseline.get(name, {}).get(key)
+            if previous and result[key] > previous * (1 + tolerance):
+                regressions.append("{} {}: {:.2f} -> {:.2f}".format(name, key, previous, result[key]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the Kai Lambda handlers against local fakes")
+    parser.add_argument("--scenario", action="append", help="Only run the named scenario, may be repeated")
+    parser.add_argument("--iterations", type=int, default=100, help="Number of warm calls to time")
+    parser.add_argument("--import-repeats", type=int, default=3, help="Number of clean imports to time")
+    parser.add_argument("--save", help="Save the results as a baseline to this file")
+    parser.add_argument("--compare", help="Compare the results with the baseline in this file")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Fractional slow down allowed before --compare reports a regression")
+    args = parser.parse_args()
+
+    selected = [ s for s in scenarios.SCENARIOS if args.scenario is None or s.name in args.scenario ]
+
+    results = {}
+    for scenario in selected:
+        results[scenario.name] = run_scenario(scenario, args.iterations, args.import_repeats)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            f.write(json.dumps(results, indent=2, sort_keys=True) + "\n")
+
+    if baseline is not None:
+        regressions = find_regressions(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions beyond {:.0f}%:".format(args.tolerance * 100))
+            for regression in regressions:
+                print("  " + regression)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+The handler scenarios measured by the benchmark suite. Each scenario seeds
+the fakes with enough state for every call it makes and returns a function
+producing the event for the nth call.
+"""
+import json
+import os
+import time
+
+LIB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lib")
+COMMON_DIR = os.path.join(LIB_DIR, "common", "layer", "python")
+REST_DIR = os.path.join(LIB_DIR, "rest-api", "lambdas")
+WORKERS_DIR = os.path.join(LIB_DIR, "workers", "lambdas")
+PLATFORM_DIR = os.path.join(LIB_DIR, "platform", "lambdas")
+
+user = "benchmarkUser"
+other_user = "otherBenchmarkUser"
+schema = {
+    "elements": {
+        "edges": {
+            "BasicEdge": {
+                "source": "vertex",
+                "destination": "vertex",
+                "directed": "true",
+                "properties": { "count": "count" }
+            }
+        }
+    },
+    "types": {
+        "types": {
+            "vertex": { "class": "java.lang.String" },
+            "count": { "class": "java.lang.Integer" },
+            "true": { "class": "java.lang.Boolean" }
+        }
+    }
+}
+
+
+def request(body=None, path_parameters=None, query_parameters=None, headers=None):
+    event = {
+        "headers": headers,
+        "pathParameters": path_parameters,
+        "queryStringParameters": query_parameters,
+        "requestContext": {
+            "authorizer": {
+                "claims": {
+                    "cognito:username": user
+                }
+            }
+        }
+    }
+    if body is not None:
+        event["body"] = json.dumps(body)
+    return event
+
+
+def sqs_event(*bodies):
+    return { "Records": [ { "messageId": str(i), "body": json.dumps(body) } for i, body in enumerate(bodies) ] }
+
+
+def cfn_event(request_type):
+    return {
+        "RequestType": request_type,
+        "StackId": "arn:aws:cloudformation:eu-west-1:123456789012:stack/Benchmark/id",
+        "RequestId": "BenchmarkRequest",
+        "LogicalResourceId": "UninstallGraphsCustomResource",
+        "ResponseURL": "https://localhost/response"
+    }
+
+
+def setup_add_graph_request(fakes, calls):
+    fakes.create_graph_table()
+    fakes.create_user_pool([ user, other_user ])
+    fakes.create_schema_bucket()
+    fakes.create_queue("AddGraphQueue")
+    return lambda i: request(body={
+        "graphName": "graph{}".format(i),
+        "administrators": [ other_user ],
+        "schema": schema
+    })
+
+
+def setup_replayed_add_graph_request(fakes, calls):
+    setup_add_graph_request(fakes, calls)
+    fakes.create_idempotency_table()
+    # Every call after the first is a retry of the first
+    return lambda i: request(body={
+        "graphName": "graph",
+        "administrators": [ other_user ],
+        "schema": schema
+    }, headers={ "Idempotency-Key": "benchmark" })
+
+
+def setup_batch_add_graph_request(fakes, calls):
+    fakes.create_graph_table()
+    fakes.create_user_pool([ user, other_user ])
+    fakes.create_schema_bucket()
+    fakes.create_queue("AddGraphQueue")
+    return lambda i: request(body={
+        "graphs": [
+            {
+                "graphName": "graph{}x{}".format(i, j),
+                "administrators": [ other_user ],
+                "schema": schema
+            } for j in range(10)
+        ]
+    })
+
+
+def setup_get_graphs_request(fakes, calls):
+    fakes.create_graph_table()
+    fakes.create_user_pool([ user ])
+    for i in range(20):
+        fakes.put_graph("graph{}".format(i), "DEPLOYED", [ user ])
+    # Graphs the requesting user cannot see
+    for i in range(200):
+        fakes.put_graph("othergraph{}".format(i), "DEPLOYED", [ other_user ])
+    return lambda i: request()
+
+
+def setup_get_graphs_fields_request(fakes, calls):
+    setup_get_graphs_request(fakes, calls)
+    return lambda i: request(query_parameters={ "fields": "graphName,currentState" })
+
+
+def setup_get_graph_request(fakes, calls):
+    fakes.create_graph_table()
+    fakes.create_user_pool([ user ])
+    fakes.put_graph("graph", "DEPLOYED", [ user ])
+    return lambda i: request(path_parameters={ "graphName": "graph" })
+
+
+def setup_get_graph_status_request(fakes, calls):
+    fakes.create_graph_table(stream=True)
+    fakes.create_user_pool([ user ])
+    fakes.put_graph("graph", "DEPLOYED", [ user ])
+    return lambda i: request(path_parameters={ "graphName": "graph" }, query_parameters={ "waitFor": "DEPLOYED" })
+
+
+def setup_delete_graph_request(fakes, calls):
+    fakes.create_graph_table()
+    fakes.create_user_pool([ user ])
+    fakes.create_queue("DeleteGraphQueue")
+    for i in range(calls):
+        fakes.put_graph("graph{}".format(i), "DEPLOYED", [ user ])
+    return lambda i: request(path_parameters={ "graphName": "graph{}".format(i) })
+
+
+def setup_add_graph(fakes, calls):
+    fakes.create_graph_table()
+    fakes.create_schema_bucket()
+    fakes.create_readiness_queue()
+    for i in range(calls):
+        fakes.put_graph("graph{}".format(i), "DEPLOYMENT_QUEUED", [ user ])
+
+    import schemas
+    schema_digest = schemas.from_environment().put(schema)
+    return lambda i: sqs_event({
+        "graphName": "graph{}".format(i),
+        "releaseName": "graph{}".format(i),
+        "schemaDigest": schema_digest,
+        "expectedStatus": "DEPLOYMENT_QUEUED",
+        "endpoints": {}
+    })
+
+
+def setup_check_deployment(fakes, calls, prefix="graph"):
+    fakes.create_graph_table()
+    fakes.create_readiness_queue()
+    deadline = int(time.time()) + 60 * 60
+    for i in range(calls):
+        fakes.put_graph("{}{}".format(prefix, i), "DEPLOYMENT_IN_PROGRESS", [ user ],
+                        deploymentPhase="AWAITING_READINESS", deploymentDeadline=deadline)
+    return lambda i: sqs_event({
+        "graphName": "{}{}".format(prefix, i),
+        "releaseName": "{}{}".format(prefix, i)
+    })
+
+
+def setup_watched_check_deployment(fakes, calls):
+    """
+    The fake Kubernetes API only assigns addresses to pending graphs through a watch
+    """
+    return setup_check_deployment(fakes, calls, prefix="pending")
+
+
+def setup_removal_check(fakes, calls):
+    """
+    The fake Kubernetes API only removes the namespaces of pending graphs through a watch
+    """
+    fakes.create_graph_table()
+    fakes.create_readiness_queue()
+    deadline = int(time.time()) + 60 * 60
+    for i in range(calls):
+        fakes.put_graph("pending{}".format(i), "DELETION_IN_PROGRESS", [ user ], namespace="kai-pending{}".format(i),
+                        deploymentPhase="AWAITING_REMOVAL", deploymentDeadline=deadline)
+    return lambda i: sqs_event({
+        "graphName": "pending{}".format(i),
+        "releaseName": "pending{}".format(i)
+    })
+
+
+def setup_delete_graph(fakes, calls, namespaced=False):
+    fakes.create_graph_table()
+    fakes.create_readiness_queue()
+    for i in range(calls):
+        attributes = { "namespace": "kai-graph{}".format(i) } if namespaced else {}
+        fakes.put_graph("graph{}".format(i), "DELETION_QUEUED", [ user ], **attributes)
+    return lambda i: sqs_event({
+        "graphName": "graph{}".format(i),
+        "releaseName": "graph{}".format(i),
+        "expectedStatus": "DELETION_QUEUED"
+    })
+
+
+def setup_namespaced_delete_graph(fakes, calls):
+    return setup_delete_graph(fakes, calls, namespaced=True)
+
+
+def setup_uninstall_graphs(fakes, calls):
+    """
+    Deploys some graphs for the uninstaller to queue the deletion of
+    """
+    fakes.create_graph_table()
+    os.environ["delete_graph_queue_url"] = fakes.create_queue("DeleteGraphQueue")
+    redeploy_graphs(fakes, 0)
+    return lambda i: cfn_event("Delete")
+
+
+def redeploy_graphs(fakes, i):
+    fakes.purge_queue(os.environ["delete_graph_queue_url"])
+    for j in range(10):
+        fakes.put_graph("graph{}".format(j), "DEPLOYED", [ user ])
+
+
+def setup_uninstall_graphs_is_complete(fakes, calls):
+    fakes.create_graph_table()
+    for i in range(10):
+        fakes.put_graph("graph{}".format(i), "DEPLOYED", [ user ])
+    return lambda i: cfn_event("Delete")
+
+
+def clear_graphs(fakes, i):
+    fakes.clear_graph_table()
+
+
+class Scenario:
+
+    def __init__(self, name, paths, module, entrypoint, setup, environment=None, reset=None):
+        self.name = name
+        self.paths = paths
+        self.module = module
+        self.entrypoint = entrypoint
+        self.setup = setup
+        self.environment = environment if environment is not None else {}
+        # Called untimed after each call to undo its effect on the fakes
+        self.reset = reset
+
+
+SCENARIOS = [
+    Scenario("add_graph_request", [ REST_DIR ], "add_graph_request", "handler", setup_add_graph_request,
+             reset=clear_graphs),
+    Scenario("add_graph_request.replay", [ REST_DIR ], "add_graph_request", "handler",
+             setup_replayed_add_graph_request),
+    Scenario("add_graph_request.batch", [ REST_DIR ], "add_graph_request", "batch_handler", setup_batch_add_graph_request,
+             reset=clear_graphs),
+    Scenario("get_graph_request.list", [ REST_DIR ], "get_graph_request", "handler", setup_get_graphs_request),
+    Scenario("get_graph_request.list_fields", [ REST_DIR ], "get_graph_request", "handler",
+             setup_get_graphs_fields_request),
+    Scenario("get_graph_request.single", [ REST_DIR ], "get_graph_request", "handler", setup_get_graph_request),
+    Scenario("get_graph_status_request", [ REST_DIR ], "get_graph_status_request", "handler",
+             setup_get_graph_status_request),
+    Scenario("delete_graph_request", [ REST_DIR ], "delete_graph_request", "handler", setup_delete_graph_request),
+    Scenario("add_graph", [ WORKERS_DIR ], "add_graph", "handler", setup_add_graph),
+    Scenario("check_deployment", [ WORKERS_DIR ], "check_deployment", "handler", setup_check_deployment),
+    Scenario("check_deployment.watch", [ WORKERS_DIR ], "check_deployment", "handler", setup_watched_check_deployment),
+    Scenario("check_deployment.removal", [ WORKERS_DIR ], "check_deployment", "handler", setup_removal_check),
+    Scenario("delete_graph", [ WORKERS_DIR ], "delete_graph", "handler", setup_delete_graph),
+    Scenario("delete_graph.namespace", [ WORKERS_DIR ], "delete_graph", "handler", setup_namespaced_delete_graph),
+    Scenario("uninstall_graphs.delete", [ PLATFORM_DIR ], "uninstall_graphs", "delete",
+             setup_uninstall_graphs, reset=redeploy_graphs),
+    Scenario("uninstall_graphs_is_complete", [ PLATFORM_DIR ], "uninstall_graphs_is_complete", "handler",
+             setup_uninstall_graphs_is_complete)
+]
+
+
+def get_scenario(name):
+    for scenario in SCENARIOS:
+        if scenario.name == name:
+            return scenario
+    raise KeyError(name)
@@ -16,16 +16,23 @@
 
 import * as cdk from "@aws-cdk/core";
 import * as sam from "@aws-cdk/aws-sam";
+import * as sqs from "@aws-cdk/aws-sqs";
 import { GraphPlatForm } from "./platform/graph-platform";
 import { GraphUninstaller } from "./platform/graph-uninstaller";
 import { KaiRestApi } from "./rest-api/kai-rest-api";
-import { LAMBDA_LAYER_ARN, LAMBDA_LAYER_VERSION, ADD_GRAPH_TIMEOUT, DELETE_GRAPH_TIMEOUT, DELETE_GRAPH_WORKER_BATCH_SIZE, ADD_GRAPH_WORKER_BATCH_SIZE } from "./constants";
+import { LAMBDA_LAYER_ARN, LAMBDA_LAYER_VERSION, ADD_GRAPH_TIMEOUT, DELETE_GRAPH_TIMEOUT, DELETE_GRAPH_WORKER_BATCH_SIZE, ADD_GRAPH_WORKER_BATCH_SIZE,
+    DEPLOYMENT_READINESS_TIMEOUT, DEPLOYMENT_READINESS_WORKER_BATCH_SIZE } from "./constants";
 import { LayerVersion } from "@aws-cdk/aws-lambda";
 import { GraphDatabase } from "./database/graph-database";
 import { Worker } from "./workers/worker";
 import { KaiUserPool } from "./authentication/user-pool";
 import { GraphDatabaseProps } from "./database/graph-database-props";
+import { MembershipBackfill } from "./database/membership-backfill";
 import { PolicyStatement } from "@aws-cdk/aws-iam";
+import { CommonLayer } from "./common/common-layer";
+import { SchemaStore } from "./database/schema-store";
+import { IdempotencyTable } from "./database/idempotency-table";
+import { ChartLayer } from "./workers/chart-layer";
 
 // The main stack for Kai
 export class AppStack extends cdk.Stack {
@@ -42,11 +49,29 @@ export class AppStack extends cdk.Stack {
         const graphDBProps: GraphDatabaseProps = this.node.tryGetContext("graphDatabaseProps");
         const database = new GraphDatabase(this, "GraphDatabase", graphDBProps);
 
+        // Graph schemas, stored by digest so messages only need to carry the digest
+        const schemaStore = new SchemaStore(this, "SchemaStore");
+
+        // Responses to requests made with an Idempotency-Key, so retries are not processed twice
+        const idempotencyTable = new IdempotencyTable(this, "IdempotencyTable");
+
+        // Python packages shared by every lambda
+        const commonLayer = new CommonLayer(this, "CommonLayer").layer;
+
+        // Membership items for graphs created before graphs were looked up by administrator
+        new MembershipBackfill(this, "MembershipBackfill", {
+            graphTable: database.table,
+            commonLayer: commonLayer
+        });
+
         // REST API
         const kaiRest = new KaiRestApi(this, "KaiRestApi", {
             graphTable: database.table,
+            idempotencyTable: idempotencyTable.table,
             userPoolArn: userPool.userPoolArn,
-            userPoolId: userPool.userPoolId
+            userPoolId: userPool.userPoolId,
+            commonLayer: commonLayer,
+            schemaBucket: schemaStore.bucket
         });
 
         // Kubectl Lambda layer
@@ -78,24 +103,53 @@ export class AppStack extends cdk.Stack {
             ]
         });
 
+        // The pinned Gaffer chart, packaged so graphs can be deployed without pulling it
+        const gafferChartVersion = this.node.tryGetContext("gafferChartVersion");
+        const chartLayer = gafferChartVersion ? new ChartLayer(this, "ChartLayer", { version: gafferChartVersion }).layer : undefined;
+
+        // Checks of whether submitted graphs are ready or deleted graphs are removed, each one is a delayed message
+        const deploymentReadinessQueue = new sqs.Queue(this, "DeploymentReadinessQueue", {
+            visibilityTimeout: DEPLOYMENT_READINESS_TIMEOUT
+        });
+
         // Workers
         new Worker(this, "AddGraphWorker", {
             cluster: platform.eksCluster,
             queue: kaiRest.addGraphQueue,
             kubectlLayer: kubectlLambdaLayer,
+            commonLayer: commonLayer,
             graphTable: database.table,
             handler: "add_graph.handler",
             timeout: ADD_GRAPH_TIMEOUT,
             batchSize: ADD_GRAPH_WORKER_BATCH_SIZE,
             policyStatements: [
                 describeClusterPolicyStatement
-            ]
+            ],
+            schemaBucket: schemaStore.bucket,
+            readinessQueue: deploymentReadinessQueue,
+            chartLayer: chartLayer
+        });
+
+        new Worker(this, "DeploymentReadinessWorker", {
+            cluster: platform.eksCluster,
+            queue: deploymentReadinessQueue,
+            kubectlLayer: kubectlLambdaLayer,
+            commonLayer: commonLayer,
+            graphTable: database.table,
+            handler: "check_deployment.handler",
+            timeout: DEPLOYMENT_READINESS_TIMEOUT,
+            batchSize: DEPLOYMENT_READINESS_WORKER_BATCH_SIZE,
+            policyStatements: [
+                describeClusterPolicyStatement
+            ],
+            readinessQueue: deploymentReadinessQueue
         });
 
         const deleteGraphWorker = new Worker(this, "DeleteGraphWorker", {
             cluster: platform.eksCluster,
             queue: kaiRest.deleteGraphQueue,
             kubectlLayer: kubectlLambdaLayer,
+            commonLayer: commonLayer,
             graphTable: database.table,
             handler: "delete_graph.handler",
             timeout: DELETE_GRAPH_TIMEOUT,
@@ -103,21 +157,21 @@ export class AppStack extends cdk.Stack {
             policyStatements: [
                 describeClusterPolicyStatement,
                 manageVolumesPolicyStatement
-            ]
+            ],
+            readinessQueue: deploymentReadinessQueue
         });
 
         // Graph uninstaller
         new GraphUninstaller(this, "GraphUninstaller", {
-            getGraphsFunctionArn: kaiRest.getGraphsLambda.functionArn,
-            deleteGraphFunctionArn: kaiRest.deleteGraphLambda.functionArn,
+            graphTable: database.table,
+            deleteGraphQueue: kaiRest.deleteGraphQueue,
             kubectlLayer: kubectlLambdaLayer,
-            timeout: cdk.Duration.seconds(30),
+            commonLayer: commonLayer,
+            timeout: cdk.Duration.minutes(2),
             dependencies: [
                 platform,
                 database,
                 deleteGraphWorker,
-                kaiRest.getGraphsLambda,
-                kaiRest.deleteGraphLambda,
                 kaiRest.deleteGraphQueue
             ]
         });
@@ -0,0 +1,41 @@
+/*
+ * Copyright 2020 Crown Copyright
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+
+import * as cdk from "@aws-cdk/core";
+import * as lambda from "@aws-cdk/aws-lambda";
+import * as path from "path";
+
+/**
+ * A Lambda layer containing the Python packages shared by the REST API, worker and platform lambdas.
+ */
+export class CommonLayer extends cdk.Construct {
+    private readonly _layer: lambda.LayerVersion;
+
+    constructor(scope: cdk.Construct, id: string) {
+        super(scope, id);
+
+        this._layer = new lambda.LayerVersion(this, "CommonLayerVersion", {
+            code: new lambda.AssetCode(path.join(__dirname, "layer")),
+            compatibleRuntimes: [ lambda.Runtime.PYTHON_3_7 ],
+            description: "Python packages shared by the Kai lambdas"
+        });
+    }
+
+    public get layer(): lambda.ILayerVersion {
+        return this._layer;
+    }
+}
@@ -0,0 +1,117 @@
+import boto3
+import metrics
+import os
+import threading
+from botocore.config import Config
+
+# Connections are kept alive in the client's pool between invocations, so a
+# warm container only pays for the TLS handshake once per endpoint.
+config_options = {
+    "max_pool_connections": int(os.getenv("aws_max_pool_connections", "20")),
+    "connect_timeout": 5,
+    "retries": {
+        "max_attempts": 2, # retries on top of the initial attempt
+        "mode": "standard"
+    }
+}
+# TCP keep alive is only supported by newer versions of botocore
+if "tcp_keepalive" in Config.OPTION_DEFAULTS:
+    config_options["tcp_keepalive"] = True
+
+default_config = Config(**config_options)
+
+
+class ClientRegistry:
+    """
+    Lazily creates AWS clients and resources once per process so they can be
+    reused by every invocation of a warm Lambda. Clients are thread safe and
+    shared, whereas resources are not so are created once per thread. A
+    resource is only reused if its thread outlives the invocation, so
+    resources must only be used from the main thread or from threads which
+    live as long as the container, such as those of batch.get_executor.
+    Short lived threads should use a client instead.
+    """
+
+    def __init__(self, config=default_config):
+        self.config = config
+        self.__lock = threading.Lock()
+        self.__session = None
+        self.__clients = {}
+        self.__local = threading.local()
+        self.__clients_created = 0
+        self.__resources_created = 0
+
+    def client(self, service_name):
+        """
+        Gets the shared client for a service, creating it on first use
+        """
+        client = self.__clients.get(service_name)
+        if client is None:
+            with self.__lock:
+                client = self.__clients.get(service_name)
+                if client is None:
+                    client = self.__get_session().client(service_name, config=self.config)
+                    self.__clients[service_name] = client
+                    self.__clients_created += 1
+        return client
+
+    def resource(self, service_name):
+        """
+        Gets the calling thread's resource for a service, creating it on first
+        use. Each new thread creates its own, so call this only from threads
+        which are reused between invocations.
+        """
+        resources = getattr(self.__local, "resources", None)
+        if resources is None:
+            resources = self.__local.resources = {}
+        resource = resources.get(service_name)
+        if resource is None:
+            # Sessions are not thread safe so resources are created under the lock
+            with self.__lock:
+                resource = self.__get_session().resource(service_name, config=self.config)
+                self.__resources_created += 1
+            resources[service_name] = resource
+        return resource
+
+    def credentials(self):
+        """
+        Gets the credentials of the shared session, for signing requests
+        which are not made through a client
+        """
+        with self.__lock:
+            return self.__get_session().get_credentials()
+
+    def stats(self):
+        """
+        Returns how many clients and resources this process has created
+        """
+        with self.__lock:
+            return {
+                "clientsCreated": self.__clients_created,
+                "resourcesCreated": self.__resources_created
+            }
+
+    def __get_session(self):
+        if self.__session is None:
+            self.__session = boto3.session.Session()
+            metrics.track_consumed_capacity(self.__session.events)
+        return self.__session
+
+
+registry = ClientRegistry()
+
+
+def client(service_name):
+    return registry.client(service_name)
+
+
+def resource(service_name):
+    return registry.resource(service_name)
+
+
+def credentials():
+    return registry.credentials()
+
+
+def stats():
+    return registry.stats()
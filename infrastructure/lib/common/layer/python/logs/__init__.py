@@ -0,0 +1,109 @@
+import json
+import logging
+import os
+import random
+
+# Every string logged, including the message itself, is cut down to this many
+# characters so that the cost of logging does not grow with the size of a
+# schema or of a batch of messages
+MAX_FIELD_LENGTH = int(os.getenv("log_max_field_length", "1024"))
+# The fraction of debug records which are logged, so debug logging can be
+# left on for busy lambdas
+DEBUG_SAMPLE_RATE = float(os.getenv("log_debug_sample_rate", "1"))
+LOG_LEVEL = os.getenv("log_level", "INFO")
+
+
+def truncate(value, limit=MAX_FIELD_LENGTH):
+    """
+    Returns a copy of a value made up of dicts, lists and strings in which
+    every string longer than the limit has been cut down to it
+    """
+    if isinstance(value, str):
+        if len(value) <= limit:
+            return value
+        return "{}...({} more characters)".format(value[:limit], len(value) - limit)
+    if isinstance(value, dict):
+        return { key: truncate(item, limit) for key, item in value.items() }
+    if isinstance(value, (list, tuple)):
+        return [ truncate(item, limit) for item in value ]
+    return value
+
+
+class Truncated:
+    """
+    Wraps a value to be logged as JSON with every string in it truncated.
+    The work is only done if the record is emitted, so it is free to pass one
+    to a debug record which is filtered out.
+    """
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value, limit=MAX_FIELD_LENGTH):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self):
+        return json.dumps(truncate(self.value, self.limit), default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Lets through every record at INFO and above but only a fraction of
+    debug records
+    """
+
+    def __init__(self, rate=DEBUG_SAMPLE_RATE):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or self.rate >= 1 or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats each record as a single line of JSON. Only a fixed set of record
+    attributes are read and the message is never parsed, so formatting costs
+    the same whatever is logged. Fields passed with extra={"fields": {...}}
+    are added to the line, truncated like the message.
+    """
+
+    def __init__(self, limit=MAX_FIELD_LENGTH):
+        super().__init__()
+        self.limit = limit
+
+    def format(self, record):
+        entry = {
+            "timestamp": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": truncate(record.getMessage(), self.limit)
+        }
+        # Added by the Lambda runtime's handler
+        request_id = getattr(record, "aws_request_id", None)
+        if request_id is not None:
+            entry["requestId"] = request_id
+        fields = getattr(record, "fields", None)
+        if fields is not None:
+            entry.update(truncate(fields, self.limit))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+def setup(level=LOG_LEVEL, sample_rate=DEBUG_SAMPLE_RATE):
+    """
+    Sets the level of the root logger and has the handlers the Lambda runtime
+    installs on it sample debug records and write JSON. Handlers are left
+    alone when running outside Lambda. Safe to call more than once.
+    """
+    logging.root.setLevel(level)
+    for handler in logging.root.handlers:
+        handler.setFormatter(JsonFormatter())
+        for existing in [ f for f in handler.filters if isinstance(f, SamplingFilter) ]:
+            handler.removeFilter(existing)
+        handler.addFilter(SamplingFilter(sample_rate))
+    # Logs from the AWS SDK are only wanted when debugging it
+    for name in ("boto3", "botocore", "urllib3"):
+        logging.getLogger(name).setLevel(max(logging.root.level, logging.WARNING))
@@ -0,0 +1,202 @@
+import functools
+import json
+import os
+import threading
+import time
+
+# Timings are written as CloudWatch Embedded Metric Format records, which
+# CloudWatch Logs turns into metrics without any calls to the CloudWatch API
+NAMESPACE = os.getenv("metrics_namespace", "Kai")
+ENABLED = os.getenv("metrics_enabled", "true").lower() == "true"
+# The code flag of generator functions, checked directly as importing inspect
+# for it would add several milliseconds to every cold start
+CO_GENERATOR = 0x20
+
+
+class StdoutSink:
+    """
+    Writes each record on a line of its own to standard output, from where
+    the Lambda runtime sends it to CloudWatch Logs
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+
+    def emit(self, record):
+        line = json.dumps(record, default=str)
+        with self.__lock:
+            print(line, flush=True)
+
+
+class MemorySink:
+    """
+    Keeps every record in memory, so tests can check what was measured
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+sink = StdoutSink() if ENABLED else None
+
+# The phases open on each thread, innermost last
+_local = threading.local()
+
+
+def set_sink(new_sink):
+    """
+    Sends records to another sink, or nowhere if None, returning the
+    previous sink so it can be restored
+    """
+    global sink
+    previous = sink
+    sink = new_sink
+    return previous
+
+
+def current_phase():
+    """
+    Gets the innermost phase open on the calling thread, or None
+    """
+    phases = getattr(_local, "phases", None)
+    return phases[-1] if phases else None
+
+
+class Phase:
+    """
+    Times a phase of work, either as a context manager or as a decorator,
+    and emits its duration along with any other metrics recorded while it
+    was open. A decorated function is timed as a new phase on every call.
+    """
+
+    def __init__(self, name, **dimensions):
+        self.name = name
+        self.dimensions = dimensions
+        self.metrics = {}
+        self.properties = {}
+        self.__started = None
+
+    def put_metric(self, name, value, unit="Count"):
+        self.metrics[name] = (value, unit)
+
+    def add_metric(self, name, value, unit="Count"):
+        """
+        Adds to a metric, such as the capacity consumed by each of several calls
+        """
+        total = self.metrics.get(name, (0, unit))[0]
+        self.metrics[name] = (total + value, unit)
+
+    def set_property(self, name, value):
+        """
+        Records a value which is searchable in the logs but is not a metric
+        """
+        self.properties[name] = value
+
+    def __enter__(self):
+        phases = getattr(_local, "phases", None)
+        if phases is None:
+            phases = _local.phases = []
+        phases.append(self)
+        self.__started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = (time.perf_counter() - self.__started) * 1000
+        _local.phases.remove(self)
+        self.put_metric("Duration", duration, "Milliseconds")
+        if "Failed" not in self.metrics:
+            self.put_metric("Failed", 0 if exc_type is None else 1)
+        if sink is not None:
+            sink.emit(self.to_record())
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def timed_func(*args, **kwargs):
+            with Phase(self.name, **self.dimensions):
+                return func(*args, **kwargs)
+        return timed_func
+
+    def to_record(self):
+        """
+        Creates the Embedded Metric Format record of the phase
+        """
+        record = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": NAMESPACE,
+                        "Dimensions": [ [ "Phase", *self.dimensions ] ],
+                        "Metrics": [ { "Name": name, "Unit": unit } for name, (value, unit) in self.metrics.items() ]
+                    }
+                ]
+            },
+            "Phase": self.name
+        }
+        record.update(self.dimensions)
+        record.update(self.properties)
+        record.update((name, value) for name, (value, unit) in self.metrics.items())
+        return record
+
+
+def timed(name, **dimensions):
+    """
+    Times a phase, for example with metrics.timed("helm install") as phase:
+    or as a decorator with @metrics.timed("add_graph.handler")
+    """
+    return Phase(name, **dimensions)
+
+
+def untimed(func):
+    """
+    Marks a method which timed_methods should leave alone, such as a helper
+    so cheap that timing it would cost more than it does
+    """
+    func._untimed = True
+    return func
+
+
+def timed_methods(cls):
+    """
+    A class decorator which times every public method of a class as a phase
+    named after the class and the method. Methods marked as untimed are
+    skipped, as are generators, which return before any of their work is done.
+    Static methods, class methods and properties are left alone as wrapping
+    them as functions would lose their descriptors.
+    """
+    for attribute, value in list(vars(cls).items()):
+        if attribute.startswith("_") or isinstance(value, (staticmethod, classmethod, property)) or not callable(value):
+            continue
+        if getattr(value, "_untimed", False) or getattr(value, "__code__", None) is not None and value.__code__.co_flags & CO_GENERATOR:
+            continue
+        setattr(cls, attribute, timed("{}.{}".format(cls.__name__, attribute))(value))
+    return cls
+
+
+def track_consumed_capacity(events):
+    """
+    Has the DynamoDB calls made through a session report the capacity they
+    consume, adding it to whichever phase is open when they are made
+    """
+    events.register("before-parameter-build.dynamodb", _request_consumed_capacity)
+    events.register("after-call.dynamodb", _record_consumed_capacity)
+
+
+def _request_consumed_capacity(params, model, **kwargs):
+    if current_phase() is not None and "ReturnConsumedCapacity" in model.input_shape.members:
+        params.setdefault("ReturnConsumedCapacity", "TOTAL")
+
+
+def _record_consumed_capacity(parsed, **kwargs):
+    phase = current_phase()
+    consumed = parsed.get("ConsumedCapacity")
+    if phase is None or consumed is None:
+        return
+    # Batch and transaction calls report the capacity of each table
+    if isinstance(consumed, dict):
+        consumed = [ consumed ]
+    phase.add_metric("ConsumedCapacity", sum(c.get("CapacityUnits", 0) for c in consumed))
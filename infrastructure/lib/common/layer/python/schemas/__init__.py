@@ -0,0 +1,171 @@
+import abc
+import clients
+import hashlib
+import json
+import os
+import tempfile
+from botocore.exceptions import ClientError
+
+DIGEST_ALGORITHM = "sha256"
+
+
+class SchemaNotFound(Exception):
+    pass
+
+
+def to_canonical_json(schema):
+    """
+    Serialises a schema so that equal schemas always produce the same bytes
+    """
+    return json.dumps(schema, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def compute_digest(content):
+    return DIGEST_ALGORITHM + ":" + hashlib.sha256(content).hexdigest()
+
+
+class SchemaStore(abc.ABC):
+    """
+    A content addressed store of Gaffer schemas. Schemas are stored once under
+    the digest of their canonical JSON, so graphs sharing a schema share the
+    stored copy and only the digest needs to be passed around. Stored schemas
+    never change so they are cached in memory once read.
+    """
+
+    def __init__(self, cache_size=32):
+        self.cache_size = cache_size
+        self.__cache = {}
+        self.__stored = set()
+
+    def put(self, schema):
+        """
+        Stores a schema if it is not already stored and returns its digest
+        """
+        content = to_canonical_json(schema)
+        digest = compute_digest(content)
+        if digest not in self.__stored:
+            if not self.contains(digest):
+                self.write(digest, content)
+            self.__stored.add(digest)
+        return digest
+
+    def get(self, digest):
+        """
+        Gets the schema stored under a digest, checking it has not been altered
+        """
+        schema = self.__cache.get(digest)
+        if schema is not None:
+            return schema
+
+        content = self.read(digest)
+        if compute_digest(content) != digest:
+            raise ValueError("Stored schema does not match its digest: {}".format(digest))
+        schema = json.loads(content.decode("utf-8"))
+
+        if len(self.__cache) >= self.cache_size:
+            self.__cache.pop(next(iter(self.__cache)))
+        self.__cache[digest] = schema
+        return schema
+
+    def to_key(self, digest):
+        algorithm, _, value = digest.partition(":")
+        if algorithm != DIGEST_ALGORITHM or len(value) != 64 or any(c not in "0123456789abcdef" for c in value):
+            raise SchemaNotFound(digest)
+        return "schemas/{}/{}.json".format(algorithm, value)
+
+    @abc.abstractmethod
+    def contains(self, digest):
+        pass
+
+    @abc.abstractmethod
+    def read(self, digest):
+        pass
+
+    @abc.abstractmethod
+    def write(self, digest, content):
+        pass
+
+
+class S3SchemaStore(SchemaStore):
+    """
+    Stores schemas as objects in an S3 bucket
+    """
+
+    def __init__(self, bucket_name, **kwargs):
+        super().__init__(**kwargs)
+        self.bucket_name = bucket_name
+
+    @property
+    def s3(self):
+        return clients.client("s3")
+
+    def contains(self, digest):
+        try:
+            self.s3.head_object(Bucket=self.bucket_name, Key=self.to_key(digest))
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def read(self, digest):
+        try:
+            response = self.s3.get_object(Bucket=self.bucket_name, Key=self.to_key(digest))
+        except self.s3.exceptions.NoSuchKey:
+            raise SchemaNotFound(digest)
+        return response["Body"].read()
+
+    def write(self, digest, content):
+        self.s3.put_object(
+            Bucket=self.bucket_name,
+            Key=self.to_key(digest),
+            Body=content,
+            ContentType="application/json"
+        )
+
+
+class LocalSchemaStore(SchemaStore):
+    """
+    Stores schemas as files in a local directory, standing in for S3 when
+    running away from AWS
+    """
+
+    def __init__(self, directory, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory
+
+    def __to_path(self, digest):
+        return os.path.join(self.directory, *self.to_key(digest).split("/"))
+
+    def contains(self, digest):
+        return os.path.exists(self.__to_path(digest))
+
+    def read(self, digest):
+        try:
+            with open(self.__to_path(digest), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            raise SchemaNotFound(digest)
+
+    def write(self, digest, content):
+        path = self.__to_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a temporary name first so a schema is never read half written
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(temp_path, path)
+
+
+def from_environment():
+    """
+    Creates the schema store configured for this lambda. The schema_bucket_name
+    variable selects S3, otherwise schema_store_directory selects a local directory.
+    """
+    bucket_name = os.getenv("schema_bucket_name")
+    if bucket_name is not None:
+        return S3SchemaStore(bucket_name)
+    directory = os.getenv("schema_store_directory")
+    if directory is not None:
+        return LocalSchemaStore(directory)
+    raise ValueError("Neither schema_bucket_name nor schema_store_directory is set")
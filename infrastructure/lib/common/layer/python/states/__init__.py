@@ -0,0 +1,63 @@
+# The states a graph can be in and the transitions allowed between them. Both
+# the REST API and the workers change a graph's state only through these
+# transitions, each one a single conditional write on the state it moves from.
+
+DEPLOYMENT_QUEUED = "DEPLOYMENT_QUEUED"
+DEPLOYMENT_IN_PROGRESS = "DEPLOYMENT_IN_PROGRESS"
+DEPLOYED = "DEPLOYED"
+DEPLOYMENT_FAILED = "DEPLOYMENT_FAILED"
+DELETION_QUEUED = "DELETION_QUEUED"
+DELETION_IN_PROGRESS = "DELETION_IN_PROGRESS"
+DELETION_FAILED = "DELETION_FAILED"
+
+STATES = (
+    DEPLOYMENT_QUEUED,
+    DEPLOYMENT_IN_PROGRESS,
+    DEPLOYED,
+    DEPLOYMENT_FAILED,
+    DELETION_QUEUED,
+    DELETION_IN_PROGRESS,
+    DELETION_FAILED
+)
+
+# States after which a graph will not change again without another request
+TERMINAL_STATES = (DEPLOYED, DEPLOYMENT_FAILED, DELETION_FAILED)
+
+# The states a graph may move to from each state. Graphs are created as
+# DEPLOYMENT_QUEUED and removed once their deletion succeeds.
+TRANSITIONS = {
+    DEPLOYMENT_QUEUED: (DEPLOYMENT_IN_PROGRESS, DELETION_QUEUED),
+    DEPLOYMENT_IN_PROGRESS: (DEPLOYED, DEPLOYMENT_FAILED, DELETION_QUEUED),
+    DEPLOYED: (DELETION_QUEUED,),
+    DEPLOYMENT_FAILED: (DELETION_QUEUED,),
+    DELETION_QUEUED: (DELETION_IN_PROGRESS,),
+    DELETION_IN_PROGRESS: (DELETION_FAILED,),
+    DELETION_FAILED: (DELETION_QUEUED,)
+}
+
+
+class InvalidTransition(Exception):
+
+    def __init__(self, from_state, to_state):
+        super().__init__("A graph cannot move from {} to {}".format(from_state, to_state))
+        self.from_state = from_state
+        self.to_state = to_state
+
+
+def can_transition(from_state, to_state):
+    return to_state in TRANSITIONS.get(from_state, ())
+
+
+def check_transition(from_state, to_state):
+    """
+    Raises InvalidTransition unless a graph may move between the given states
+    """
+    if not can_transition(from_state, to_state):
+        raise InvalidTransition(from_state, to_state)
+
+
+def get_sources(to_state):
+    """
+    Gets the states a graph may move to the given state from
+    """
+    return tuple(state for state in STATES if can_transition(state, to_state))
@@ -22,9 +22,26 @@ export const LAMBDA_LAYER_VERSION = "2.0.0-beta3";
 // worker batch size
 export const ADD_GRAPH_WORKER_BATCH_SIZE = 3; // can only be one of 3, 2, or 1 as Max timeout for visibility is 15 minutes
 export const DELETE_GRAPH_WORKER_BATCH_SIZE = 5; // can go up to 7
+export const DEPLOYMENT_READINESS_WORKER_BATCH_SIZE = 10;
 // timeouts
-const TIMEOUT_FOR_ADDING_GRAPH_IN_MINUTES = 5; // how long it should take for one graph to be added
+const TIMEOUT_FOR_ADDING_GRAPH_IN_MINUTES = 2; // how long it should take for one graph's chart to be installed
 const TIMEOUT_FOR_DELETING_GRAPH_IN_MINUTES = 2; // how long it should take for one graph to be deleted
 
 export const DELETE_GRAPH_TIMEOUT = Duration.minutes(TIMEOUT_FOR_DELETING_GRAPH_IN_MINUTES * DELETE_GRAPH_WORKER_BATCH_SIZE);
 export const ADD_GRAPH_TIMEOUT = Duration.minutes(TIMEOUT_FOR_ADDING_GRAPH_IN_MINUTES * ADD_GRAPH_WORKER_BATCH_SIZE);
+export const DEPLOYMENT_READINESS_TIMEOUT = Duration.minutes(1); // how long one batch of readiness checks may take
+
+// deployment readiness
+export const DEPLOYMENT_READINESS_POLL_INTERVAL = Duration.seconds(30); // how long to wait between checks of a graph, at most 15 minutes
+export const DEPLOYMENT_READINESS_DEADLINE = Duration.minutes(20); // how long a graph may take to become ready after its chart is installed
+export const DEPLOYMENT_READINESS_WATCH_DURATION = Duration.seconds(40); // how long each check watches a graph for, must leave time within DEPLOYMENT_READINESS_TIMEOUT
+
+// rest api
+export const REST_API_MINIMUM_COMPRESSION_SIZE = 1024; // bytes, larger responses are gzipped for clients which accept it
+
+// graph table
+export const GRAPH_ADMINISTRATOR_INDEX_NAME = "administratorIndex"; // sparse index over the administrator membership items
+export const GRAPH_STATE_INDEX_NAME = "stateIndex"; // sparse index over the graphs by their current state
+
+// Helm chart
+export const GAFFER_CHART_REPO = "https://gchq.github.io/gaffer-docker";
@@ -17,6 +17,7 @@
 import * as cdk from "@aws-cdk/core";
 import * as dynamo from "@aws-cdk/aws-dynamodb";
 import { GraphDatabaseProps } from "./graph-database-props";
+import { GRAPH_ADMINISTRATOR_INDEX_NAME, GRAPH_STATE_INDEX_NAME } from "../constants";
 
 /**
  * The underlying database for Graphs.
@@ -32,9 +33,29 @@ export class GraphDatabase extends cdk.Construct {
         this._table = new dynamo.Table(this, "GraphDynamoTable", {
             partitionKey: { name: "releaseName", type: dynamo.AttributeType.STRING },
             billingMode: dynamo.BillingMode.PROVISIONED,
+            // Status requests wait on changes to the graph's state rather than reading it repeatedly
+            stream: dynamo.StreamViewType.NEW_IMAGE,
             removalPolicy: cdk.RemovalPolicy.DESTROY
         });
 
+        // Administrator index, only membership items carry an administrator so the index stays sparse
+
+        this._table.addGlobalSecondaryIndex({
+            indexName: GRAPH_ADMINISTRATOR_INDEX_NAME,
+            partitionKey: { name: "administrator", type: dynamo.AttributeType.STRING },
+            sortKey: { name: "graphReleaseName", type: dynamo.AttributeType.STRING },
+            projectionType: dynamo.ProjectionType.KEYS_ONLY
+        });
+
+        // State index, only graphs carry a state so the graphs in each state can be counted without reading the rest of the table
+
+        this._table.addGlobalSecondaryIndex({
+            indexName: GRAPH_STATE_INDEX_NAME,
+            partitionKey: { name: "currentState", type: dynamo.AttributeType.STRING },
+            sortKey: { name: "releaseName", type: dynamo.AttributeType.STRING },
+            projectionType: dynamo.ProjectionType.KEYS_ONLY
+        });
+
         // Autoscaling
 
         const scalingProps: dynamo.EnableScalingProps = {
@@ -52,6 +73,13 @@ export class GraphDatabase extends cdk.Construct {
         const writeScaling = this._table.autoScaleWriteCapacity(scalingProps);
         writeScaling.scaleOnUtilization(utilisationProps);
 
+        for (const indexName of [ GRAPH_ADMINISTRATOR_INDEX_NAME, GRAPH_STATE_INDEX_NAME ]) {
+            const indexReadScaling = this._table.autoScaleGlobalSecondaryIndexReadCapacity(indexName, scalingProps);
+            indexReadScaling.scaleOnUtilization(utilisationProps);
+
+            const indexWriteScaling = this._table.autoScaleGlobalSecondaryIndexWriteCapacity(indexName, scalingProps);
+            indexWriteScaling.scaleOnUtilization(utilisationProps);
+        }
     }
 
     public get table(): dynamo.Table {
@@ -0,0 +1,43 @@
+/*
+ * Copyright 2020 Crown Copyright
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+
+import * as cdk from "@aws-cdk/core";
+import * as dynamo from "@aws-cdk/aws-dynamodb";
+
+/**
+ * Records the responses to requests made with an Idempotency-Key header so
+ * retried requests can be answered without being processed again.
+ */
+export class IdempotencyTable extends cdk.Construct {
+    private readonly _table: dynamo.Table;
+
+    constructor(scope: cdk.Construct, id: string) {
+        super(scope, id);
+
+        // Records are only read when a request is retried so on demand billing is cheaper than provisioning
+        this._table = new dynamo.Table(this, "IdempotencyDynamoTable", {
+            partitionKey: { name: "idempotencyKey", type: dynamo.AttributeType.STRING },
+            billingMode: dynamo.BillingMode.PAY_PER_REQUEST,
+            timeToLiveAttribute: "expiresAt",
+            removalPolicy: cdk.RemovalPolicy.DESTROY
+        });
+    }
+
+    public get table(): dynamo.Table {
+        return this._table;
+    }
+}
@@ -0,0 +1,51 @@
+import clients
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+graph_table_name = os.getenv("graph_table_name")
+
+# Separates the release name from the administrator in membership item keys
+MEMBERSHIP_SEPARATOR = "#"
+
+
+def backfill():
+    """
+    Writes a membership item for each administrator of every graph, reading
+    the table a page at a time. Returns the number of items written.
+    """
+    table = clients.resource("dynamodb").Table(graph_table_name)
+    kwargs = {
+        "ProjectionExpression": "releaseName, administrators",
+        "FilterExpression": "attribute_exists(graphName)"
+    }
+    written = 0
+    with table.batch_writer() as batch:
+        while True:
+            response = table.scan(**kwargs)
+            for graph in response["Items"]:
+                for administrator in graph.get("administrators", []):
+                    batch.put_item(Item={
+                        "releaseName": graph["releaseName"] + MEMBERSHIP_SEPARATOR + administrator,
+                        "administrator": administrator,
+                        "graphReleaseName": graph["releaseName"]
+                    })
+                    written += 1
+            if response.get("LastEvaluatedKey") is None:
+                return written
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def handler(event, context):
+    """
+    Backfills the membership items when the custom resource is created or
+    updated. There is nothing to undo when it is deleted.
+    """
+    logger.info("Got %s", event["RequestType"])
+    if event["RequestType"] in ("Create", "Update"):
+        logger.info("Wrote %d membership items", backfill())
+    return {
+        "PhysicalResourceId": "MembershipBackfill"
+    }
@@ -0,0 +1,55 @@
+/*
+ * Copyright 2020 Crown Copyright
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+import * as path from "path";
+import { Construct, CustomResource, Duration } from "@aws-cdk/core";
+import { Function, Runtime, AssetCode } from "@aws-cdk/aws-lambda";
+import { Provider } from "@aws-cdk/custom-resources";
+import { MembershipBackfillProps } from "./membership-backfill-props";
+
+/**
+ * Writes the administrator membership items of graphs created before graphs
+ * were looked up by administrator, so users still see the graphs they
+ * administer after upgrading. Existing items are rewritten unchanged, so it
+ * is safe to run against any table.
+ */
+export class MembershipBackfill extends Construct {
+
+    constructor(scope: Construct, id: string, props: MembershipBackfillProps) {
+        super(scope, id);
+
+        const backfillLambda = new Function(this, "BackfillMembershipsLambda", {
+            runtime: Runtime.PYTHON_3_7,
+            code: new AssetCode(path.join(__dirname, "lambdas")),
+            handler: "backfill_memberships.handler",
+            layers: [ props.commonLayer ],
+            timeout: Duration.minutes(15),
+            environment: {
+                "graph_table_name": props.graphTable.tableName
+            }
+        });
+
+        props.graphTable.grantReadWriteData(backfillLambda);
+
+        const provider = new Provider(this, "BackfillMembershipsProvider", {
+            onEventHandler: backfillLambda
+        });
+
+        new CustomResource(this, "BackfillMembershipsCustomResource", {
+            serviceToken: provider.serviceToken
+        });
+    }
+}
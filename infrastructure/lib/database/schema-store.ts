@@ -0,0 +1,42 @@
+/*
+ * Copyright 2020 Crown Copyright
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+
+import * as cdk from "@aws-cdk/core";
+import * as s3 from "@aws-cdk/aws-s3";
+
+/**
+ * Content addressed storage for the schemas of graphs. Schemas are kept
+ * under the digest of their contents so graphs sharing a schema share a copy.
+ */
+export class SchemaStore extends cdk.Construct {
+    private readonly _bucket: s3.Bucket;
+
+    constructor(scope: cdk.Construct, id: string) {
+        super(scope, id);
+
+        // Schemas are retained as CloudFormation cannot delete a bucket which still has objects in it
+        this._bucket = new s3.Bucket(this, "SchemaBucket", {
+            encryption: s3.BucketEncryption.S3_MANAGED,
+            blockPublicAccess: s3.BlockPublicAccess.BLOCK_ALL,
+            removalPolicy: cdk.RemovalPolicy.RETAIN
+        });
+    }
+
+    public get bucket(): s3.Bucket {
+        return this._bucket;
+    }
+}
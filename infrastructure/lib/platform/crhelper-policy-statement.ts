@@ -24,6 +24,7 @@ export const crhelperPolicyStatement: PolicyStatement = new PolicyStatement({
         "events:PutRule",
         "events:DeleteRule",
         "events:PutTargets",
-        "events:RemoveTargets"
+        "events:RemoveTargets",
+        "logs:FilterLogEvents"
     ]
 });
@@ -16,11 +16,14 @@
 
 import { Duration, IConstruct } from "@aws-cdk/core";
 import { ILayerVersion } from "@aws-cdk/aws-lambda";
+import { Table } from "@aws-cdk/aws-dynamodb";
+import { Queue } from "@aws-cdk/aws-sqs";
 
 export interface GraphUninstallerProps {
-    getGraphsFunctionArn: string;
-    deleteGraphFunctionArn: string;
+    graphTable: Table;
+    deleteGraphQueue: Queue;
     kubectlLayer: ILayerVersion;
+    commonLayer: ILayerVersion;
     timeout: Duration;
     dependencies: IConstruct[];
 }
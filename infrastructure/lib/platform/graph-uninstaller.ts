@@ -18,9 +18,9 @@ import * as path from "path";
 import { Construct, CustomResource } from "@aws-cdk/core";
 import { GraphUninstallerProps } from "./graph-uninstaller-props";
 import { Function, Runtime, AssetCode } from "@aws-cdk/aws-lambda";
-import { PolicyStatement } from "@aws-cdk/aws-iam";
 import { Provider } from "@aws-cdk/custom-resources";
 import { crhelperPolicyStatement } from "./crhelper-policy-statement";
+import { GRAPH_STATE_INDEX_NAME } from "../constants";
 
 export class GraphUninstaller extends Construct {
 
@@ -35,52 +35,37 @@ export class GraphUninstaller extends Construct {
             runtime: Runtime.PYTHON_3_7,
             code: new AssetCode(path.join(__dirname, "lambdas")),
             handler: "uninstall_graphs.handler",
-            layers: [ props.kubectlLayer ],
+            layers: [ props.kubectlLayer, props.commonLayer ],
             timeout: props.timeout,
             environment: {
-                "get_graphs_function_arn": props.getGraphsFunctionArn,
-                "delete_graph_function_arn": props.deleteGraphFunctionArn
+                "graph_table_name": props.graphTable.tableName,
+                "graph_state_index_name": GRAPH_STATE_INDEX_NAME,
+                "delete_graph_queue_url": props.deleteGraphQueue.queueUrl
             }
         });
 
-        const lambdaInvokeGetGraphsPolicyStatement: PolicyStatement = new PolicyStatement({
-            resources: [
-                props.getGraphsFunctionArn
-            ],
-            actions: [
-                "lambda:InvokeFunction"
-            ]
-        });
-
-        const lambdaInvokeDeleteGraphPolicyStatement: PolicyStatement = new PolicyStatement({
-            resources: [
-                props.deleteGraphFunctionArn
-            ],
-            actions: [
-                "lambda:InvokeFunction"
-            ]
-        });
+        // Graphs are read and queued for deletion directly rather than through the REST API
+        props.graphTable.grantReadWriteData(uninstallGraphsLambda);
+        props.deleteGraphQueue.grantSendMessages(uninstallGraphsLambda);
 
         if (uninstallGraphsLambda.role) {
             uninstallGraphsLambda.role.addToPolicy(crhelperPolicyStatement);
-            uninstallGraphsLambda.role.addToPolicy(lambdaInvokeGetGraphsPolicyStatement);
-            uninstallGraphsLambda.role.addToPolicy(lambdaInvokeDeleteGraphPolicyStatement);
         }
 
         const uninstallGraphsIsCompleteLambda = new Function(this, "UninstallGraphsIsCompleteLambda", {
             runtime: Runtime.PYTHON_3_7,
             code: new AssetCode(path.join(__dirname, "lambdas")),
             handler: "uninstall_graphs_is_complete.handler",
-            layers: [ props.kubectlLayer ],
+            layers: [ props.kubectlLayer, props.commonLayer ],
             timeout: props.timeout,
             environment: {
-                "get_graphs_function_arn": props.getGraphsFunctionArn
+                "graph_table_name": props.graphTable.tableName,
+                "graph_state_index_name": GRAPH_STATE_INDEX_NAME
             }
         });
 
-        if (uninstallGraphsIsCompleteLambda.role) {
-            uninstallGraphsIsCompleteLambda.role.addToPolicy(lambdaInvokeGetGraphsPolicyStatement);
-        }
+        // Completion is checked by counting the graphs left in the state index
+        props.graphTable.grantReadData(uninstallGraphsIsCompleteLambda);
 
         const uninstallGraphsCustomResourceProvider = new Provider(this, "UninstallGraphsCustomResourceProvider", {
             onEventHandler: uninstallGraphsLambda,
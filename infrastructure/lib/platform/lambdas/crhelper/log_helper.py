@@ -1,6 +1,11 @@
 from __future__ import print_function
+import abc
 import json
 import logging
+import sys
+import time
+
+logger = logging.getLogger(__name__)
 
 
 def _json_formatter(obj):
@@ -8,6 +13,20 @@ def _json_formatter(obj):
     return str(obj)
 
 
+class _RecordView(object):
+    """Reads the attributes of a record as the format strings ask for them,
+    rather than copying every one."""
+
+    def __init__(self, record, asctime):
+        self._record = record
+        self._asctime = asctime
+
+    def __getitem__(self, key):
+        if key == 'asctime':
+            return self._asctime
+        return getattr(self._record, key)
+
+
 class JsonFormatter(logging.Formatter):
     """AWS Lambda Logging formatter.
 
@@ -28,8 +47,7 @@ class JsonFormatter(logging.Formatter):
             'json_default', _json_formatter)
 
     def format(self, record):
-        record_dict = record.__dict__.copy()
-        record_dict['asctime'] = self.formatTime(record)
+        record_dict = _RecordView(record, self.formatTime(record))
 
         log_dict = {
             k: v % record_dict
@@ -37,17 +55,19 @@ class JsonFormatter(logging.Formatter):
             if v
         }
 
-        if isinstance(record_dict['msg'], dict):
-            log_dict['message'] = record_dict['msg']
+        if isinstance(record.msg, dict):
+            log_dict['message'] = record.msg
         else:
             log_dict['message'] = record.getMessage()
 
             # Attempt to decode the message as JSON, if so, merge it with the
-            # overall message for clarity.
-            try:
-                log_dict['message'] = json.loads(log_dict['message'])
-            except (TypeError, ValueError):
-                pass
+            # overall message for clarity. Only messages which could be a JSON
+            # object or array are parsed.
+            if log_dict['message'][:1] in ('{', '['):
+                try:
+                    log_dict['message'] = json.loads(log_dict['message'])
+                except (TypeError, ValueError):
+                    pass
 
         if record.exc_info:
             # Cache the traceback text to avoid converting it multiple times
@@ -81,3 +101,70 @@ def setup(level='DEBUG', formatter_cls=JsonFormatter, boto_level=None, **kwargs)
     logging.getLogger('boto3').setLevel(boto_level)
     logging.getLogger('botocore').setLevel(boto_level)
     logging.getLogger('urllib3').setLevel(boto_level)
+
+
+class LogSink(abc.ABC):
+    """Confirms that the log records of an invocation have been delivered.
+
+    Records are written to the Lambda runtime, which delivers them to their
+    destination in the background. A sink looks for a marker record written
+    after every other, so once the marker has arrived so has everything
+    before it.
+    """
+
+    @abc.abstractmethod
+    def confirm_delivery(self, marker, context, timeout):
+        """Returns True once the marker has been delivered, or False if it
+        could not be confirmed within timeout seconds."""
+
+
+class LocalLogSink(LogSink):
+    """Records written locally, for example under SAM local or in tests,
+    have been delivered as soon as they are flushed."""
+
+    def confirm_delivery(self, marker, context, timeout):
+        return True
+
+
+class CloudWatchLogsSink(LogSink):
+    """Polls the invocation's CloudWatch Logs stream for the marker."""
+
+    def __init__(self, logs_client, poll_interval=1, sleep=time.sleep, clock=time.monotonic):
+        self._logs_client = logs_client
+        self._poll_interval = poll_interval
+        self._sleep = sleep
+        self._clock = clock
+
+    def confirm_delivery(self, marker, context, timeout):
+        deadline = self._clock() + timeout
+        while True:
+            try:
+                response = self._logs_client.filter_log_events(
+                    logGroupName=context.log_group_name,
+                    logStreamNames=[context.log_stream_name],
+                    filterPattern='"{}"'.format(marker),
+                    limit=1
+                )
+                if response.get('events'):
+                    return True
+            except Exception as e:
+                # The stream may not exist yet, but anything else will not go away by polling
+                if getattr(e, 'response', {}).get('Error', {}).get('Code') != 'ResourceNotFoundException':
+                    logger.warning("Unable to confirm delivery of logs: {}".format(e))
+                    return False
+            if self._clock() + self._poll_interval > deadline:
+                return False
+            self._sleep(self._poll_interval)
+
+
+def flush(sink, context, timeout):
+    """Flushes every log handler and waits for the sink to confirm the
+    records have been delivered. Returns True if they were."""
+    for handler in logging.root.handlers:
+        handler.flush()
+    marker = "crhelper flushed logs of request {}".format(context.aws_request_id)
+    # Written straight to the output so it is not dropped by the log level
+    print(marker)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    return sink.confirm_delivery(marker, context, timeout)
@@ -17,7 +17,7 @@ import boto3
 import string
 import json
 import os
-from time import sleep
+from time import monotonic, sleep, time
 
 logger = logging.getLogger(__name__)
 
@@ -27,8 +27,17 @@ FAILED = 'FAILED'
 
 class CfnResource(object):
 
-    def __init__(self, json_logging=False, log_level='DEBUG', boto_level='ERROR', polling_interval=2, sleep_on_delete=120):
-        self._sleep_on_delete= sleep_on_delete
+    def __init__(self, json_logging=False, log_level='DEBUG', boto_level='ERROR', polling_interval=2, sleep_on_delete=None,
+                 log_sink=None, initial_poll_delay=1, max_poll_delay=30):
+        # Polls are first made within the invocation, waiting initial_poll_delay
+        # seconds and doubling up to max_poll_delay in between. Polling is only
+        # scheduled every polling_interval minutes if the invocation runs out of time.
+        self._initial_poll_delay = initial_poll_delay
+        self._max_poll_delay = max_poll_delay
+        # Deletes respond once the logs have been delivered. Sleeping is only a
+        # fallback for when their delivery cannot be confirmed.
+        self._sleep_on_delete = sleep_on_delete
+        self._log_sink = log_sink
         self._create_func = None
         self._update_func = None
         self._delete_func = None
@@ -59,6 +68,10 @@ class CfnResource(object):
                 self._lambda_client = boto3.client('lambda', region_name=self._region)
                 self._events_client = boto3.client('events', region_name=self._region)
                 self._logs_client = boto3.client('logs', region_name=self._region)
+                if self._log_sink is None:
+                    self._log_sink = log_helper.CloudWatchLogsSink(self._logs_client)
+            elif self._log_sink is None:
+                self._log_sink = log_helper.LocalLogSink()
             if json_logging:
                 log_helper.setup(log_level, boto_level=boto_level, RequestType='ContainerInit')
             else:
@@ -85,7 +98,7 @@ class CfnResource(object):
             logger.debug("_send_response: %s" % self._send_response)
             if self._send_response:
                 if self.RequestType == 'Delete':
-                    self._wait_for_cwlogs()
+                    self._flush_logs()
                 self._cfn_response(event)
         except Exception as e:
             logger.error(e, exc_info=True)
@@ -94,15 +107,18 @@ class CfnResource(object):
             if self._timer:
                 self._timer.cancel()
 
-    def _wait_for_cwlogs(self, sleep=sleep):
-        time_left = int(self._context.get_remaining_time_in_millis() / 1000) - 15
-        sleep_time = 0
+    def _time_left(self):
+        return int(self._context.get_remaining_time_in_millis() / 1000) - 15
 
-        if time_left > self._sleep_on_delete:
-            sleep_time = self._sleep_on_delete
+    def _flush_logs(self, sleep=sleep):
+        # The logs must be delivered before the function and its log group are deleted
+        if self._log_sink is not None and self._time_left() > 0:
+            if log_helper.flush(self._log_sink, self._context, self._time_left()):
+                return
+            logger.warning("Delivery of logs could not be confirmed")
 
-        if sleep_time > 1:
-            sleep(sleep_time)
+        if self._sleep_on_delete and self._time_left() > self._sleep_on_delete > 1:
+            sleep(self._sleep_on_delete)
 
     def _log_setup(self, event, context):
         if self._json_logging:
@@ -140,10 +156,14 @@ class CfnResource(object):
         # Setup polling on initial request
         logger.debug("pid1: %s" % self.PhysicalResourceId)
         if 'CrHelperPoll' not in event.keys() and self.Status != FAILED:
-            logger.info("Setting up polling")
             self.Data["PhysicalResourceId"] = self.PhysicalResourceId
-            self._setup_polling()
             self.PhysicalResourceId = None
+            self._poll_in_invocation()
+            if not self.PhysicalResourceId and self.Status != FAILED:
+                logger.info("Setting up polling")
+                started = monotonic()
+                self._setup_polling()
+                logger.info("Scheduling polling took %.1fs" % (monotonic() - started))
             logger.debug("pid2: %s" % self.PhysicalResourceId)
         # if physical id is set, or there was a failure then we're done
         logger.debug("pid3: %s" % self.PhysicalResourceId)
@@ -152,6 +172,21 @@ class CfnResource(object):
             self._remove_polling()
             self._send_response = True
 
+    def _poll_in_invocation(self):
+        # Backs off exponentially for as long as polling could still be scheduled afterwards
+        event = dict(self._event, CrHelperData=self.Data, CrHelperPoll=True)
+        started = monotonic()
+        delay = self._initial_poll_delay
+        polls = 0
+        while True:
+            polls += 1
+            self._wrap_function(self._poll_enabled(), event)
+            if self.PhysicalResourceId or self.Status == FAILED or delay > self._time_left():
+                break
+            sleep(delay)
+            delay = min(delay * 2, self._max_poll_delay)
+        logger.info("In-invocation polling took %.1fs over %d polls" % (monotonic() - started, polls))
+
     def generate_physical_id(self, event):
         return '_'.join([
             event['StackId'].split('/')[1],
@@ -197,9 +232,9 @@ class CfnResource(object):
         self._poll_delete_func = func
         return func
 
-    def _wrap_function(self, func):
+    def _wrap_function(self, func, event=None):
         try:
-            self.PhysicalResourceId = func(self._event, self._context) if func else ''
+            self.PhysicalResourceId = func(event or self._event, self._context) if func else ''
         except Exception as e:
             logger.error(str(e), exc_info=True)
             self.Reason = str(e)
@@ -236,7 +271,9 @@ class CfnResource(object):
         }
         if status:
             response_body.update({'Status': status, 'Reason': reason})
-        send_response(self._response_url, response_body)
+        # Give up on sending the response before the invocation ends
+        timeout = self._context.get_remaining_time_in_millis() / 1000.00 - 0.2 if self._context else None
+        send_response(self._response_url, response_body, timeout=timeout)
 
     def init_failure(self, error):
         self._init_failed = error
@@ -307,6 +344,8 @@ class CfnResource(object):
     def _setup_polling(self):
         self._event['CrHelperData'] = self.Data
         self._event['CrHelperPoll'] = True
+        # Carried by every scheduled invocation so the time spent polling can be reported
+        self._event['CrHelperPollScheduled'] = time()
         self._event['CrHelperRule'] = self._put_rule()
         self._event['CrHelperPermission'] = self._add_permission(self._event['CrHelperRule'])
         self._put_targets(self._context.function_name)
@@ -316,6 +355,11 @@ class CfnResource(object):
             self._event.pop('CrHelperData')
         if "PhysicalResourceId" in self.Data.keys():
             self.Data.pop("PhysicalResourceId")
+        if 'CrHelperPoll' not in self._event.keys():
+            # Polling finished within the first invocation, so nothing was scheduled
+            return
+        if 'CrHelperPollScheduled' in self._event.keys():
+            logger.info("Scheduled polling took %.1fs" % (time() - self._event['CrHelperPollScheduled']))
         if 'CrHelperRule' in self._event.keys():
             self._remove_targets(self._event['CrHelperRule'])
         else:
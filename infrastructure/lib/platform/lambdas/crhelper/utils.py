@@ -1,6 +1,7 @@
 from __future__ import print_function
 import json
 import logging as logging
+import random
 import time
 from urllib.parse import urlsplit, urlunsplit
 from http.client import HTTPSConnection
@@ -8,7 +9,20 @@ from http.client import HTTPSConnection
 logger = logging.getLogger(__name__)
 
 
-def _send_response(response_url, response_body):
+# Backoff between attempts grows from the base to the cap, with full jitter
+BACKOFF_BASE = 1
+BACKOFF_CAP = 20
+# How long a single attempt may take
+ATTEMPT_TIMEOUT = 10
+
+
+def _send_response(response_url, response_body, timeout=None, connection_factory=HTTPSConnection,
+                   sleep=time.sleep, clock=time.monotonic):
+    """Puts the response to the pre-signed URL, retrying failed attempts with jittered exponential backoff
+    until timeout seconds have passed. At least one attempt is always made, and no attempt may run past the
+    timeout. The connection is reused between attempts but not kept for later responses, as one left open
+    while the function is frozen has usually been closed by the time it is next used. Returns a dict of
+    the final status code, or None if there was none, the number of attempts made and the latency of each."""
     try:
         json_response_body = json.dumps(response_body)
     except Exception as e:
@@ -22,13 +36,46 @@ def _send_response(response_url, response_body):
     split_url = urlsplit(response_url)
     host = split_url.netloc
     url = urlunsplit(("", "", *split_url[2:]))
+    deadline = clock() + timeout if timeout is not None else None
+    result = {'status': None, 'attempts': 0, 'latencies': []}
+    connection = None
     while True:
+        result['attempts'] += 1
+        started = clock()
+        retry = True
+        attempt_timeout = ATTEMPT_TIMEOUT
+        if deadline is not None:
+            attempt_timeout = max(min(ATTEMPT_TIMEOUT, deadline - started), 0.1)
         try:
-            connection = HTTPSConnection(host)
+            if connection is None:
+                connection = connection_factory(host, timeout=attempt_timeout)
+            else:
+                connection.timeout = attempt_timeout
+                if connection.sock is not None:
+                    connection.sock.settimeout(attempt_timeout)
             connection.request(method="PUT", url=url, body=json_response_body, headers=headers)
             response = connection.getresponse()
+            # The body must be read before the connection can be used again
+            response.read()
+            result['status'] = response.status
             logger.info("CloudFormation returned status code: {}".format(response.reason))
-            break
+            # Only throttling and server errors can succeed on a later attempt
+            retry = response.status == 429 or response.status >= 500
         except Exception as e:
             logger.error("Unexpected failure sending response to CloudFormation {}".format(e), exc_info=True)
-            time.sleep(5)
+            if connection is not None:
+                connection.close()
+                connection = None
+        result['latencies'].append(clock() - started)
+        if not retry:
+            break
+        delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (result['attempts'] - 1)))
+        if deadline is not None and clock() + delay >= deadline:
+            logger.error("Giving up sending response to CloudFormation")
+            break
+        sleep(delay)
+    if connection is not None:
+        connection.close()
+    logger.info("Sent response to CloudFormation in {} attempts taking {}".format(
+        result['attempts'], ", ".join("{:.3f}s".format(latency) for latency in result['latencies'])))
+    return result
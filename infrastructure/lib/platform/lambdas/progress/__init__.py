@@ -0,0 +1,32 @@
+import clients
+import states
+
+
+def count_graphs(table_name, index_name):
+    """
+    Counts the graphs in each state by querying the sparse state index for
+    each state with Select=COUNT. Only the keys of graphs are held in the
+    index and none are returned, but DynamoDB still reads every one, so the
+    cost grows with the number of graphs. Returns a dict of state to count,
+    leaving out the states no graph is in.
+    """
+    dynamodb = clients.client("dynamodb")
+    counts = {}
+    for state in states.STATES:
+        kwargs = {
+            "TableName": table_name,
+            "IndexName": index_name,
+            "Select": "COUNT",
+            "KeyConditionExpression": "currentState = :state",
+            "ExpressionAttributeValues": { ":state": { "S": state } }
+        }
+        count = 0
+        while True:
+            response = dynamodb.query(**kwargs)
+            count += response["Count"]
+            if response.get("LastEvaluatedKey") is None:
+                break
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        if count > 0:
+            counts[state] = count
+    return counts
@@ -1,17 +1,34 @@
 from crhelper import CfnResource
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
 import json
 import logging
 import os
-import boto3
-
+import clients
+import logs
+import metrics
+import progress
+import states
+
+# crhelper sets the level of the root logger on every invocation, so it is
+# given the same level as the shared logging setup
+helper = CfnResource(json_logging=False, log_level=logs.LOG_LEVEL, boto_level='CRITICAL')
+logs.setup()
 logger = logging.getLogger(__name__)
-helper = CfnResource(json_logging=False, log_level='DEBUG', boto_level='CRITICAL', sleep_on_delete=120)
+
+# SQS sends at most 10 messages in a batch
+MAX_BATCH_SIZE = 10
+# How many graphs are queued for deletion at once
+CONCURRENCY = 10
 
 
 try:
-    get_graphs_function_arn = os.getenv("get_graphs_function_arn")
-    delete_graph_function_arn = os.getenv("delete_graph_function_arn")
-    client = boto3.client("lambda")
+    graph_table_name = os.getenv("graph_table_name")
+    graph_state_index_name = os.getenv("graph_state_index_name")
+    delete_graph_queue_url = os.getenv("delete_graph_queue_url")
+    # Clients are thread safe so, unlike resources, one is shared by every thread
+    dynamodb = clients.client("dynamodb")
+    sqs = clients.client("sqs")
     pass
 except Exception as e:
     helper.init_failure(e)
@@ -30,54 +47,126 @@ def update(event, context):
 
 @helper.delete
 def delete(event, context):
+    """
+    Queues the deletion of every graph for the delete graph worker, reading
+    the graph table directly rather than through the REST API. Graphs are
+    queued concurrently and the messages sent in batches, so the time taken
+    grows with how many graphs the workers can delete at once rather than
+    with the number of graphs. Raises an exception naming every graph which
+    could not be queued.
+    """
     logger.info("Got Delete")
-    graphs = getGraphs()
-
-    logger.info("Deleting graphs: {}".format(graphs))
-
-    for graph in graphs:
-        logger.info("Deleting graph: {}".format(graph))
-        response = client.invoke(
-            FunctionName = delete_graph_function_arn,
-            InvocationType = "RequestResponse",
-            Payload = json.dumps({
-                "pathParameters": {
-                    "graphName": graph["graphName"]
-                }
-            })
-        )
-        responsePayloadJson = json.loads(response["Payload"].read().decode("utf-8"))
-        logger.info("Received responsePayloadJson: {}".format(responsePayloadJson))
-        if responsePayloadJson["statusCode"] != 202:
-            logger.error("Unable to delete graph: {}, received status code: {}, message: {}".format(
-                graph["graphName"],
-                responsePayloadJson["statusCode"],
-                responsePayloadJson["body"]
-            )
-        )
+    messages = []
+    failures = {}
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        queued = [ (graph, executor.submit(queueDeletion, graph)) for graph in scanGraphs() ]
+        for graph, future in queued:
+            try:
+                message = future.result()
+            except Exception as e:
+                logger.exception("Unable to queue the deletion of graph: %s", graph["graphName"])
+                failures[graph["graphName"]] = str(e)
+                continue
+            if message is not None:
+                messages.append(message)
+
+    logger.info("Deleting graphs: %s", logs.Truncated([ message["graphName"] for message in messages ]))
+    failures.update(sendMessages(messages))
+
+    if len(failures) > 0:
+        logger.error("Unable to delete graphs: %s", logs.Truncated(failures))
+        raise Exception("Unable to delete {} graphs: {}".format(len(failures), ", ".join(sorted(failures))))
 
 
 @helper.poll_delete
 def poll_delete(event, context):
     logger.info("Got Poll Delete")
-    return True if (len(getGraphs()) == 0) else None
+    remaining = progress.count_graphs(graph_table_name, graph_state_index_name)
+    logger.info("Graphs remaining: %d %s", sum(remaining.values()), remaining)
+    return True if len(remaining) == 0 else None
 
 
-def getGraphs():
+def scanGraphs():
+    """
+    Yields the name, release name and state of every graph, reading the
+    table a page at a time. Administrator membership items share the table
+    but have no graphName, so they are left out.
+    """
     logger.info("Getting graphs")
-    response = client.invoke(
-        FunctionName = get_graphs_function_arn,
-        InvocationType = "RequestResponse",
-        Payload = json.dumps({ "pathParameters": None })
-    )
-    responsePayloadJson = json.loads(response["Payload"].read().decode("utf-8"))
-    logger.info("Received responsePayloadJson: {}".format(responsePayloadJson))
-
-    if responsePayloadJson["statusCode"] != 200:
-        raise Exception("Unable to obtain listing of graphs received response code: {}".format(responsePayloadJson["statusCode"]))
-
-    return json.loads(responsePayloadJson["body"])
+    kwargs = {
+        "TableName": graph_table_name,
+        "ProjectionExpression": "graphName, releaseName, currentState",
+        "FilterExpression": "attribute_exists(graphName)"
+    }
+    while True:
+        response = dynamodb.scan(**kwargs)
+        for item in response["Items"]:
+            yield { name: value["S"] for name, value in item.items() }
+        if response.get("LastEvaluatedKey") is None:
+            return
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def queueDeletion(graph):
+    """
+    Moves a graph to DELETION_QUEUED, as long as it has not changed state
+    since it was read, and returns the message telling the worker to delete
+    it. Graphs which are already queued are sent again, so retrying a failed
+    uninstall picks up any whose message was never sent. Returns None for
+    graphs which are already being deleted or have gone.
+    """
+    current_state = graph["currentState"]
+    if current_state != states.DELETION_QUEUED:
+        if not states.can_transition(current_state, states.DELETION_QUEUED):
+            return None
+        try:
+            dynamodb.update_item(
+                TableName=graph_table_name,
+                Key={
+                    "releaseName": { "S": graph["releaseName"] }
+                },
+                UpdateExpression="SET currentState = :queued REMOVE deploymentPhase, deploymentDeadline",
+                ExpressionAttributeValues={
+                    ":queued": { "S": states.DELETION_QUEUED },
+                    ":current": { "S": current_state }
+                },
+                ConditionExpression="currentState = :current"
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            logger.info("Graph: %s changed state while it was being queued for deletion", graph["graphName"])
+            return None
+
+    return {
+        "graphName": graph["graphName"],
+        "releaseName": graph["releaseName"],
+        "expectedStatus": states.DELETION_QUEUED
+    }
+
+
+def sendMessages(messages):
+    """
+    Sends messages to the delete graph queue in batches, returning a dict of
+    graph name to error for any which could not be sent
+    """
+    failures = {}
+    for i in range(0, len(messages), MAX_BATCH_SIZE):
+        batch = messages[i:i + MAX_BATCH_SIZE]
+        try:
+            response = sqs.send_message_batch(
+                QueueUrl=delete_graph_queue_url,
+                Entries=[ { "Id": str(j), "MessageBody": json.dumps(message) } for j, message in enumerate(batch) ]
+            )
+        except Exception as e:
+            logger.exception("Unable to send a batch of deletions")
+            failures.update((message["graphName"], str(e)) for message in batch)
+            continue
+        for failed in response.get("Failed", []):
+            failures[batch[int(failed["Id"])]["graphName"]] = failed.get("Message", failed["Code"])
+    return failures
 
 
+@metrics.timed("uninstall_graphs.handler")
 def handler(event, context):
     helper(event, context)
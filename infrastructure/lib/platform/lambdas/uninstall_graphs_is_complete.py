@@ -1,40 +1,31 @@
 from crhelper import CfnResource
-import json
 import logging
+import logs
+import metrics
 import os
-import boto3
+import progress
 
+# crhelper sets the level of the root logger on every invocation, so it is
+# given the same level as the shared logging setup
+helper = CfnResource(json_logging=False, log_level=logs.LOG_LEVEL, boto_level='CRITICAL')
+logs.setup()
 logger = logging.getLogger(__name__)
-helper = CfnResource(json_logging=False, log_level='DEBUG', boto_level='CRITICAL', sleep_on_delete=120)
 
 
 try:
-    get_graphs_function_arn = os.getenv("get_graphs_function_arn")
-    client = boto3.client("lambda")
+    graph_table_name = os.getenv("graph_table_name")
+    graph_state_index_name = os.getenv("graph_state_index_name")
     pass
 except Exception as e:
     helper.init_failure(e)
 
 
-def getGraphs():
-    logger.info("Getting graphs")
-    response = client.invoke(
-        FunctionName = get_graphs_function_arn,
-        InvocationType = "RequestResponse",
-        Payload = json.dumps({ "pathParameters": None })
-    )
-    responsePayloadJson = json.loads(response["Payload"].read().decode("utf-8"))
-    logger.info("Received responsePayloadJson: {}".format(responsePayloadJson))
-
-    if responsePayloadJson["statusCode"] != 200:
-        raise Exception("Unable to obtain listing of graphs received response code: {}".format(responsePayloadJson["statusCode"]))
-
-    return json.loads(responsePayloadJson["body"])
-
-
+@metrics.timed("uninstall_graphs_is_complete.handler")
 def handler(event, context):
     if ("RequestType" in event and event["RequestType"] == "Delete"):
-        isComplete = (len(getGraphs()) == 0)
+        remaining = progress.count_graphs(graph_table_name, graph_state_index_name)
+        logger.info("Graphs remaining: %d %s", sum(remaining.values()), remaining)
+        isComplete = (len(remaining) == 0)
     else:
         isComplete = True
     return { "IsComplete": isComplete }
@@ -15,9 +15,14 @@
  */
 
 import { Table } from "@aws-cdk/aws-dynamodb";
+import { ILayerVersion } from "@aws-cdk/aws-lambda";
+import { IBucket } from "@aws-cdk/aws-s3";
 
 export interface KaiRestApiProps {
     graphTable: Table;
+    idempotencyTable: Table;
     userPoolArn: string;
     userPoolId: string;
+    commonLayer: ILayerVersion;
+    schemaBucket: IBucket;
 }
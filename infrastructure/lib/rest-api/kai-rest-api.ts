@@ -21,7 +21,7 @@ import * as sqs from "@aws-cdk/aws-sqs";
 import * as path from "path";
 import { PolicyStatement } from "@aws-cdk/aws-iam";
 import { KaiRestApiProps } from "./kai-rest-api-props";
-import { DELETE_GRAPH_TIMEOUT, ADD_GRAPH_TIMEOUT } from "../constants";
+import { DELETE_GRAPH_TIMEOUT, ADD_GRAPH_TIMEOUT, GRAPH_ADMINISTRATOR_INDEX_NAME, REST_API_MINIMUM_COMPRESSION_SIZE } from "../constants";
 import { KaiRestAuthorizer } from "./authentication/kai-rest-authorizer";
 
 export class KaiRestApi extends cdk.Construct {
@@ -33,9 +33,13 @@ export class KaiRestApi extends cdk.Construct {
     constructor(scope: cdk.Construct, readonly id: string, props: KaiRestApiProps) {
         super(scope, id);
         // REST API
-        const restApi = new api.RestApi(this, this.node.uniqueId + "RestApi"); // Could add a default 404 handler here
+        const restApi = new api.RestApi(this, this.node.uniqueId + "RestApi", { // Could add a default 404 handler here
+            minimumCompressionSize: REST_API_MINIMUM_COMPRESSION_SIZE
+        });
         const graphsResource = restApi.root.addResource("graphs");
         const graph = graphsResource.addResource("{graphName}");
+        const graphStatus = graph.addResource("status");
+        const batchGraphsResource = restApi.root.addResource("batch").addResource("graphs");
 
         // Create MethodOptions to secure access to the RestApi methods using the Cognito user pool
         const methodOptions = new KaiRestAuthorizer(this, "KaiRestApiAuthorizer", {
@@ -55,24 +59,59 @@ export class KaiRestApi extends cdk.Construct {
         const addGraphLambda = new lambda.Function(this, "AddGraphHandler", {
             runtime: lambda.Runtime.PYTHON_3_7,
             code: lambdas,
+            layers: [ props.commonLayer ],
             handler: "add_graph_request.handler",
             timeout: lambdaTimeout,
             environment: {
                 sqs_queue_url: this.addGraphQueue.queueUrl,
                 graph_table_name: props.graphTable.tableName,
+                schema_bucket_name: props.schemaBucket.bucketName,
+                idempotency_table_name: props.idempotencyTable.tableName,
                 user_pool_id: props.userPoolId
             }
         });
 
         addGraphLambda.addToRolePolicy(new PolicyStatement({
-            actions: [ "cognito-idp:ListUsers" ],
+            actions: [ "cognito-idp:AdminGetUser" ],
             resources: [ props.userPoolArn ]
         }));
 
         props.graphTable.grantReadWriteData(addGraphLambda);
+        // Reading is needed to check whether a schema is already stored
+        props.schemaBucket.grantRead(addGraphLambda);
+        props.schemaBucket.grantPut(addGraphLambda);
         this.addGraphQueue.grantSendMessages(addGraphLambda);
+        props.idempotencyTable.grantReadWriteData(addGraphLambda);
         graphsResource.addMethod("POST", new api.LambdaIntegration(addGraphLambda), methodOptions);
 
+        // Batch POST handlers, these share the add graph queue and code
+        const batchAddGraphLambda = new lambda.Function(this, "BatchAddGraphHandler", {
+            runtime: lambda.Runtime.PYTHON_3_7,
+            code: lambdas,
+            layers: [ props.commonLayer ],
+            handler: "add_graph_request.batch_handler",
+            timeout: lambdaTimeout,
+            environment: {
+                sqs_queue_url: this.addGraphQueue.queueUrl,
+                graph_table_name: props.graphTable.tableName,
+                schema_bucket_name: props.schemaBucket.bucketName,
+                idempotency_table_name: props.idempotencyTable.tableName,
+                user_pool_id: props.userPoolId
+            }
+        });
+
+        batchAddGraphLambda.addToRolePolicy(new PolicyStatement({
+            actions: [ "cognito-idp:AdminGetUser" ],
+            resources: [ props.userPoolArn ]
+        }));
+
+        props.graphTable.grantReadWriteData(batchAddGraphLambda);
+        props.schemaBucket.grantRead(batchAddGraphLambda);
+        props.schemaBucket.grantPut(batchAddGraphLambda);
+        this.addGraphQueue.grantSendMessages(batchAddGraphLambda);
+        props.idempotencyTable.grantReadWriteData(batchAddGraphLambda);
+        batchGraphsResource.addMethod("POST", new api.LambdaIntegration(batchAddGraphLambda), methodOptions);
+
         // DELETE handlers
         this._deleteGraphQueue = new sqs.Queue(this, "DeleteGraphQueue", { 
             visibilityTimeout: DELETE_GRAPH_TIMEOUT
@@ -81,27 +120,32 @@ export class KaiRestApi extends cdk.Construct {
         this._deleteGraphLambda = new lambda.Function(this, "DeleteGraphHandler", {
             runtime: lambda.Runtime.PYTHON_3_7,
             code: lambdas,
+            layers: [ props.commonLayer ],
             handler: "delete_graph_request.handler",
             timeout: lambdaTimeout,
             environment: {
                 sqs_queue_url: this.deleteGraphQueue.queueUrl,
                 graph_table_name: props.graphTable.tableName,
+                idempotency_table_name: props.idempotencyTable.tableName,
                 user_pool_id: props.userPoolId
             }
         });
 
         props.graphTable.grantReadWriteData(this._deleteGraphLambda);
         this.deleteGraphQueue.grantSendMessages(this._deleteGraphLambda);
+        props.idempotencyTable.grantReadWriteData(this._deleteGraphLambda);
         graph.addMethod("DELETE", new api.LambdaIntegration(this._deleteGraphLambda), methodOptions);
 
         // GET handlers
         this._getGraphsLambda = new lambda.Function(this, "GetGraphsHandler", {
             runtime: lambda.Runtime.PYTHON_3_7,
             code: lambdas,
+            layers: [ props.commonLayer ],
             handler: "get_graph_request.handler",
             timeout: lambdaTimeout,
             environment: {
                 graph_table_name: props.graphTable.tableName,
+                graph_administrator_index_name: GRAPH_ADMINISTRATOR_INDEX_NAME,
                 user_pool_id: props.userPoolId
             }
         });
@@ -111,6 +155,29 @@ export class KaiRestApi extends cdk.Construct {
         const getGraphIntegration = new api.LambdaIntegration(this._getGraphsLambda);
         graphsResource.addMethod("GET", getGraphIntegration, methodOptions);
         graph.addMethod("GET", getGraphIntegration, methodOptions);
+
+        // GET status handler, this waits on the table's stream so needs the stream to be enabled
+        const graphTableStreamArn = props.graphTable.tableStreamArn;
+        if (graphTableStreamArn === undefined) {
+            throw new Error("The graph table must have a stream for the graph status handler to wait on");
+        }
+
+        const getGraphStatusLambda = new lambda.Function(this, "GetGraphStatusHandler", {
+            runtime: lambda.Runtime.PYTHON_3_7,
+            code: lambdas,
+            layers: [ props.commonLayer ],
+            handler: "get_graph_status_request.handler",
+            timeout: lambdaTimeout,
+            environment: {
+                graph_table_name: props.graphTable.tableName,
+                graph_table_stream_arn: graphTableStreamArn,
+                user_pool_id: props.userPoolId
+            }
+        });
+
+        props.graphTable.grantReadData(getGraphStatusLambda);
+        props.graphTable.grantStreamRead(getGraphStatusLambda);
+        graphStatus.addMethod("GET", new api.LambdaIntegration(getGraphStatusLambda), methodOptions);
     }
 
     public get addGraphQueue(): sqs.Queue { 
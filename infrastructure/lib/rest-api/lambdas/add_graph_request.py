@@ -1,34 +1,101 @@
-import boto3
+import clients
 from botocore.exceptions import ClientError
 from graph import Graph
+import idempotency
 import json
+import logging
+import logs
+import metrics
 import os
 import re
+import schemas
+import states
 from user import User
 
+logs.setup()
+logger = logging.getLogger(__name__)
+
 graph = Graph()
 user = User()
+schema_store = schemas.from_environment()
+idempotency_store = idempotency.from_environment()
+
+initial_status = states.DEPLOYMENT_QUEUED
+
+# Limits imposed by SQS on a single SendMessageBatch call
+max_messages_per_batch = 10
+max_batch_payload_bytes = 256 * 1024
+
+# The most graphs which can be created in a single batch request
+max_graphs_per_batch = 25
+# A graph is created in one transaction along with a membership item for each
+# of its administrators, so they must all fit within the transaction limit
+max_administrators = Graph.MAX_TRANSACTION_ITEMS - 1
 
 def is_graph_name_valid(graph_name):
     if graph_name  is None:
         return False
-    
-    return re.match("^[a-zA-Z0-9]+$", graph_name) # Graph names have to be alphanumerics  
 
+    return re.match("^[a-zA-Z0-9]+$", graph_name) # Graph names have to be alphanumerics
+
+
+def validate_graph_request(request_body):
+    """
+    Returns an error message if the graph request is invalid, otherwise None
+    """
+    if not isinstance(request_body, dict) or "graphName" not in request_body or not is_graph_name_valid(request_body["graphName"]):
+        return "graphName is a required field which must made up of alphanumeric characters"
+    if "schema" not in request_body or request_body["schema"] is None:
+        return "schema is a required field"
+    return None
+
+
+def get_administrators(event, request_body):
+    """
+    Gets the administrators of a new graph, which always includes the requesting user
+    """
+    administrators = []
+    requesting_user = user.get_requesting_cognito_user(event)
+    if requesting_user is not None:
+        administrators.append(requesting_user)
+    if "administrators" in request_body:
+        administrators.extend(request_body["administrators"])
+    return user.remove_duplicates(administrators)
+
+
+def too_many_administrators_message():
+    return "At most {} administrators can be given for a graph".format(max_administrators)
+
+
+def create_message(graph_name, release_name, schema_digest):
+    """
+    Creates the message to send to the worker. This also filters out anything else in the body.
+    The schema is passed by its digest in the schema store to keep the message small.
+    """
+    return {
+        "graphName": graph_name,
+        "releaseName": release_name,
+        "schemaDigest": schema_digest,
+        "expectedStatus": initial_status,
+        "endpoints":{}
+    }
+
+
+def already_exists_message(release_name, graph_name):
+    return "Graph release name " + release_name + " already exists as the lowercase conversion of " + graph_name + ". Graph names must be unique"
 
+
+@metrics.timed("add_graph_request.handler")
+@idempotency_store.idempotent("add_graph", user.get_requesting_cognito_user)
 def handler(event, context):
     request_body = json.loads(event["body"])
 
     # Check request is valid
-    if "graphName" not in request_body or not is_graph_name_valid(request_body["graphName"]):
-        return {
-            "statusCode": 400,
-            "body": "graphName is a required field which must made up of alphanumeric characters"
-        }
-    if "schema" not in request_body or request_body["schema"] is None:
+    error = validate_graph_request(request_body)
+    if error is not None:
         return {
             "statusCode": 400,
-            "body": "schema is a required field"
+            "body": error
         }
 
     graph_name = request_body["graphName"]
@@ -40,48 +107,180 @@ def handler(event, context):
     # Convert graph name to lowercase
     release_name = graph.format_graph_name(graph_name)
 
-    initial_status = "DEPLOYMENT_QUEUED"
-
-    administrators = []
-    requesting_user = user.get_requesting_cognito_user(event)
-    if requesting_user is not None:
-        administrators.append(requesting_user)
-    if "administrators" in request_body:
-        administrators.extend(request_body["administrators"])
-    if user.contains_duplicates(administrators):
-        administrators = list(set(administrators))
+    administrators = get_administrators(event, request_body)
+    if len(administrators) > max_administrators:
+        return {
+            "statusCode": 400,
+            "body": too_many_administrators_message()
+        }
     if not user.valid_cognito_users(administrators):
         return {
             "statusCode": 400,
             "body": "Not all of the supplied administrators are valid Cognito users: {}".format(str(administrators))
         }
 
+    # The schema is stored first so the worker can always find it
     try:
-        graph.create_graph(release_name, graph_name, initial_status, administrators)
+        schema_digest = schema_store.put(schema)
     except ClientError as e:
-        if e.response['Error']['Code']=='ConditionalCheckFailedException': 
+        logger.error("Unable to store the schema of %s: %s", graph_name, e.response["Error"])
+        return {
+            "statusCode": 500,
+            "body": json.dumps(e.response["Error"])
+        }
+
+    try:
+        graph.create_graph(release_name, graph_name, initial_status, administrators, schema_digest)
+    except ClientError as e:
+        if e.response['Error']['Code']=='ConditionalCheckFailedException':
             return {
                 "statusCode": 400,
-                "body": "Graph release name " + release_name + " already exists as the lowercase conversion of " + graph_name + ". Graph names must be unique"
+                "body": already_exists_message(release_name, graph_name)
             }
         else:
+            logger.error("Unable to create graph %s: %s", graph_name, e.response["Error"])
             return {
                 "statusCode": 500,
                 "body": json.dumps(e.response["Error"])
             }
 
-    # Create message to send to worker. This also filters out anything else in the body
-    message = {
-        "graphName": graph_name,
-        "releaseName": release_name,
-        "schema": schema,
-        "expectedStatus": initial_status,
-        "endpoints":{}
-    }
+    message = create_message(graph_name, release_name, schema_digest)
 
-    sqs = boto3.client("sqs")
+    sqs = clients.client("sqs")
     sqs.send_message(QueueUrl=queue_url, MessageBody=json.dumps(message))
 
     return {
         "statusCode": 201
     }
+
+
+def send_messages(sqs, queue_url, messages):
+    """
+    Sends messages in as few SendMessageBatch calls as the SQS limits allow.
+    Takes a dict of message id to message and returns the ids which failed.
+    """
+    failed = set()
+    entries = []
+    payload_bytes = 0
+    for message_id, message in messages.items():
+        body = json.dumps(message)
+        body_bytes = len(body.encode("utf-8"))
+        if len(entries) == max_messages_per_batch or (len(entries) > 0 and payload_bytes + body_bytes > max_batch_payload_bytes):
+            failed.update(send_message_batch(sqs, queue_url, entries))
+            entries = []
+            payload_bytes = 0
+        entries.append({ "Id": message_id, "MessageBody": body })
+        payload_bytes += body_bytes
+
+    if len(entries) > 0:
+        failed.update(send_message_batch(sqs, queue_url, entries))
+    return failed
+
+
+def send_message_batch(sqs, queue_url, entries):
+    try:
+        response = sqs.send_message_batch(QueueUrl=queue_url, Entries=entries)
+    except ClientError:
+        logger.exception("Unable to send a batch of %d messages", len(entries))
+        return [ entry["Id"] for entry in entries ]
+    failures = response.get("Failed", [])
+    if len(failures) > 0:
+        logger.error("Unable to send %d of a batch of %d messages: %s", len(failures), len(entries), logs.Truncated(failures))
+    return [ failure["Id"] for failure in failures ]
+
+
+@metrics.timed("add_graph_request.batch_handler")
+@idempotency_store.idempotent("batch_add_graph", user.get_requesting_cognito_user)
+def batch_handler(event, context):
+    """
+    Creates many graphs from a single request. Every entry is validated before
+    anything is written and a result is returned for each one in the order
+    they were supplied.
+    """
+    request_body = json.loads(event["body"])
+    if not isinstance(request_body, dict) or not isinstance(request_body.get("graphs"), list) or len(request_body["graphs"]) == 0:
+        return {
+            "statusCode": 400,
+            "body": "graphs is a required field which must be a non empty list"
+        }
+    if len(request_body["graphs"]) > max_graphs_per_batch:
+        return {
+            "statusCode": 400,
+            "body": "At most {} graphs can be created in a single request".format(max_graphs_per_batch)
+        }
+
+    queue_url = os.getenv("sqs_queue_url")
+
+    # Every entry is validated before any schema or graph is written
+    results = []
+    valid = {}
+    for index, graph_request in enumerate(request_body["graphs"]):
+        error = validate_graph_request(graph_request)
+        if error is not None:
+            results.append({ "statusCode": 400, "body": error })
+            continue
+
+        graph_name = graph_request["graphName"]
+        release_name = graph.format_graph_name(graph_name)
+        results.append({ "graphName": graph_name })
+
+        if release_name in valid:
+            results[index].update({ "statusCode": 400, "body": already_exists_message(release_name, graph_name) })
+            continue
+
+        administrators = get_administrators(event, graph_request)
+        if len(administrators) > max_administrators:
+            results[index].update({ "statusCode": 400, "body": too_many_administrators_message() })
+            continue
+        if not user.valid_cognito_users(administrators):
+            results[index].update({
+                "statusCode": 400,
+                "body": "Not all of the supplied administrators are valid Cognito users: {}".format(str(administrators))
+            })
+            continue
+
+        valid[release_name] = (index, graph_request["schema"], administrators)
+
+    pending = {}
+    for release_name, (index, schema, administrators) in valid.items():
+        graph_name = results[index]["graphName"]
+        # Graphs sharing a schema share the stored copy
+        try:
+            schema_digest = schema_store.put(schema)
+        except ClientError as e:
+            logger.error("Unable to store the schema of %s: %s", graph_name, e.response["Error"])
+            results[index].update({ "statusCode": 500, "body": json.dumps(e.response["Error"]) })
+            continue
+
+        pending[release_name] = (index, {
+            "release_name": release_name,
+            "graph_name": graph_name,
+            "status": initial_status,
+            "administrators": administrators,
+            "schema_digest": schema_digest
+        })
+
+    if len(pending) > 0:
+        errors = graph.create_graphs([ graph_args for _, graph_args in pending.values() ])
+
+        messages = {}
+        for release_name, (index, graph_args) in pending.items():
+            if release_name not in errors:
+                messages[str(index)] = create_message(graph_args["graph_name"], release_name, graph_args["schema_digest"])
+            elif errors[release_name] == "ConditionalCheckFailedException":
+                results[index].update({ "statusCode": 400, "body": already_exists_message(release_name, graph_args["graph_name"]) })
+            else:
+                logger.error("Unable to create graph %s: %s", graph_args["graph_name"], errors[release_name])
+                results[index].update({ "statusCode": 500, "body": errors[release_name] })
+
+        failed = send_messages(clients.client("sqs"), queue_url, messages)
+        for message_id in messages:
+            if message_id in failed:
+                results[int(message_id)].update({ "statusCode": 500, "body": "Unable to queue graph for deployment" })
+            else:
+                results[int(message_id)]["statusCode"] = 201
+
+    return {
+        "statusCode": 200,
+        "body": json.dumps({ "results": results })
+    }
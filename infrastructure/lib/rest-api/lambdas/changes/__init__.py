@@ -0,0 +1,232 @@
+import clients
+import logging
+import time
+from botocore.exceptions import ClientError
+from states import STATES, TERMINAL_STATES
+
+logger = logging.getLogger(__name__)
+
+
+# Every reader of a stream shares its read limits
+THROTTLING_ERRORS = ("LimitExceededException", "ThrottlingException")
+# How long the shards of the stream are reused for before being described again
+SHARD_CACHE_SECONDS = 60
+
+
+class StreamThrottled(Exception):
+    """
+    Raised when the stream cannot be read because its limits were reached
+    """
+    pass
+
+
+class GraphChange:
+    """
+    A change to a graph record. current_state is None if the graph was removed.
+    """
+
+    def __init__(self, release_name, current_state):
+        self.release_name = release_name
+        self.current_state = current_state
+
+    @classmethod
+    def from_stream_record(cls, record):
+        """
+        Creates a change from a DynamoDB Streams record with a NEW_IMAGE view
+        """
+        data = record["dynamodb"]
+        release_name = data["Keys"]["releaseName"]["S"]
+        if record["eventName"] == "REMOVE":
+            return cls(release_name, None)
+        state = data.get("NewImage", {}).get("currentState")
+        return cls(release_name, state["S"] if state is not None else None)
+
+
+class GraphChangeStream:
+    """
+    Tails the graph table's DynamoDB stream. Reading the stream does not
+    consume any of the table's read capacity, so waiting on it is far cheaper
+    than reading the graph record repeatedly. Only a couple of readers can
+    read each shard at once, so StreamThrottled is raised whenever a limit is
+    reached for the caller to fall back to reading the record. The shards are
+    described once a minute at most rather than on every open.
+    """
+
+    def __init__(self, stream_arn, poll_interval=1.0, sleep=time.sleep, clock=time.monotonic):
+        self.stream_arn = stream_arn
+        self.poll_interval = poll_interval
+        self.sleep = sleep
+        self.clock = clock
+        self.__shards = None
+        self.__shards_described_at = None
+
+    @property
+    def streams(self):
+        return clients.client("dynamodbstreams")
+
+    def open(self):
+        """
+        Starts reading from the latest record of every open shard. Only changes
+        made after this returns are read, so open the stream before reading the
+        record being waited on.
+        """
+        try:
+            shards = self.__get_shards()
+            cursor = StreamCursor()
+            for shard in shards:
+                cursor.seen.add(shard["ShardId"])
+                if "EndingSequenceNumber" not in shard["SequenceNumberRange"]:
+                    cursor.iterators[shard["ShardId"]] = self.__get_iterator(shard["ShardId"], "LATEST")
+            return cursor
+        except ClientError as e:
+            if e.response["Error"]["Code"] in THROTTLING_ERRORS:
+                raise StreamThrottled()
+            raise
+
+    def read(self, cursor):
+        """
+        Returns the changes made since the last read, waiting for the poll
+        interval first if there were none. Raises StreamThrottled if any shard
+        could not be read, as its changes would otherwise go unseen.
+        """
+        changes = []
+        closed = False
+        for shard_id, iterator in list(cursor.iterators.items()):
+            try:
+                response = self.streams.get_records(ShardIterator=iterator)
+            except ClientError as e:
+                if e.response["Error"]["Code"] in THROTTLING_ERRORS:
+                    raise StreamThrottled()
+                raise
+            changes.extend(GraphChange.from_stream_record(record) for record in response["Records"])
+            next_iterator = response.get("NextShardIterator")
+            if next_iterator is None:
+                del cursor.iterators[shard_id]
+                closed = True
+            else:
+                cursor.iterators[shard_id] = next_iterator
+
+        if closed:
+            try:
+                self.__follow_children(cursor)
+            except ClientError as e:
+                if e.response["Error"]["Code"] in THROTTLING_ERRORS:
+                    raise StreamThrottled()
+                raise
+        if len(changes) == 0:
+            self.sleep(self.poll_interval)
+        return changes
+
+    def __follow_children(self, cursor):
+        """
+        Shards are split over time, when one closes its children are read from
+        their first record so no change is missed
+        """
+        for shard in self.__get_shards(refresh=True):
+            if shard["ShardId"] not in cursor.seen and shard.get("ParentShardId") in cursor.seen:
+                cursor.seen.add(shard["ShardId"])
+                cursor.iterators[shard["ShardId"]] = self.__get_iterator(shard["ShardId"], "TRIM_HORIZON")
+
+    def __get_shards(self, refresh=False):
+        if refresh or self.__shards is None or self.clock() - self.__shards_described_at >= SHARD_CACHE_SECONDS:
+            self.__shards = self.__describe_shards()
+            self.__shards_described_at = self.clock()
+        return self.__shards
+
+    def __describe_shards(self):
+        shards = []
+        kwargs = { "StreamArn": self.stream_arn }
+        while True:
+            description = self.streams.describe_stream(**kwargs)["StreamDescription"]
+            shards.extend(description["Shards"])
+            if description.get("LastEvaluatedShardId") is None:
+                return shards
+            kwargs["ExclusiveStartShardId"] = description["LastEvaluatedShardId"]
+
+    def __get_iterator(self, shard_id, iterator_type):
+        return self.streams.get_shard_iterator(
+            StreamArn=self.stream_arn,
+            ShardId=shard_id,
+            ShardIteratorType=iterator_type
+        )["ShardIterator"]
+
+
+class StreamCursor:
+    """
+    The position of a reader in each shard of the stream
+    """
+
+    def __init__(self):
+        self.iterators = {}
+        self.seen = set()
+
+
+class StatusWatcher:
+    """
+    Waits for a graph to reach a state using the changes read from a change
+    source. Any source with open and read methods like GraphChangeStream can
+    be used, for example an in memory stand-in under test. If the source is
+    throttled the graph's state is read with get_state, a function of the
+    release name returning its state or None if it has been removed, instead.
+    The source is throttled when many requests are waiting, so rather than
+    add to the load the reads back off from the poll interval up to the max
+    poll interval and stop once max_poll_seconds have passed, after which
+    the latest state is returned.
+    """
+
+    # Stands in for a cursor once the change source could not be opened
+    POLLING = object()
+
+    def __init__(self, change_source, get_state, poll_interval=1.0, max_poll_interval=8.0, max_poll_seconds=10.0,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.change_source = change_source
+        self.get_state = get_state
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.max_poll_seconds = max_poll_seconds
+        self.clock = clock
+        self.sleep = sleep
+
+    def open(self):
+        try:
+            return self.change_source.open()
+        except StreamThrottled:
+            logger.warning("The graph table stream is throttled, polling the graph instead")
+            return self.POLLING
+
+    def wait_for(self, cursor, release_name, current_state, target_state, timeout_seconds):
+        """
+        Waits until the graph reaches the target state, a terminal state or is
+        removed, returning its latest state. Returns the latest state seen if
+        the timeout elapses first, or None if the graph was removed.
+        """
+        deadline = self.clock() + timeout_seconds
+        interval = self.poll_interval
+        if cursor is self.POLLING:
+            deadline = min(deadline, self.clock() + self.max_poll_seconds)
+        while not self.is_finished(current_state, target_state) and self.clock() < deadline:
+            if cursor is self.POLLING:
+                self.sleep(min(interval, max(0, deadline - self.clock())))
+                interval = min(interval * 2, self.max_poll_interval)
+                current_state = self.get_state(release_name)
+                continue
+            try:
+                changes = self.change_source.read(cursor)
+            except StreamThrottled:
+                logger.warning("The graph table stream is throttled, polling %s instead", release_name)
+                # Changes may have been missed, so the record is read from now on
+                cursor = self.POLLING
+                deadline = min(deadline, self.clock() + self.max_poll_seconds)
+                current_state = self.get_state(release_name)
+                continue
+            for change in changes:
+                if change.release_name == release_name:
+                    current_state = change.current_state
+                    # Report the first state which satisfies the caller
+                    if self.is_finished(current_state, target_state):
+                        break
+        return current_state
+
+    @staticmethod
+    def is_finished(current_state, target_state):
+        return current_state is None or current_state == target_state or current_state in TERMINAL_STATES
@@ -1,16 +1,27 @@
-import boto3
+import clients
 from botocore.exceptions import ClientError
 from graph import Graph
+import idempotency
 import json
+import logging
+import logs
+import metrics
 import os
+import states
 from user import User
 
+logs.setup()
+logger = logging.getLogger(__name__)
+
 # Get variables from env
 queue_url = os.getenv("sqs_queue_url")
 
 graph = Graph()
 user = User()
+idempotency_store = idempotency.from_environment()
 
+@metrics.timed("delete_graph_request.handler")
+@idempotency_store.idempotent("delete_graph", user.get_requesting_cognito_user)
 def handler(event, context):
     params = event["pathParameters"]
 
@@ -40,11 +51,17 @@ def handler(event, context):
             "body": "Graph " + graph_name + " does not exist. It may have already been deleted"
         }
 
-    initial_status = "DELETION_QUEUED"
+    initial_status = states.DELETION_QUEUED
+
+    if not states.can_transition(graph_record["currentState"], initial_status):
+        return {
+            "statusCode": 409,
+            "body": "Graph {} cannot be deleted while it is {}".format(graph_name, graph_record["currentState"])
+        }
 
-    # Add Entry to table
+    # Queue the deletion, as long as the graph has not changed state since it was read
     try:
-        graph.update_graph(release_name, initial_status)
+        graph.transition_graph(release_name, initial_status, [ graph_record["currentState"] ])
     except ClientError as e:
         if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
             return {
@@ -52,6 +69,7 @@ def handler(event, context):
                 "body": "Graph " + graph_name + " does not exist. It may have already been deleted"
             }
         else:
+            logger.error("Unable to queue the deletion of %s: %s", graph_name, e.response["Error"])
             return {
                 "statusCode": 500,
                 "body": json.dumps(e.response["Error"])
@@ -64,7 +82,7 @@ def handler(event, context):
         "expectedStatus": initial_status
     }
 
-    sqs = boto3.client("sqs")
+    sqs = clients.client("sqs")
     sqs.send_message(QueueUrl=queue_url, MessageBody=json.dumps(message))
 
     return {
@@ -1,12 +1,35 @@
-import os
-import boto3
-from graph import Graph
+from graph import Graph, InvalidFields, InvalidPaginationToken
 import json
+import logging
+import logs
+import metrics
 from user import User
 
+logs.setup()
+logger = logging.getLogger(__name__)
+
 graph = Graph()
 user = User()
 
+# Responses are written without whitespace to keep them small
+compact_separators = (",", ":")
+
+def get_page_size(query_params):
+    """
+    Gets the caller's requested page size, returning None if it is invalid
+    """
+    if query_params is None or query_params.get("maxResults") is None:
+        return Graph.DEFAULT_PAGE_SIZE
+    try:
+        page_size = int(query_params["maxResults"])
+    except ValueError:
+        return None
+    if page_size < 1 or page_size > Graph.MAX_PAGE_SIZE:
+        return None
+    return page_size
+
+
+@metrics.timed("get_graph_request.handler")
 def handler(event, context):
     """
     Main entrypoint for the HTTP GET lambda functions. This function
@@ -22,26 +45,64 @@ def handler(event, context):
         graph_name = path_params["graphName"]
 
     requesting_user = user.get_requesting_cognito_user(event)
+    query_params = event.get("queryStringParameters")
+
+    try:
+        fields = graph.parse_fields(query_params.get("fields") if query_params is not None else None)
+    except InvalidFields:
+        return {
+            "statusCode": 400,
+            "body": "fields must be a comma separated list of: {}".format(", ".join(Graph.FIELDS))
+        }
 
     if return_all:
+        page_size = get_page_size(query_params)
+        if page_size is None:
+            return {
+                "statusCode": 400,
+                "body": "maxResults must be a number between 1 and {}".format(Graph.MAX_PAGE_SIZE)
+            }
+        next_token = query_params.get("nextToken") if query_params is not None else None
+
+        try:
+            graphs, next_token = graph.get_graphs(requesting_user, page_size, next_token, fields)
+        except InvalidPaginationToken:
+            return {
+                "statusCode": 400,
+                "body": "nextToken is invalid"
+            }
+
+        body = { "graphs": graphs }
+        if next_token is not None:
+            body["nextToken"] = next_token
+
         return {
             "statusCode": 200,
-            "body": json.dumps(graph.get_all_graphs(requesting_user))
+            "body": json.dumps(body, separators=compact_separators)
         }
     else:
         try:
-            graph_record = graph.get_graph(graph_name)
+            # The administrators are always read as they are needed to authorize the request
+            read_fields = fields
+            if fields is not None and "administrators" not in fields:
+                read_fields = fields + [ "administrators" ]
+
+            graph_record = graph.get_graph(graph_name, read_fields)
             if requesting_user and not requesting_user in graph_record["administrators"]:
                 return {
                     "statusCode": 403,
                     "body": "User: {} is not authorized to retrieve graph: {}".format(requesting_user, graph_name)
                 }
 
+            if read_fields is not fields:
+                del graph_record["administrators"]
+
             return {
                 "statusCode": 200,
-                "body": json.dumps(graph_record)
+                "body": json.dumps(graph_record, separators=compact_separators)
             }
         except Exception as e:
+            logger.debug("Unable to read graph %s", graph_name, exc_info=True)
             return {
                 "statusCode": 404,
                 "body": graph_name + " was not found"
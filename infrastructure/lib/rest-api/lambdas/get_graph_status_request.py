@@ -0,0 +1,96 @@
+from changes import GraphChangeStream, StatusWatcher, STATES
+from graph import Graph
+import json
+import logging
+import logs
+import metrics
+import os
+from user import User
+
+logs.setup()
+logger = logging.getLogger(__name__)
+
+# API Gateway gives up on an integration after 29 seconds
+DEFAULT_TIMEOUT_SECONDS = 20
+MAX_TIMEOUT_SECONDS = 25
+
+graph = Graph()
+user = User()
+watcher = StatusWatcher(GraphChangeStream(os.getenv("graph_table_stream_arn")), graph.get_current_state)
+
+def get_timeout(query_params):
+    """
+    Gets the number of seconds the caller is willing to wait, returning None if it is invalid
+    """
+    if query_params.get("timeout") is None:
+        return DEFAULT_TIMEOUT_SECONDS
+    try:
+        timeout = int(query_params["timeout"])
+    except ValueError:
+        return None
+    if timeout < 0 or timeout > MAX_TIMEOUT_SECONDS:
+        return None
+    return timeout
+
+
+@metrics.timed("get_graph_status_request.handler")
+def handler(event, context):
+    """
+    Main entrypoint for the HTTP GET status lambda function. Returns the
+    current state of a graph. If waitFor is given the request is held until
+    the graph reaches that state or a terminal state, or the timeout elapses.
+    """
+    graph_name = event["pathParameters"]["graphName"]
+    query_params = event.get("queryStringParameters") or {}
+
+    wait_for = query_params.get("waitFor")
+    if wait_for is not None and wait_for not in STATES:
+        return {
+            "statusCode": 400,
+            "body": "waitFor must be one of: {}".format(", ".join(STATES))
+        }
+
+    timeout = get_timeout(query_params)
+    if timeout is None:
+        return {
+            "statusCode": 400,
+            "body": "timeout must be a number of seconds between 0 and {}".format(MAX_TIMEOUT_SECONDS)
+        }
+
+    # Start reading changes before the record so none are missed in between
+    cursor = None
+    if wait_for is not None and timeout > 0:
+        cursor = watcher.open()
+
+    try:
+        graph_record = graph.get_graph_status(graph_name)
+    except Exception:
+        logger.debug("Unable to read the status of %s", graph_name, exc_info=True)
+        return {
+            "statusCode": 404,
+            "body": graph_name + " was not found"
+        }
+
+    requesting_user = user.get_requesting_cognito_user(event)
+    if requesting_user and not requesting_user in graph_record["administrators"]:
+        return {
+            "statusCode": 403,
+            "body": "User: {} is not authorized to retrieve graph: {}".format(requesting_user, graph_name)
+        }
+
+    current_state = graph_record["currentState"]
+    if cursor is not None:
+        current_state = watcher.wait_for(cursor, graph.format_graph_name(graph_name), current_state, wait_for, timeout)
+        if current_state is None:
+            return {
+                "statusCode": 404,
+                "body": graph_name + " was not found"
+            }
+
+    return {
+        "statusCode": 200,
+        "body": json.dumps({
+            "graphName": graph_record["graphName"],
+            "currentState": current_state
+        })
+    }
@@ -1,66 +1,362 @@
+import base64
+import binascii
 import boto3
+import clients
+from botocore.exceptions import ClientError
+import json
+import metrics
 import os
+import states
 
 
+class InvalidPaginationToken(Exception):
+    pass
+
+
+class InvalidFields(Exception):
+    pass
+
+
+@metrics.timed_methods
 class Graph:
 
+    # Administrator membership items share the graph table with the graphs
+    # themselves. Their keys take the form <releaseName>#<administrator> which
+    # can never clash with a release name as those are alphanumeric.
+    MEMBERSHIP_SEPARATOR = "#"
+    DEFAULT_PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 100
+    MAX_TRANSACTION_ITEMS = 100
+    MAX_BATCH_GET_KEYS = 100
+    # The graph attributes which can be requested with a projection
+    FIELDS = ("graphName", "releaseName", "currentState", "administrators", "endpoints", "schemaDigest")
+
     def __init__(self):
-        dynamodb = boto3.resource("dynamodb")
-        graph_table_name = os.getenv("graph_table_name")
-        self.table = dynamodb.Table(graph_table_name)
+        self.graph_table_name = os.getenv("graph_table_name")
+        self.administrator_index_name = os.getenv("graph_administrator_index_name")
 
 
+    @property
+    def dynamodb(self):
+        return clients.resource("dynamodb")
+
+
+    @property
+    def table(self):
+        return self.dynamodb.Table(self.graph_table_name)
+
+
+    @metrics.untimed
     def format_graph_name(self, graph_name):
         return graph_name.lower()
-        
 
-    def get_all_graphs(self, requesting_user):
+
+    @metrics.untimed
+    def to_membership_key(self, release_name, administrator):
+        return release_name + self.MEMBERSHIP_SEPARATOR + administrator
+
+
+    @metrics.untimed
+    def parse_fields(self, fields):
+        """
+        Parses a comma separated list of graph attributes, returning None if
+        no fields were given so that whole graphs are read
+        """
+        if fields is None:
+            return None
+        parsed = list(dict.fromkeys(field.strip() for field in fields.split(",")))
+        if len(parsed) == 0 or any(field not in self.FIELDS for field in parsed):
+            raise InvalidFields()
+        return parsed
+
+
+    def __projection(self, fields):
+        """
+        Creates the arguments which project a read down to the given fields.
+        Every field is aliased as some, like endpoints, are reserved words.
+        """
+        if fields is None:
+            return {}
+        names = { "#f{}".format(i): field for i, field in enumerate(fields) }
+        return {
+            "ProjectionExpression": ", ".join(names),
+            "ExpressionAttributeNames": names
+        }
+
+
+    def get_graphs(self, requesting_user, page_size=DEFAULT_PAGE_SIZE, next_token=None, fields=None):
         """
-        Gets all graphs from Dynamodb table
+        Gets a page of graphs from the Dynamodb table. Users only see the
+        graphs they administer, which are looked up through the administrator
+        index rather than by scanning the table. If fields are given only those
+        attributes are read. Returns a tuple of the graphs and an opaque token
+        for the next page, or None if there are no more.
         """
-        graphs = self.table.scan()["Items"]
+        exclusive_start_key = self.__decode_token(next_token)
         if requesting_user is None:
-            return graphs
-        else:
-            return list(filter(lambda graph: requesting_user in graph["administrators"], graphs))
+            return self.__scan_graphs(page_size, exclusive_start_key, fields)
+
+        if exclusive_start_key is not None and exclusive_start_key.get("administrator") != requesting_user:
+            raise InvalidPaginationToken()
+        return self.__query_administered_graphs(requesting_user, page_size, exclusive_start_key, fields)
+
+
+    def __scan_graphs(self, page_size, exclusive_start_key, fields):
+        """
+        Scans for graphs until the page is full or the table has been read.
+        The limit applies before membership items are filtered out, so each
+        scan only asks for as many items as the page still needs, and a page
+        never holds more than page_size graphs.
+        """
+        kwargs = {
+            "FilterExpression": boto3.dynamodb.conditions.Attr("graphName").exists(),
+            **self.__projection(fields)
+        }
+        if exclusive_start_key is not None:
+            kwargs["ExclusiveStartKey"] = exclusive_start_key
+
+        graphs = []
+        while True:
+            response = self.table.scan(Limit=page_size - len(graphs), **kwargs)
+            graphs.extend(response["Items"])
+            last_evaluated_key = response.get("LastEvaluatedKey")
+            if last_evaluated_key is None or len(graphs) >= page_size:
+                return graphs, self.__encode_token(last_evaluated_key)
+            kwargs["ExclusiveStartKey"] = last_evaluated_key
+
+
+    def __query_administered_graphs(self, requesting_user, page_size, exclusive_start_key, fields):
+        kwargs = {
+            "IndexName": self.administrator_index_name,
+            "KeyConditionExpression": boto3.dynamodb.conditions.Key("administrator").eq(requesting_user),
+            "Limit": page_size
+        }
+        if exclusive_start_key is not None:
+            kwargs["ExclusiveStartKey"] = exclusive_start_key
+
+        response = self.table.query(**kwargs)
+        release_names = [ membership["graphReleaseName"] for membership in response["Items"] ]
+        graphs = self.__batch_get_graphs(release_names, fields)
+        return graphs, self.__encode_token(response.get("LastEvaluatedKey"))
 
 
-    def get_graph(self, graph_name):
+    def __batch_get_graphs(self, release_names, fields=None):
         """
-        Gets a specific graph from Dynamodb table
+        Fetches the graph records for the given release names, preserving order.
+        Graphs which have since been deleted are skipped.
         """
+        if len(release_names) == 0:
+            return []
+
+        # The release name is needed to put the graphs back in order
+        read_fields = fields
+        if fields is not None and "releaseName" not in fields:
+            read_fields = fields + [ "releaseName" ]
+
+        graphs = {}
+        for i in range(0, len(release_names), self.MAX_BATCH_GET_KEYS):
+            request = {
+                self.table.name: {
+                    "Keys": [ { "releaseName": release_name } for release_name in release_names[i:i + self.MAX_BATCH_GET_KEYS] ],
+                    **self.__projection(read_fields)
+                }
+            }
+            while request:
+                response = self.dynamodb.batch_get_item(RequestItems=request)
+                for item in response["Responses"].get(self.table.name, []):
+                    graphs[item["releaseName"]] = item
+                request = response.get("UnprocessedKeys")
+
+        ordered = [ graphs[release_name] for release_name in release_names if release_name in graphs ]
+        if read_fields is not fields:
+            for graph in ordered:
+                del graph["releaseName"]
+        return ordered
+
+
+    def __encode_token(self, last_evaluated_key):
+        if last_evaluated_key is None:
+            return None
+        return base64.urlsafe_b64encode(json.dumps(last_evaluated_key).encode("utf-8")).decode("utf-8")
+
+
+    def __decode_token(self, next_token):
+        if next_token is None:
+            return None
+        try:
+            key = json.loads(base64.urlsafe_b64decode(next_token.encode("utf-8")).decode("utf-8"))
+        except (binascii.Error, UnicodeError, ValueError):
+            raise InvalidPaginationToken()
+        if not isinstance(key, dict):
+            raise InvalidPaginationToken()
+        return key
+
+
+    def get_graph(self, graph_name, fields=None):
+        """
+        Gets a specific graph from Dynamodb table. If fields are given only
+        those attributes are read.
+        """
+        release_name = self.format_graph_name(graph_name)
+        if self.MEMBERSHIP_SEPARATOR in release_name:
+            raise Exception
+
         response = self.table.get_item(
             Key={
-                "releaseName": self.format_graph_name(graph_name)
-            }
+                "releaseName": release_name
+            },
+            **self.__projection(fields)
         )
         if "Item" in response:
             return response["Item"]
         raise Exception
 
 
-    def update_graph(self, release_name, status): 
+    def get_graph_status(self, graph_name):
+        """
+        Gets just the name, state and administrators of a graph, leaving out
+        larger attributes such as its endpoints
+        """
+        return self.get_graph(graph_name, [ "graphName", "currentState", "administrators" ])
+
+
+    def get_current_state(self, release_name):
+        """
+        Gets just the state of a graph, returning None if it does not exist.
+        The read is eventually consistent, which costs half as much and is
+        good enough for a caller which reads it again later.
+        """
+        response = self.table.get_item(
+            Key={
+                "releaseName": release_name
+            },
+            ProjectionExpression="currentState"
+        )
+        return response.get("Item", {}).get("currentState")
+
+
+    def transition_graph(self, release_name, to_state, from_states=None):
+        """
+        Moves a graph to a state in a single conditional write, as long as it
+        is in one of the given states. By default these are all of the states
+        the graph may move to to_state from. Any deployment progress is
+        cleared so the workers stop following the graph. Raises a ClientError
+        with the ConditionalCheckFailedException code if the graph does not
+        exist or is in any other state.
+        """
+        if from_states is None:
+            from_states = states.get_sources(to_state)
+        for from_state in from_states:
+            states.check_transition(from_state, to_state)
+
         self.table.update_item(
             Key={
                 "releaseName": release_name
             },
-            UpdateExpression="SET currentState = :state",
+            UpdateExpression="SET currentState = :state REMOVE deploymentPhase, deploymentDeadline",
             ExpressionAttributeValues={
-                ":state": status
+                ":state": to_state
             },
-            ConditionExpression=boto3.dynamodb.conditions.Attr("releaseName").exists()
+            ConditionExpression=boto3.dynamodb.conditions.Attr("currentState").is_in(list(from_states))
         )
 
 
-    def create_graph(self, release_name, graph_name, status, administrators):      
-        self.table.put_item(
-            Item={
-                "graphName": graph_name,
-                "releaseName": release_name,
-                "currentState": status,
-                "administrators": administrators,
-                "endpoints":{}
-            },
-            ConditionExpression=boto3.dynamodb.conditions.Attr("releaseName").not_exists()
+    def create_graph(self, release_name, graph_name, status, administrators, schema_digest=None):
+        """
+        Creates the graph record along with one membership item per
+        administrator in a single transaction
+        """
+        try:
+            self.dynamodb.meta.client.transact_write_items(
+                TransactItems=self.__create_graph_items(release_name, graph_name, status, administrators, schema_digest)
+            )
+        except self.dynamodb.meta.client.exceptions.TransactionCanceledException as e:
+            # Surface a failed existence check the same way a conditional put would
+            reasons = e.response.get("CancellationReasons", [])
+            if len(reasons) > 0 and reasons[0].get("Code") == "ConditionalCheckFailed":
+                e.response["Error"]["Code"] = "ConditionalCheckFailedException"
+            raise
+
+
+    def create_graphs(self, graphs):
+        """
+        Creates many graphs in as few round trips as possible. Takes a list of
+        dicts with the create_graph arguments and returns a dict of release
+        name to error code for each graph which could not be created.
+        """
+        errors = {}
+        existing = set(
+            item["releaseName"] for item in self.__batch_get_graphs([ g["release_name"] for g in graphs ])
         )
+        for release_name in existing:
+            errors[release_name] = "ConditionalCheckFailedException"
+
+        chunk = []
+        chunk_size = 0
+        for g in graphs:
+            if g["release_name"] in existing:
+                continue
+            items = self.__create_graph_items(**g)
+            if chunk_size + len(items) > self.MAX_TRANSACTION_ITEMS:
+                errors.update(self.__create_graph_chunk(chunk))
+                chunk = []
+                chunk_size = 0
+            chunk.append(g)
+            chunk_size += len(items)
+        if len(chunk) > 0:
+            errors.update(self.__create_graph_chunk(chunk))
+
+        return errors
+
 
+    def __create_graph_chunk(self, graphs):
+        transact_items = []
+        for g in graphs:
+            transact_items.extend(self.__create_graph_items(**g))
+        try:
+            self.dynamodb.meta.client.transact_write_items(TransactItems=transact_items)
+            return {}
+        except ClientError:
+            # A graph was created since the existence check or the chunk was
+            # otherwise rejected, so fall back to creating each one on its own
+            errors = {}
+            for g in graphs:
+                try:
+                    self.create_graph(**g)
+                except ClientError as e:
+                    errors[g["release_name"]] = e.response["Error"]["Code"]
+            return errors
+
+
+    def __create_graph_items(self, release_name, graph_name, status, administrators, schema_digest=None):
+        graph_item = {
+            "graphName": graph_name,
+            "releaseName": release_name,
+            "currentState": status,
+            "administrators": administrators,
+            "endpoints":{}
+        }
+        if schema_digest is not None:
+            graph_item["schemaDigest"] = schema_digest
+
+        transact_items = [
+            {
+                "Put": {
+                    "TableName": self.table.name,
+                    "Item": graph_item,
+                    "ConditionExpression": "attribute_not_exists(releaseName)"
+                }
+            }
+        ]
+        for administrator in administrators:
+            transact_items.append({
+                "Put": {
+                    "TableName": self.table.name,
+                    "Item": {
+                        "releaseName": self.to_membership_key(release_name, administrator),
+                        "administrator": administrator,
+                        "graphReleaseName": release_name
+                    }
+                }
+            })
+        return transact_items
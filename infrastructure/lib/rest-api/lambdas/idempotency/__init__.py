@@ -0,0 +1,192 @@
+import clients
+import functools
+import hashlib
+import json
+import logging
+import os
+import time
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+HEADER_NAME = "idempotency-key"
+MAX_KEY_LENGTH = 255
+
+IN_PROGRESS = "IN_PROGRESS"
+COMPLETED = "COMPLETED"
+
+
+class IdempotencyStore:
+    """
+    Remembers the responses to requests made with an Idempotency-Key header so
+    that retries are answered with the original response rather than being
+    processed again. Records expire after the TTL and are removed by DynamoDB.
+    Records of requests which are still being processed are locked for long
+    enough to outlive the lambda, so one which crashes does not block retries
+    for the whole TTL.
+    """
+
+    def __init__(self, table_name, ttl_seconds=24 * 60 * 60, lock_seconds=60, clock=time.time):
+        self.table_name = table_name
+        self.ttl_seconds = ttl_seconds
+        self.lock_seconds = lock_seconds
+        self.clock = clock
+
+    @property
+    def table(self):
+        return clients.resource("dynamodb").Table(self.table_name)
+
+    def idempotent(self, operation, get_scope):
+        """
+        Decorates a lambda handler so requests made with an Idempotency-Key
+        header are only processed once. Keys are scoped by the operation and
+        by get_scope(event), normally the requesting user. Server errors,
+        including those of any item of a batch, are not remembered so the
+        request can be retried.
+        """
+        def decorator(handler):
+            @functools.wraps(handler)
+            def wrapper(event, context):
+                key = get_idempotency_key(event)
+                if key is None:
+                    return handler(event, context)
+                if len(key) > MAX_KEY_LENGTH:
+                    return {
+                        "statusCode": 400,
+                        "body": "Idempotency-Key must be at most {} characters".format(MAX_KEY_LENGTH)
+                    }
+
+                record_id = self.to_record_id(operation, get_scope(event), key)
+                fingerprint = self.fingerprint(event)
+                replay = self.begin(record_id, fingerprint)
+                if replay is not None:
+                    return replay
+
+                try:
+                    response = handler(event, context)
+                except Exception:
+                    self.abandon(record_id)
+                    raise
+
+                # The request has been processed by now, so its response is
+                # returned even if it cannot be remembered. The record is then
+                # left locked until the lock expires.
+                try:
+                    if is_server_error(response):
+                        self.abandon(record_id)
+                    else:
+                        self.complete(record_id, response)
+                except Exception:
+                    logger.exception("Unable to record the response to request %s", record_id)
+                return response
+            return wrapper
+        return decorator
+
+    def to_record_id(self, operation, scope, key):
+        return hashlib.sha256(json.dumps([ operation, scope, key ]).encode("utf-8")).hexdigest()
+
+    def fingerprint(self, event):
+        """
+        Identifies the request so a key cannot be reused for a different one
+        """
+        request = [ event.get("pathParameters"), event.get("body") ]
+        return hashlib.sha256(json.dumps(request, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def begin(self, record_id, fingerprint):
+        """
+        Records that a request is being processed. Returns None if the caller
+        should process it, otherwise the response to return instead.
+        """
+        now = int(self.clock())
+        try:
+            self.table.put_item(
+                Item={
+                    "idempotencyKey": record_id,
+                    "requestStatus": IN_PROGRESS,
+                    "fingerprint": fingerprint,
+                    "lockExpiresAt": now + self.lock_seconds,
+                    "expiresAt": now + self.ttl_seconds
+                },
+                # Expired records may not have been removed by DynamoDB yet
+                ConditionExpression="attribute_not_exists(idempotencyKey) OR expiresAt < :now OR "
+                    "(requestStatus = :inProgress AND lockExpiresAt < :now)",
+                ExpressionAttributeValues={
+                    ":now": now,
+                    ":inProgress": IN_PROGRESS
+                }
+            )
+            return None
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+
+        record = self.table.get_item(Key={ "idempotencyKey": record_id }, ConsistentRead=True).get("Item")
+        if record is None:
+            # The record expired between the two calls
+            return self.begin(record_id, fingerprint)
+        if record["fingerprint"] != fingerprint:
+            return {
+                "statusCode": 422,
+                "body": "Idempotency-Key has already been used for a different request"
+            }
+        if record["requestStatus"] == IN_PROGRESS:
+            return {
+                "statusCode": 409,
+                "body": "A request with this Idempotency-Key is still being processed"
+            }
+
+        response = json.loads(record["response"])
+        response.setdefault("headers", {})["Idempotent-Replayed"] = "true"
+        return response
+
+    def complete(self, record_id, response):
+        self.table.update_item(
+            Key={
+                "idempotencyKey": record_id
+            },
+            UpdateExpression="SET requestStatus = :completed, #response = :response REMOVE lockExpiresAt",
+            ExpressionAttributeNames={
+                "#response": "response"
+            },
+            ExpressionAttributeValues={
+                ":completed": COMPLETED,
+                ":response": json.dumps(response)
+            }
+        )
+
+    def abandon(self, record_id):
+        self.table.delete_item(Key={ "idempotencyKey": record_id })
+
+
+def is_server_error(response):
+    """
+    Whether a response is a server error, or is the response to a batch
+    request with a server error among its results
+    """
+    if response.get("statusCode", 500) >= 500:
+        return True
+    body = response.get("body")
+    if not isinstance(body, str) or not body.startswith("{"):
+        return False
+    try:
+        results = json.loads(body).get("results")
+    except ValueError:
+        return False
+    return isinstance(results, list) and any(
+        isinstance(result, dict) and result.get("statusCode", 0) >= 500 for result in results
+    )
+
+
+def get_idempotency_key(event):
+    """
+    Gets the Idempotency-Key header, header names are case insensitive
+    """
+    headers = event.get("headers") or {}
+    for name, value in headers.items():
+        if name.lower() == HEADER_NAME and value:
+            return value
+    return None
+
+
+def from_environment():
+    return IdempotencyStore(os.getenv("idempotency_table_name"))
@@ -1,24 +1,86 @@
-import boto3
+import clients
+import metrics
 import os
+import time
+from collections import OrderedDict
 
 
+class UserDirectory:
+    """
+    Resolves Cognito usernames with targeted lookups. Results are held in a
+    size bounded, least recently used cache so warm containers only go back
+    to Cognito for usernames they have not seen within the TTL. Unknown
+    usernames are only cached briefly, so a user added to the pool can be
+    made an administrator straight away.
+    """
+
+    def __init__(self, cognito_client, user_pool_id, ttl_seconds=300, negative_ttl_seconds=5, max_size=1000,
+                 clock=time.monotonic):
+        self.cognito_client = cognito_client
+        self.user_pool_id = user_pool_id
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_size = max_size
+        self.clock = clock
+        self.__cache = OrderedDict()
+
+    def exists(self, username):
+        """
+        Returns True if the username belongs to a user in the pool
+        """
+        now = self.clock()
+        cached = self.__cache.get(username)
+        if cached is not None and cached[1] > now:
+            self.__cache.move_to_end(username)
+            return cached[0]
+
+        found = self.__lookup(username)
+        self.__cache[username] = (found, now + (self.ttl_seconds if found else self.negative_ttl_seconds))
+        self.__cache.move_to_end(username)
+        while len(self.__cache) > self.max_size:
+            self.__cache.popitem(last=False)
+        return found
+
+    def all_exist(self, usernames):
+        """
+        Returns True if every username belongs to a user in the pool. Stops
+        at the first unknown user.
+        """
+        return all(self.exists(username) for username in set(usernames))
+
+    def __lookup(self, username):
+        try:
+            self.cognito_client.admin_get_user(UserPoolId=self.user_pool_id, Username=username)
+            return True
+        except (self.cognito_client.exceptions.UserNotFoundException,
+                self.cognito_client.exceptions.InvalidParameterException):
+            return False
+
+
+@metrics.timed_methods
 class User:
 
     def __init__(self):
-        self.cognito_client = boto3.client('cognito-idp')
         self.user_pool_id = os.getenv("user_pool_id")
+        self.__directory = None
 
-    def valid_cognito_users(self, users):
-        response = self.cognito_client.list_users(UserPoolId=self.user_pool_id)
-        cognito_users = map(self.to_user_name, response["Users"])
-        return set(users).issubset(set(cognito_users))
+    @property
+    def directory(self):
+        if self.__directory is None:
+            self.__directory = UserDirectory(clients.client("cognito-idp"), self.user_pool_id)
+        return self.__directory
 
-    def to_user_name(self, user):
-        return user["Username"]
+    def valid_cognito_users(self, users):
+        return self.directory.all_exist(users)
 
-    def contains_duplicates(self, items):
-        return set([item for item in items if items.count(item) > 1])
+    @metrics.untimed
+    def remove_duplicates(self, items):
+        """
+        Removes duplicate items whilst preserving the order they were supplied in
+        """
+        return list(dict.fromkeys(items))
 
+    @metrics.untimed
     def get_requesting_cognito_user(self, request):
         if ("requestContext" not in request
             or "authorizer" not in request["requestContext"]
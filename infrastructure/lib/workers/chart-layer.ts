@@ -0,0 +1,63 @@
+/*
+ * Copyright 2020 Crown Copyright
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+import * as cdk from "@aws-cdk/core";
+import * as lambda from "@aws-cdk/aws-lambda";
+import * as path from "path";
+import { GAFFER_CHART_REPO } from "../constants";
+import { ChartLayerProps } from "./chart-layer-props";
+
+/**
+ * A Lambda layer containing an archive of the Gaffer chart under /opt/charts, where the add graph worker looks
+ * for it before pulling the chart from its repository. The chart is pulled when the app is synthesized, which
+ * needs Docker.
+ */
+export class ChartLayer extends cdk.Construct {
+    private readonly _layer: lambda.LayerVersion;
+
+    constructor(scope: cdk.Construct, id: string, props: ChartLayerProps) {
+        super(scope, id);
+
+        const bundlingDirectory = path.join(__dirname, "chart-layer");
+        this._layer = new lambda.LayerVersion(this, "ChartLayerVersion", {
+            code: lambda.Code.fromAsset(bundlingDirectory, {
+                // A pinned chart version never changes, so the version identifies the asset
+                assetHashType: cdk.AssetHashType.CUSTOM,
+                assetHash: "gaffer-" + props.version,
+                bundling: {
+                    image: cdk.BundlingDockerImage.fromAsset(bundlingDirectory),
+                    environment: {
+                        // Helm needs somewhere writable to keep its cache and configuration
+                        XDG_CACHE_HOME: "/tmp/.cache",
+                        XDG_CONFIG_HOME: "/tmp/.config",
+                        XDG_DATA_HOME: "/tmp/.local/share"
+                    },
+                    command: [
+                        "sh", "-c",
+                        "mkdir -p /asset-output/charts && helm pull gaffer --repo " + GAFFER_CHART_REPO +
+                            " --version " + props.version + " --destination /asset-output/charts"
+                    ]
+                }
+            }),
+            compatibleRuntimes: [ lambda.Runtime.PYTHON_3_7 ],
+            description: "Gaffer Helm chart " + props.version
+        });
+    }
+
+    public get layer(): lambda.ILayerVersion {
+        return this._layer;
+    }
+}
@@ -3,21 +3,31 @@ import logging
 import os
 import random
 import string
-import subprocess
 
-import boto3
+import batch
+import charts
+import clients
+import deployment
 import kubernetes
-from kubernetes import KubernetesClient, KubeConfigurator, CommandHelper
+import logs
+import metrics
+import schemas
+import states
+from botocore.exceptions import ClientError
 from graph import Graph
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logs.setup()
+logger = logging.getLogger(__name__)
 
 os.environ['PATH'] = '/opt/kubectl:/opt/helm:/opt/awscli:' + os.environ['PATH']
 
 cluster_name = os.getenv("cluster_name")
 graph_table_name = os.getenv("graph_table_name")
 
+schema_store = schemas.from_environment()
+readiness_queue = deployment.from_environment()
+chart_cache = charts.ChartCache()
+
 
 def generate_password(length=8):
     """
@@ -98,37 +108,40 @@ def create_values(graph_name, schema, security_groups):
         }
     }
 
-def get_endpoints(release_name, graph):
-    kubernetes_client = kubernetes.KubernetesClient(cluster_name)
-    alb_output = kubernetes_client.get_alb_endpoints(release_name)
-    alb_endpoints = alb_output.splitlines()
-    for line in alb_endpoints[1:]:
-        resource_details = line.split()
-        resource_name = resource_details[0] 
-        resource_address = resource_details[2]
-        graph.update_endpoints(resource_name, resource_address)
-
-         
 def deploy_graph(helm_client, body, security_groups):
     """
-    Deploys a Gaffer graph onto a Kubernetes cluster using the Gaffer
-    Helm Chart.
+    Submits a Gaffer graph to a Kubernetes cluster using the Gaffer Helm
+    Chart. Helm returns once the chart's resources are created, so rather than
+    waiting for them to become ready the graph is handed to the readiness
+    worker which finishes the deployment.
     """
     # Extract values from body
     graph_name = body["graphName"]
     release_name = body["releaseName"]
-    schema = body["schema"]
     expected_status = body["expectedStatus"]
 
     # Create Graph to log progress of deployment
     graph = Graph(graph_table_name, release_name)
 
-    if not graph.check_status(expected_status):
+    # Only one worker can move the graph on from the expected status. The
+    # namespace is recorded first so the graph can be torn down even if the
+    # install fails part way through.
+    namespace = deployment.get_namespace(release_name)
+    attributes = { "namespace": namespace } if namespace is not None else None
+    if not graph.transition(expected_status, states.DEPLOYMENT_IN_PROGRESS, attributes):
         logger.warn("Deployment of %s abandoned as graph had unexpected status", graph_name)
         return
 
-    # Update Status to DEPLOYMENT_IN_PROGRESS
-    graph.update_status("DEPLOYMENT_IN_PROGRESS")
+    # Messages queued before schemas were stored by digest carry the schema itself
+    if "schemaDigest" in body:
+        try:
+            schema = schema_store.get(body["schemaDigest"])
+        except Exception:
+            logger.exception("Unable to read the schema of %s", graph_name)
+            graph.transition(states.DEPLOYMENT_IN_PROGRESS, states.DEPLOYMENT_FAILED)
+            return
+    else:
+        schema = body["schema"]
 
     # Create values file
     values = create_values(graph_name, schema, security_groups)
@@ -137,28 +150,44 @@ def deploy_graph(helm_client, body, security_groups):
     with open(values_file, "w") as f:
         f.write(json.dumps(values, indent=2))
         
+    # Install from a local archive of the chart, pulling it only if it is not cached
+    try:
+        chart = chart_cache.get(helm_client, charts.get_version())
+    except Exception:
+        logger.exception("Unable to get the chart for %s", graph_name)
+        graph.transition(states.DEPLOYMENT_IN_PROGRESS, states.DEPLOYMENT_FAILED)
+        return
+
     # Deploy Graph
-    success = helm_client.install_chart(release_name, values=values_file)
+    success = helm_client.install_chart(release_name, values=values_file, chart=chart.path, repo=None, namespace=namespace)
 
     if success:
-        # capture endpoints
-        get_endpoints(release_name, graph)
-        logger.info("Deployment of " + graph_name + " Succeeded")
-        graph.update_status("DEPLOYED")
+        # The chart is recorded so the graph can be redeployed or upgraded from the same one
+        try:
+            graph.await_readiness(deployment.AWAITING_READINESS, readiness_queue.get_deadline(), chart.version, chart.digest)
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            # The graph was queued for deletion while it was being installed
+            logger.warn("Deployment of %s abandoned as graph had unexpected status", graph_name)
+            return
+        readiness_queue.schedule_check(graph_name, release_name)
+        logger.info("Deployment of " + graph_name + " Submitted")
     else:
-        graph.update_status("DEPLOYMENT_FAILED")
+        graph.transition(states.DEPLOYMENT_IN_PROGRESS, states.DEPLOYMENT_FAILED)
 
 
+@metrics.timed("add_graph.handler")
 def handler(event, context):
     """
     Entrypoint for the Lambda
     """
-    logger.info(event)
+    logger.info("Received event: %s", logs.Truncated(event))
 
     helm_client = kubernetes.HelmClient(cluster_name)
     
     # Get Security Groups
-    eks = boto3.client("eks")
+    eks = clients.client("eks")
     cluster = eks.describe_cluster(name=cluster_name)
     security_groups = cluster["cluster"]["resourcesVpcConfig"]["clusterSecurityGroupId"]
     extra_security_groups = os.getenv("extra_security_groups")
@@ -168,9 +197,9 @@ def handler(event, context):
 
     logger.info("Using security groups: " + security_groups)
 
-    # Run Deployments
-    for record in event["Records"]:
-        body = json.loads(record["body"])
-        deploy_graph(helm_client, body, security_groups)
-
-    return
+    # Run Deployments, each one mostly waits on helm so they are run concurrently
+    return batch.process_records(
+        event["Records"],
+        lambda body: deploy_graph(helm_client, body, security_groups),
+        batch.get_concurrency()
+    )
@@ -0,0 +1,54 @@
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Executors live as long as the container so their threads, and the AWS
+# resources each thread holds, are reused by every invocation
+__executors = {}
+__executors_lock = threading.Lock()
+
+
+def get_concurrency(default=1):
+    """
+    Gets the number of records a worker may process at once
+    """
+    return max(1, int(os.getenv("record_concurrency", str(default))))
+
+
+def get_executor(concurrency):
+    """
+    Gets the container's pool of concurrency threads, creating it on first use
+    """
+    with __executors_lock:
+        executor = __executors.get(concurrency)
+        if executor is None:
+            executor = __executors[concurrency] = ThreadPoolExecutor(max_workers=concurrency)
+        return executor
+
+
+def process_records(records, process, concurrency):
+    """
+    Calls process with the body of each SQS record on a pool of at most
+    concurrency threads. Returns a partial batch response naming the records
+    which raised, so only those are returned to the queue.
+    """
+    def process_record(record):
+        try:
+            process(json.loads(record["body"]))
+            return None
+        except Exception:
+            logger.exception("Failed to process message %s", record["messageId"])
+            return record["messageId"]
+
+    if concurrency == 1 or len(records) == 1:
+        failed = [ process_record(record) for record in records ]
+    else:
+        failed = list(get_executor(concurrency).map(process_record, records))
+
+    return {
+        "batchItemFailures": [ { "itemIdentifier": message_id } for message_id in failed if message_id is not None ]
+    }
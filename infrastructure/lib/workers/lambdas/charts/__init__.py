@@ -0,0 +1,115 @@
+import hashlib
+import logging
+import metrics
+import os
+import shutil
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+GAFFER_CHART = "gaffer"
+GAFFER_REPO = "https://gchq.github.io/gaffer-docker"
+
+# Lambda layers are extracted under /opt, so a layer can package charts here
+PACKAGED_DIRECTORY = "/opt/charts"
+CACHE_DIRECTORY = "/tmp/charts"
+
+
+class ChartNotFound(Exception):
+    pass
+
+
+class Chart:
+    """
+    A packaged version of a Helm chart
+    """
+
+    def __init__(self, version, path, digest):
+        self.version = version
+        self.path = path
+        self.digest = digest
+
+
+class ChartCache:
+    """
+    Keeps local archives of a Helm chart so installs do not fetch it from its
+    repository. Archives are looked for in a directory packaged into a layer,
+    then in a cache under /tmp which outlives the invocation, and are only
+    pulled from the repository when neither has the version. When no version
+    is asked for, the latest is pulled once and then used for the rest of the
+    container's life.
+    """
+
+    def __init__(self, name=GAFFER_CHART, repo=GAFFER_REPO, packaged_directory=PACKAGED_DIRECTORY,
+                 cache_directory=CACHE_DIRECTORY):
+        self.name = name
+        self.repo = repo
+        self.packaged_directory = packaged_directory
+        self.cache_directory = cache_directory
+        self.__lock = threading.Lock()
+        self.__charts = {}
+
+    @metrics.timed("ChartCache.get")
+    def get(self, helm_client, version=None, digest=None):
+        """
+        Gets an archive of the chart at a version, the latest if none is given,
+        checking it has the given digest if one is. The helm client is only
+        used if the chart has to be pulled.
+        """
+        with self.__lock:
+            chart = self.__charts.get(version)
+            if chart is None:
+                chart = self.__find(version) or self.__pull(helm_client, version)
+                self.__charts[version] = self.__charts[chart.version] = chart
+
+        if digest is not None and chart.digest != digest:
+            raise ChartNotFound("{} {} does not have digest {}".format(self.name, chart.version, digest))
+        return chart
+
+    def __to_file_name(self, version):
+        return "{}-{}.tgz".format(self.name, version)
+
+    def __find(self, version):
+        if version is None:
+            return None
+        for directory in (self.packaged_directory, self.cache_directory):
+            path = os.path.join(directory, self.__to_file_name(version))
+            if os.path.exists(path):
+                return Chart(version, path, compute_digest(path))
+        return None
+
+    def __pull(self, helm_client, version):
+        logger.info("Pulling %s %s from %s", self.name, version or "latest", self.repo)
+        os.makedirs(self.cache_directory, exist_ok=True)
+        # Pulled into a directory of its own so a chart is never read half written
+        pull_directory = tempfile.mkdtemp(dir=self.cache_directory)
+        try:
+            if not helm_client.pull_chart(self.name, pull_directory, version=version, repo=self.repo):
+                raise ChartNotFound("Unable to pull {} {}".format(self.name, version or "latest"))
+            archives = os.listdir(pull_directory)
+            if len(archives) != 1:
+                raise ChartNotFound("Expected one archive of {} but found {}".format(self.name, archives))
+
+            # The archive is named after the version pulled
+            pulled_version = archives[0][len(self.name) + 1:-len(".tgz")]
+            path = os.path.join(self.cache_directory, self.__to_file_name(pulled_version))
+            os.replace(os.path.join(pull_directory, archives[0]), path)
+            return Chart(pulled_version, path, compute_digest(path))
+        finally:
+            shutil.rmtree(pull_directory, ignore_errors=True)
+
+
+def compute_digest(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(64 * 1024), b""):
+            sha256.update(block)
+    return "sha256:" + sha256.hexdigest()
+
+
+def get_version():
+    """
+    Gets the version of the chart graphs are deployed with, None for the latest
+    """
+    return os.getenv("gaffer_chart_version") or None
@@ -0,0 +1,112 @@
+import batch
+import deployment
+import os
+import logging
+import logs
+import metrics
+import states
+import time
+from botocore.exceptions import ClientError
+from graph import Graph
+from kubernetes import KubernetesClient
+
+logs.setup()
+logger = logging.getLogger(__name__)
+
+cluster_name = os.getenv("cluster_name")
+graph_table_name = os.getenv("graph_table_name")
+
+readiness_queue = deployment.from_environment()
+
+
+def check_deployment(kubernetes_client, body):
+    """
+    Follows a submitted graph until it becomes ready or the watch ends. Each
+    endpoint is recorded as soon as it is assigned and ready graphs are marked
+    as deployed. Graphs which are not ready by their deadline are marked as
+    failed and any others are checked again later. Graphs whose namespace is
+    being deleted are followed until it has gone instead.
+    """
+    graph_name = body["graphName"]
+    release_name = body["releaseName"]
+
+    graph = Graph(graph_table_name, release_name)
+    record = graph.get_deployment()
+    if record is None:
+        logger.info("Graph %s no longer exists", graph_name)
+        return
+
+    kubernetes_client = kubernetes_client.for_namespace(record.get("namespace"))
+    phase = record.get("deploymentPhase")
+    current_state = record.get("currentState")
+    if phase == deployment.AWAITING_REMOVAL and current_state == states.DELETION_IN_PROGRESS:
+        check_removal(graph, kubernetes_client, record, body)
+        return
+    if phase != deployment.AWAITING_READINESS or current_state != states.DEPLOYMENT_IN_PROGRESS:
+        logger.info("Graph %s is no longer awaiting readiness", graph_name)
+        return
+
+    # Earlier checks may already have recorded some of the endpoints
+    recorded = set(record.get("endpoints", {}))
+    def unrecorded(endpoints):
+        return { name: address for name, address in endpoints.items() if name not in recorded }
+
+    def record_endpoints(endpoints):
+        endpoints = unrecorded(endpoints)
+        if len(endpoints) > 0:
+            graph.update_endpoints(deployment.AWAITING_READINESS, endpoints)
+            recorded.update(endpoints)
+
+    tracker = deployment.ReadinessTracker(kubernetes_client, deployment.get_watch_seconds())
+    try:
+        addresses = tracker.track(release_name, record_endpoints)
+        if addresses is not None:
+            graph.finish_deployment(deployment.AWAITING_READINESS, states.DEPLOYED, unrecorded(addresses))
+            logger.info("Deployment of " + graph_name + " Succeeded")
+        elif time.time() >= record["deploymentDeadline"]:
+            graph.finish_deployment(deployment.AWAITING_READINESS, states.DEPLOYMENT_FAILED)
+            logger.warn("Deployment of %s did not become ready in time", graph_name)
+        else:
+            readiness_queue.schedule_check(graph_name, release_name)
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        logger.info("Graph %s changed state while its readiness was checked", graph_name)
+
+
+def check_removal(graph, kubernetes_client, record, body):
+    """
+    Follows a graph whose namespace is being deleted until the namespace has
+    gone or the watch ends. The graph is deleted once its namespace has been
+    removed, marked as failed if that has not happened by its deadline and
+    otherwise checked again later.
+    """
+    graph_name = body["graphName"]
+    try:
+        if kubernetes_client.wait_for_namespace_removal(deployment.get_watch_seconds()):
+            graph.delete()
+            logger.info("Deletion of " + graph_name + " Succeeded")
+        elif time.time() >= record["deploymentDeadline"]:
+            graph.fail_removal(deployment.AWAITING_REMOVAL)
+            logger.warn("Namespace of %s was not removed in time", graph_name)
+        else:
+            readiness_queue.schedule_check(graph_name, body["releaseName"])
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        logger.info("Graph %s changed state while its removal was checked", graph_name)
+
+
+@metrics.timed("check_deployment.handler")
+def handler(event, context):
+    """
+    The entrypoint for the Deployment Readiness Handler
+    """
+    logger.info("Received event: %s", logs.Truncated(event))
+
+    kubernetes_client = KubernetesClient(cluster_name)
+    return batch.process_records(
+        event["Records"],
+        lambda body: check_deployment(kubernetes_client, body),
+        batch.get_concurrency()
+    )
@@ -1,18 +1,24 @@
+import batch
+import deployment
 import os
-import json
 import logging
-import time
+import logs
+import metrics
+import states
+from botocore.exceptions import ClientError
 from graph import Graph
 from kubernetes import HelmClient, KubernetesClient
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logs.setup()
+logger = logging.getLogger(__name__)
 
 os.environ['PATH'] = '/opt/kubectl:/opt/helm:/opt/awscli:' + os.environ['PATH']
 
 cluster_name = os.getenv("cluster_name")
 graph_table_name = os.getenv("graph_table_name")
 
+readiness_queue = deployment.from_environment()
+
 
 def uninstall_release(helm_client, kubernetes_client, body):
     """
@@ -24,28 +30,57 @@ def uninstall_release(helm_client, kubernetes_client, body):
     # Create a Graph object to track the deletion
     graph = Graph(graph_table_name, release_name)
 
-    if not graph.check_status(expected_status):
+    record = graph.transition(expected_status, states.DELETION_IN_PROGRESS)
+    if not record:
         logger.warn("Graph %s had unexpected status. Abandoning delete", release_name)
         return
 
-    graph.update_status("DELETION_IN_PROGRESS")
+    if record.get("namespace") is not None:
+        delete_namespace(graph, kubernetes_client.for_namespace(record["namespace"]), body)
+        return
 
-    uninstalled = helm_client.uninstall_chart(release_name)
-    if uninstalled:
-        kubernetes_client.delete_volumes(release_name);
+    # Volumes are only deleted once the release has gone, so a graph whose
+    # uninstall fails keeps its data
+    if helm_client.uninstall_chart(release_name):
+        kubernetes_client.delete_volumes(release_name)
         graph.delete()
     else:
-        graph.update_status("DELETION_FAILED")
+        graph.transition(states.DELETION_IN_PROGRESS, states.DELETION_FAILED)
+
+
+def delete_namespace(graph, kubernetes_client, body):
+    """
+    Tears down a graph deployed into a namespace of its own by deleting the
+    namespace, which removes the release and its volumes with it. The API
+    server finishes the removal in the background, so rather than waiting
+    for it the graph is handed to the readiness worker which deletes the
+    graph once its namespace has gone.
+    """
+    if not kubernetes_client.delete_namespace():
+        graph.transition(states.DELETION_IN_PROGRESS, states.DELETION_FAILED)
+        return
+
+    try:
+        graph.await_removal(deployment.AWAITING_REMOVAL, readiness_queue.get_deadline())
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        logger.warn("Graph %s had unexpected status. Abandoning delete", body["releaseName"])
+        return
+    readiness_queue.schedule_check(body["graphName"], body["releaseName"])
 
 
+@metrics.timed("delete_graph.handler")
 def handler(event, context):
     """
     The entrypoint for the Delete Graph Handler
     """
-    logger.info(event)
+    logger.info("Received event: %s", logs.Truncated(event))
 
     helm_client = HelmClient(cluster_name)
     kubernetes_client = KubernetesClient(cluster_name)
-    for record in event["Records"]:
-        body = json.loads(record["body"])
-        uninstall_release(helm_client, kubernetes_client, body)
+    return batch.process_records(
+        event["Records"],
+        lambda body: uninstall_release(helm_client, kubernetes_client, body),
+        batch.get_concurrency()
+    )
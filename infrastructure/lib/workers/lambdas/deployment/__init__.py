@@ -0,0 +1,131 @@
+import clients
+import json
+import os
+import time
+
+# The deployment phase recorded on a graph once its chart has been installed
+AWAITING_READINESS = "AWAITING_READINESS"
+# The deployment phase recorded on a graph once its namespace is being deleted
+AWAITING_REMOVAL = "AWAITING_REMOVAL"
+
+DEFAULT_POLL_SECONDS = 30
+DEFAULT_TIMEOUT_SECONDS = 20 * 60
+DEFAULT_WATCH_SECONDS = 40
+# SQS cannot delay a message for longer than this
+MAX_POLL_SECONDS = 900
+# Namespaces of graphs are prefixed so they cannot clash with those of the
+# cluster itself, such as kube-system, or of anything else deployed to it
+NAMESPACE_PREFIX = "kai-"
+
+
+class ReadinessQueue:
+    """
+    Schedules checks of whether a graph has finished deploying. Each check is
+    a delayed message on the readiness queue, so no lambda sits waiting for
+    the cluster in between checks.
+    """
+
+    def __init__(self, queue_url, poll_seconds=DEFAULT_POLL_SECONDS, timeout_seconds=DEFAULT_TIMEOUT_SECONDS):
+        self.queue_url = queue_url
+        self.poll_seconds = min(poll_seconds, MAX_POLL_SECONDS)
+        self.timeout_seconds = timeout_seconds
+
+    @property
+    def sqs(self):
+        return clients.client("sqs")
+
+    def get_deadline(self):
+        """
+        Gets the time by which a deployment submitted now must become ready
+        """
+        return int(time.time()) + self.timeout_seconds
+
+    def schedule_check(self, graph_name, release_name):
+        self.sqs.send_message(
+            QueueUrl=self.queue_url,
+            MessageBody=json.dumps({
+                "graphName": graph_name,
+                "releaseName": release_name
+            }),
+            DelaySeconds=self.poll_seconds
+        )
+
+
+class ReadinessTracker:
+    """
+    Follows the ingresses of a release until every one has been given an
+    address. The ingresses are listed once and then watched from the list's
+    resourceVersion, so no change in between is missed and nothing is polled.
+    Each endpoint is reported as soon as it is assigned rather than once the
+    whole release is ready.
+    """
+
+    def __init__(self, kubernetes_client, watch_seconds=DEFAULT_WATCH_SECONDS):
+        self.kubernetes_client = kubernetes_client
+        self.watch_seconds = watch_seconds
+
+    def track(self, release_name, on_endpoints):
+        """
+        Calls on_endpoints with a dict of the name and address of each ingress
+        given an address while the release is not yet ready. Returns the
+        addresses of every ingress if the release became ready before the
+        watch ended, otherwise None. The endpoints assigned last are only
+        returned, so they can be recorded along with the release's status.
+        """
+        addresses, resource_version = self.kubernetes_client.list_ingress_addresses(release_name)
+        if addresses is None:
+            return None
+
+        reported = set()
+        if is_ready(addresses):
+            return addresses
+        self.__report(addresses, reported, on_endpoints)
+
+        changes = self.kubernetes_client.watch_ingress_addresses(release_name, resource_version, self.watch_seconds)
+        for event_type, name, address in changes:
+            if event_type == "DELETED":
+                addresses.pop(name, None)
+            else:
+                addresses[name] = address
+            if is_ready(addresses):
+                changes.close()
+                return addresses
+            self.__report(addresses, reported, on_endpoints)
+        return None
+
+    def __report(self, addresses, reported, on_endpoints):
+        assigned = { name: address for name, address in addresses.items() if address and name not in reported }
+        if len(assigned) > 0:
+            on_endpoints(assigned)
+            reported.update(assigned)
+
+
+def is_ready(addresses):
+    """
+    A graph is ready once every one of its ingresses has been given an address
+    """
+    return addresses is not None and len(addresses) > 0 and all(addresses.values())
+
+
+def get_namespace(release_name):
+    """
+    Gets the namespace a new graph is deployed into. When namespace_per_graph
+    is set each graph gets a namespace of its own named after its release, so
+    it can be torn down by deleting the namespace. Otherwise None is returned
+    and graphs share the default namespace.
+    """
+    if os.getenv("namespace_per_graph", "false").lower() == "true":
+        return NAMESPACE_PREFIX + release_name
+    return None
+
+
+def get_watch_seconds():
+    return int(os.getenv("readiness_watch_seconds", str(DEFAULT_WATCH_SECONDS)))
+
+
+def from_environment():
+    return ReadinessQueue(
+        os.getenv("readiness_queue_url"),
+        poll_seconds=int(os.getenv("readiness_poll_seconds", str(DEFAULT_POLL_SECONDS))),
+        timeout_seconds=int(os.getenv("readiness_timeout_seconds", str(DEFAULT_TIMEOUT_SECONDS)))
+    )
@@ -1,78 +1,239 @@
-import boto3
+import clients
 import logging
+import metrics
+import states
+from botocore.exceptions import ClientError
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger = logging.getLogger(__name__)
 
+# Separates the release name from the administrator in membership item keys
+MEMBERSHIP_SEPARATOR = "#"
+
+@metrics.timed_methods
 class Graph:
     """
     Represents a Graph object in a DynamoDB table
     """
     def __init__(self, table_name, release_name):
-        dynamodb = boto3.resource("dynamodb")
-        self.table = dynamodb.Table(table_name)
+        self.table = clients.resource("dynamodb").Table(table_name)
         self.release_name = release_name
 
-    def check_status(self, expected_status):
+    def transition(self, from_state, to_state, attributes=None):
+        """
+        Moves the graph from one state to another in a single conditional
+        write, setting any other attributes given in the same write. Any
+        deployment progress is cleared, so a graph which has moved on is no
+        longer followed by the readiness worker. Returns the graph as it is
+        after the write, or None if the graph was not in from_state, for
+        example because another worker moved it first.
+        """
+        states.check_transition(from_state, to_state)
+        set_expressions = [ "currentState = :to" ]
+        names = {}
+        values = {
+            ":from": from_state,
+            ":to": to_state
+        }
+        for i, (name, value) in enumerate((attributes or {}).items()):
+            names["#attribute{}".format(i)] = name
+            values[":attribute{}".format(i)] = value
+            set_expressions.append("#attribute{0} = :attribute{0}".format(i))
+
+        kwargs = {}
+        if len(names) > 0:
+            kwargs["ExpressionAttributeNames"] = names
+        try:
+            response = self.table.update_item(
+                Key={
+                    "releaseName": self.release_name
+                },
+                UpdateExpression="SET " + ", ".join(set_expressions) + " REMOVE deploymentPhase, deploymentDeadline",
+                ExpressionAttributeValues=values,
+                ConditionExpression="currentState = :from",
+                ReturnValues="ALL_NEW",
+                **kwargs
+            )
+            return response["Attributes"]
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            return None
+
+
+    def update_endpoints(self, phase, endpoints):
+        """
+        Update graph with endpoints that get created by the application load
+        balancer, a dict of resource name to address, in a single write. The
+        write only succeeds while the graph's deployment is still in the given
+        phase, so endpoints are never added to a graph being deleted.
+        """
+        expressions = self.__endpoint_expressions(
+            endpoints,
+            conditions=[ "currentState = :inProgress", "deploymentPhase = :phase" ]
+        )
+        expressions["ExpressionAttributeValues"].update({
+            ":phase": phase,
+            ":inProgress": states.DEPLOYMENT_IN_PROGRESS
+        })
+        self.table.update_item(
+            Key={
+                "releaseName": self.release_name
+            },
+            **expressions
+        )
+
+
+    def __endpoint_expressions(self, endpoints, set_expressions=(), conditions=()):
+        """
+        Creates the arguments of an update which adds each endpoint as long as
+        it has not already been recorded, along with any other expressions
+        """
+        set_expressions = list(set_expressions)
+        conditions = list(conditions)
+        names = {}
+        values = {}
+        for i, (resource_name, resource_address) in enumerate(endpoints.items()):
+            names["#resourceName{}".format(i)] = resource_name
+            values[":resourceAddress{}".format(i)] = resource_address
+            set_expressions.append("endpoints.#resourceName{0} = :resourceAddress{0}".format(i))
+            conditions.append("attribute_not_exists(endpoints.#resourceName{})".format(i))
+
+        expressions = {
+            "UpdateExpression": "SET " + ", ".join(set_expressions),
+            "ExpressionAttributeValues": values,
+            "ConditionExpression": " AND ".join(conditions)
+        }
+        if len(names) > 0:
+            expressions["ExpressionAttributeNames"] = names
+        return expressions
+
+
+    def get_deployment(self):
         """
-        Checks whether the graph has an expected status
+        Gets the state, deployment progress, namespace and endpoints of the
+        graph, returning None if it no longer exists
         """
         response = self.table.get_item(
             Key={
                 "releaseName": self.release_name
-            }
+            },
+            ProjectionExpression="currentState, deploymentPhase, deploymentDeadline, endpoints, #namespace",
+            ExpressionAttributeNames={
+                "#namespace": "namespace"
+            },
+            ConsistentRead=True
+        )
+        return response.get("Item")
+
+
+    def await_readiness(self, phase, deadline, chart_version, chart_digest):
+        """
+        Records that the graph's chart is installed, which version of the chart
+        it was and that the graph is waiting for the cluster to make it ready
+        before the deadline
+        """
+        self.table.update_item(
+            Key={
+                "releaseName": self.release_name
+            },
+            UpdateExpression="SET deploymentPhase = :phase, deploymentDeadline = :deadline, "
+                "chartVersion = :chartVersion, chartDigest = :chartDigest",
+            ExpressionAttributeValues={
+                ":phase": phase,
+                ":deadline": deadline,
+                ":chartVersion": chart_version,
+                ":chartDigest": chart_digest,
+                ":inProgress": states.DEPLOYMENT_IN_PROGRESS
+            },
+            ConditionExpression="currentState = :inProgress"
         )
-        logger.info(response)
 
-        # If the graph does not exist, it cannot have the expected status
-        graph = response["Item"]
-        if graph is None:
-          return False
-        
-        status = graph["currentState"]
 
-        return status == expected_status
+    def finish_deployment(self, phase, status, endpoints=None):
+        """
+        Sets the final status of a deployment which is still in the given
+        phase and clears its progress. Any endpoints given are recorded in
+        the same write, so readers never see the graph without them.
+        """
+        states.check_transition(states.DEPLOYMENT_IN_PROGRESS, status)
+        expressions = self.__endpoint_expressions(
+            endpoints or {},
+            set_expressions=[ "currentState = :state" ],
+            conditions=[ "currentState = :inProgress", "deploymentPhase = :phase" ]
+        )
+        expressions["UpdateExpression"] += " REMOVE deploymentPhase, deploymentDeadline"
+        expressions["ExpressionAttributeValues"].update({
+            ":state": status,
+            ":phase": phase,
+            ":inProgress": states.DEPLOYMENT_IN_PROGRESS
+        })
+        self.table.update_item(
+            Key={
+                "releaseName": self.release_name
+            },
+            **expressions
+        )
 
-                  
-    def update_endpoints(self, resource_name, resource_address):
+    def await_removal(self, phase, deadline):
         """
-        Update graph with endpoints that get created by the application load balancer
+        Records that the graph's namespace is being deleted and that it must
+        be removed before the deadline
         """
         self.table.update_item(
             Key={
                 "releaseName": self.release_name
             },
-            UpdateExpression = "SET endpoints.#resourceName = :resourceAddress",
-            ExpressionAttributeNames = { 
-                "#resourceName" : resource_name 
-                },
-            ExpressionAttributeValues = {
-                ":resourceAddress": resource_address
+            UpdateExpression="SET deploymentPhase = :phase, deploymentDeadline = :deadline",
+            ExpressionAttributeValues={
+                ":phase": phase,
+                ":deadline": deadline,
+                ":deletionInProgress": states.DELETION_IN_PROGRESS
             },
-            ConditionExpression = "attribute_not_exists(endpoints.#resourceName)"
+            ConditionExpression="currentState = :deletionInProgress"
         )
 
 
-    def update_status(self, status):
+    def fail_removal(self, phase):
         """
-        Updates the status of a Graph
+        Marks a deletion which is still in the given phase as failed and
+        clears its progress
         """
+        states.check_transition(states.DELETION_IN_PROGRESS, states.DELETION_FAILED)
         self.table.update_item(
             Key={
                 "releaseName": self.release_name
             },
-            UpdateExpression="SET currentState = :state",
+            UpdateExpression="SET currentState = :state REMOVE deploymentPhase, deploymentDeadline",
             ExpressionAttributeValues={
-                ":state": status
-            }
+                ":state": states.DELETION_FAILED,
+                ":phase": phase,
+                ":deletionInProgress": states.DELETION_IN_PROGRESS
+            },
+            ConditionExpression="currentState = :deletionInProgress AND deploymentPhase = :phase"
         )
 
+
     def delete(self):
         """
-        Deletes the graph from the Table
+        Deletes the graph and its administrator membership items from the Table
         """
-        self.table.delete_item(
-        Key={
-            "releaseName": self.release_name
-        }
-    )
+        response = self.table.get_item(
+            Key={
+                "releaseName": self.release_name
+            },
+            ProjectionExpression="administrators"
+        )
+        administrators = response.get("Item", {}).get("administrators", [])
+
+        with self.table.batch_writer() as batch:
+            for administrator in administrators:
+                batch.delete_item(
+                    Key={
+                        "releaseName": self.release_name + MEMBERSHIP_SEPARATOR + administrator
+                    }
+                )
+            batch.delete_item(
+                Key={
+                    "releaseName": self.release_name
+                }
+            )
@@ -1,8 +1,17 @@
+import base64
+import clients
+import json
+import os
 import subprocess
+import tempfile
 import logging
+import metrics
+import threading
+import time
+import urllib3
+from botocore.signers import RequestSigner
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger = logging.getLogger(__name__)
 
 standard_kubeconfig="/tmp/kubeconfig"
 
@@ -11,44 +20,160 @@ class CommandHelper:
     @staticmethod
     def run_command(cmd, release_name):
         succeeded=False
-        try:
-            cp = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=True, text=True, cwd="/tmp")
-            succeeded=True
-        except subprocess.CalledProcessError as err:
-            logger.error("Error during excution of command: %s against release name: %s", cmd, release_name)
-            logger.error(err.output)
+        # Timed as a phase named after the command, for example "helm install"
+        with metrics.timed(" ".join(cmd[:2])) as phase:
+            try:
+                cp = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=True, text=True, cwd="/tmp")
+                succeeded=True
+                phase.set_property("ExitCode", cp.returncode)
+            except subprocess.CalledProcessError as err:
+                logger.error("Error during excution of command: %s against release name: %s", cmd, release_name)
+                logger.error(err.output)
+                phase.set_property("ExitCode", err.returncode)
+            phase.put_metric("Failed", 0 if succeeded else 1)
         if succeeded:
             return(succeeded, cp.stdout)
         else:
             return succeeded
 
 
-class KubeConfigurator:
-    def run_once(f):
-        def wrapper(*args, **kwargs):
-            if not wrapper.has_run:
-                wrapper.has_run = True
-                return f(*args, **kwargs)
-        wrapper.has_run = False
-        return wrapper
+class ClusterCredentials:
+    """
+    The endpoint, certificate authority and bearer token of an EKS cluster.
+    These are made in process from describe_cluster and a presigned STS
+    request, the same token aws eks get-token makes, rather than by running
+    the aws cli. The token is cached until shortly before it expires and is
+    shared by the Kubernetes API connection and by helm through a kubeconfig.
+    """
+
+    # EKS accepts a token for 15 minutes, it is replaced a little before then
+    TOKEN_LIFETIME_SECONDS = 14 * 60
+
+    def __init__(self, cluster_name, clock=time.time):
+        self.cluster_name = cluster_name
+        self.clock = clock
+        self.__lock = threading.Lock()
+        self.__cluster = None
+        self.__ca_file = None
+        self.__token = None
+        self.__token_expires_at = 0
+        self.__kubeconfig_tokens = {}
+
+    @property
+    def endpoint(self):
+        return self.__describe()["endpoint"]
+
+    @property
+    def ca_file(self):
+        """
+        A file holding the cluster's certificate authority, or None if it has none
+        """
+        self.__describe()
+        return self.__ca_file
+
+    def get_token(self, min_remaining_seconds=0):
+        """
+        Gets a token which will be accepted for at least min_remaining_seconds
+        """
+        with self.__lock:
+            if self.clock() + min_remaining_seconds >= self.__token_expires_at:
+                self.__token = self.__generate_token()
+                self.__token_expires_at = self.clock() + self.TOKEN_LIFETIME_SECONDS
+            return self.__token
+
+    @metrics.timed("ClusterCredentials.write_kubeconfig")
+    def write_kubeconfig(self, path, min_remaining_seconds=0):
+        """
+        Writes a kubeconfig for the cluster with a token which will be accepted
+        for at least min_remaining_seconds. The file is only rewritten when the
+        token has changed since it was last written.
+        """
+        token = self.get_token(min_remaining_seconds)
+        with self.__lock:
+            if self.__kubeconfig_tokens.get(path) == token and os.path.exists(path):
+                return
+            cluster = { "server": self.endpoint }
+            if self.__ca_file is not None:
+                cluster["certificate-authority"] = self.__ca_file
+            kubeconfig = {
+                "apiVersion": "v1",
+                "kind": "Config",
+                "clusters": [ { "name": self.cluster_name, "cluster": cluster } ],
+                "users": [ { "name": self.cluster_name, "user": { "token": token } } ],
+                "contexts": [ { "name": self.cluster_name, "context": { "cluster": self.cluster_name, "user": self.cluster_name } } ],
+                "current-context": self.cluster_name
+            }
+            # JSON is valid YAML. The file is replaced whole so helm never reads it half written.
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "w") as f:
+                json.dump(kubeconfig, f)
+            os.replace(temp_path, path)
+            self.__kubeconfig_tokens[path] = token
+
+    def __describe(self):
+        if self.__cluster is None:
+            cluster = clients.client("eks").describe_cluster(name=self.cluster_name)["cluster"]
+            certificate_authority = cluster.get("certificateAuthority", {}).get("data")
+            if certificate_authority is not None:
+                ca_file = "/tmp/{}-ca.crt".format(self.cluster_name)
+                with open(ca_file, "wb") as f:
+                    f.write(base64.b64decode(certificate_authority))
+                self.__ca_file = ca_file
+            self.__cluster = cluster
+        return self.__cluster
+
+    def __generate_token(self):
+        sts = clients.client("sts")
+        region = sts.meta.region_name
+        signer = RequestSigner(
+            sts.meta.service_model.service_id,
+            region,
+            "sts",
+            "v4",
+            clients.credentials(),
+            sts.meta.events
+        )
+        url = signer.generate_presigned_url(
+            {
+                "method": "GET",
+                "url": "https://sts.{}.amazonaws.com/?Action=GetCallerIdentity&Version=2011-06-15".format(region),
+                "body": {},
+                "headers": {
+                    "x-k8s-aws-id": self.cluster_name
+                },
+                "context": {}
+            },
+            region_name=region,
+            expires_in=60,
+            operation_name=""
+        )
+        return "k8s-aws-v1." + base64.urlsafe_b64encode(url.encode("utf-8")).decode("utf-8").rstrip("=")
+
 
-    @run_once
-    def update_kube_config(self, cluster_name, kubeconfig=standard_kubeconfig):
-        logger.info("Configuring kubectl for cluster: %s", cluster_name);
-        subprocess.check_call([ 'aws', 'eks', 'update-kubeconfig',
-        '--name', cluster_name,
-        '--kubeconfig', kubeconfig
-        ])
+credentials = {}
+credentials_lock = threading.Lock()
+
+def get_credentials(cluster_name):
+    """
+    Gets the process wide credentials of a cluster, creating them on first use
+    """
+    with credentials_lock:
+        cluster_credentials = credentials.get(cluster_name)
+        if cluster_credentials is None:
+            cluster_credentials = credentials[cluster_name] = ClusterCredentials(cluster_name)
+        return cluster_credentials
 
 
 class HelmClient:
     __HELM_CMD="helm"
+    # An install or uninstall must finish before the token in its kubeconfig expires
+    __TOKEN_MARGIN_SECONDS = 5 * 60
 
     def __init__(self, cluster_name, kubeconfig=standard_kubeconfig):
-        KubeConfigurator().update_kube_config(cluster_name=cluster_name, kubeconfig=kubeconfig)
+        self.credentials = get_credentials(cluster_name)
         self.kubeconfig = kubeconfig
 
-    def __run(self, instruction, release_name, values=None, chart=None, repo=None):
+    def __run(self, instruction, release_name, values=None, chart=None, repo=None, namespace=None, create_namespace=False):
         """
         Runs a Helm command and returns True if it succeeds and False if it fails
         """
@@ -59,52 +184,293 @@ class HelmClient:
             cmd.extend(["--repo", repo])
         if values is not None:
             cmd.extend(["--values", values])
+        if namespace is not None:
+            cmd.extend(["--namespace", namespace])
+            if create_namespace:
+                cmd.append("--create-namespace")
         cmd.extend(["--kubeconfig", self.kubeconfig])
 
+        self.credentials.write_kubeconfig(self.kubeconfig, self.__TOKEN_MARGIN_SECONDS)
         return CommandHelper.run_command(cmd, release_name)
 
-    def install_chart(self, release_name, values=None, chart="gaffer", repo="https://gchq.github.io/gaffer-docker"):
+    def install_chart(self, release_name, values=None, chart="gaffer", repo="https://gchq.github.io/gaffer-docker", namespace=None):
         """
-        Installs a Helm chart and returns True if it Succeeds and False if it fails
+        Installs a Helm chart and returns True if it Succeeds and False if it fails.
+        If a namespace is given the release is installed into it, creating it
+        if it does not exist.
         """
-        return self.__run(instruction="install", release_name=release_name, values=values, chart=chart, repo=repo)
+        return self.__run(instruction="install", release_name=release_name, values=values, chart=chart, repo=repo,
+                          namespace=namespace, create_namespace=True)
 
-    def uninstall_chart(self, release_name):
+    def uninstall_chart(self, release_name, namespace=None):
         """
         Uninstalls a Helm release and returns True if it Succeeds and False if it fails
         """
-        return self.__run(instruction="uninstall", release_name=release_name)
+        return self.__run(instruction="uninstall", release_name=release_name, namespace=namespace)
+
+    def pull_chart(self, chart, destination, version=None, repo=None):
+        """
+        Downloads the archive of a Helm chart into a directory and returns True
+        if it Succeeds and False if it fails. Pulls the latest version if none
+        is given.
+        """
+        cmd = [ self.__HELM_CMD, "pull", chart, "--destination", destination ]
+        if version is not None:
+            cmd.extend(["--version", version])
+        if repo is not None:
+            cmd.extend(["--repo", repo])
+        return CommandHelper.run_command(cmd, chart)
+
+
+class ClusterConnection:
+    """
+    An in process connection to a cluster's Kubernetes API. Requests share a
+    pool of HTTPS connections which outlives the invocation, so a warm lambda
+    neither starts kubectl nor repeats the TLS handshake for each request.
+    """
+
+    def __init__(self, cluster_credentials):
+        self.credentials = cluster_credentials
+        self.__lock = threading.Lock()
+        self.__pool = None
+
+    def request(self, method, path, fields=None):
+        """
+        Makes a request to the Kubernetes API and returns the decoded JSON
+        response, raising KubernetesApiError if it is not successful
+        """
+        pool, endpoint, token = self.__connect()
+        response = pool.request(method, endpoint + path, fields=fields, headers=self.__headers(token))
+        if response.status >= 400:
+            raise KubernetesApiError(method, path, response.status, response.data.decode("utf-8", "replace"))
+        return json.loads(response.data.decode("utf-8"))
+
+    def watch(self, path, fields, resource_version, timeout_seconds):
+        """
+        Watches a collection for changes made after resource_version, yielding
+        each event as the API server sends it until the watch times out
+        """
+        pool, endpoint, token = self.__connect()
+        response = pool.request(
+            "GET",
+            endpoint + path,
+            fields={
+                **fields,
+                "watch": "true",
+                "resourceVersion": resource_version,
+                "timeoutSeconds": str(timeout_seconds)
+            },
+            headers=self.__headers(token),
+            preload_content=False,
+            # The API server ends the watch, the read timeout only guards against it going quiet
+            timeout=urllib3.Timeout(connect=5, read=timeout_seconds + 5),
+            retries=False
+        )
+        try:
+            if response.status >= 400:
+                raise KubernetesApiError("GET", path, response.status, response.read().decode("utf-8", "replace"))
+            # Each event is a line of JSON, sent as its own chunk
+            buffer = b""
+            for chunk in response.stream(decode_content=True):
+                buffer += chunk
+                lines = buffer.split(b"\n")
+                buffer = lines.pop()
+                for line in lines:
+                    if line.strip():
+                        yield json.loads(line.decode("utf-8"))
+            if buffer.strip():
+                yield json.loads(buffer.decode("utf-8"))
+        finally:
+            # A watch stopped early has unread events, so its connection cannot be reused
+            response.close()
+            response.release_conn()
 
+    def __headers(self, token):
+        return {
+            "Authorization": "Bearer " + token,
+            "Accept": "application/json"
+        }
 
+    def __connect(self):
+        with self.__lock:
+            if self.__pool is None:
+                self.__pool = self.__create_pool()
+        return self.__pool, self.credentials.endpoint, self.credentials.get_token()
+
+    def __create_pool(self):
+        pool_options = {
+            "maxsize": 10,
+            "timeout": urllib3.Timeout(connect=5, read=30),
+            "retries": urllib3.Retry(total=2, backoff_factor=0.2)
+        }
+        if self.credentials.ca_file is not None:
+            pool_options["cert_reqs"] = "CERT_REQUIRED"
+            pool_options["ca_certs"] = self.credentials.ca_file
+        return urllib3.PoolManager(**pool_options)
+
+
+class KubernetesApiError(Exception):
+
+    def __init__(self, method, path, status, body):
+        super().__init__("{} {} failed with status {}: {}".format(method, path, status, body))
+        self.status = status
+
+
+connections = {}
+connections_lock = threading.Lock()
+
+def get_connection(cluster_name):
+    """
+    Gets the process wide connection to a cluster, creating it on first use
+    """
+    with connections_lock:
+        connection = connections.get(cluster_name)
+        if connection is None:
+            connection = connections[cluster_name] = ClusterConnection(get_credentials(cluster_name))
+        return connection
+
+
+@metrics.timed_methods
 class KubernetesClient:
-    __KUBECTL_CMD="kubectl"
+    """
+    Reads and deletes the Kubernetes resources of a release through the
+    Kubernetes API. Every request is scoped to the release by a label
+    selector, so the work done is proportional to one release rather than to
+    every release in the cluster.
+    """
 
-    def __init__(self, cluster_name, kubeconfig=standard_kubeconfig):
-        KubeConfigurator().update_kube_config(cluster_name=cluster_name, kubeconfig=kubeconfig)
-        self.kubeconfig = kubeconfig
+    def __init__(self, cluster_name, namespace="default"):
+        self.cluster_name = cluster_name
+        self.connection = get_connection(cluster_name)
+        self.namespace = namespace
+
+    @metrics.untimed
+    def for_namespace(self, namespace):
+        """
+        Gets a client for another namespace of the same cluster, sharing this
+        client's connection
+        """
+        if namespace is None or namespace == self.namespace:
+            return self
+        return KubernetesClient(self.cluster_name, namespace)
+
+    def delete_namespace(self):
+        """
+        Starts deleting the client's namespace along with everything in it
+        and returns True if it is being or has been deleted. The API server
+        removes the namespace in the background once every resource in it
+        has been finalised, so this does not wait for it to go.
+        """
+        try:
+            self.connection.request(
+                "DELETE",
+                "/api/v1/namespaces/{}".format(self.namespace),
+                fields={ "propagationPolicy": "Background" }
+            )
+            return True
+        except KubernetesApiError as e:
+            if e.status == 404:
+                return True
+            logger.exception("Error deleting namespace: %s", self.namespace)
+        except Exception:
+            logger.exception("Error deleting namespace: %s", self.namespace)
+        return False
+
+    def wait_for_namespace_removal(self, timeout_seconds):
+        """
+        Returns True once the client's namespace no longer exists, watching
+        for it to be removed for up to timeout_seconds. Returns False if it
+        still exists when the watch ends, or if it could not be read.
+        """
+        fields = { "fieldSelector": "metadata.name={}".format(self.namespace) }
+        try:
+            namespaces = self.connection.request("GET", "/api/v1/namespaces", fields=fields)
+            if len(namespaces["items"]) == 0:
+                return True
+            events = self.connection.watch("/api/v1/namespaces", fields, namespaces["metadata"]["resourceVersion"], timeout_seconds)
+            for event in events:
+                if event["type"] == "DELETED":
+                    events.close()
+                    return True
+                if event["type"] == "ERROR":
+                    logger.info("Watch of namespace: %s ended: %s", self.namespace, event["object"])
+                    return False
+        except Exception:
+            logger.exception("Error watching namespace: %s", self.namespace)
+        return False
 
     def delete_volumes(self, release_name):
         """
         Deletes the Persistent Volume Claims associated to a release_name
         """
         # HDFS Datanodes & Namenode
-        self.__delete_volumes(release_name=release_name, selectors=["app.kubernetes.io/instance={}".format(release_name)])
+        self.__delete_volumes(release_name=release_name, selector="app.kubernetes.io/instance={}".format(release_name))
 
         # Zookeeper
-        self.__delete_volumes(release_name=release_name, selectors=["release={}".format(release_name)])
+        self.__delete_volumes(release_name=release_name, selector="release={}".format(release_name))
+
+    def __delete_volumes(self, release_name, selector):
+        # A single delete collection request, the API server removes every match
+        try:
+            self.connection.request(
+                "DELETE",
+                "/api/v1/namespaces/{}/persistentvolumeclaims".format(self.namespace),
+                fields={ "labelSelector": selector }
+            )
+        except Exception:
+            logger.exception("Error deleting volumes with selector: %s against release name: %s", selector, release_name)
 
-    def __delete_volumes(self, release_name, selectors):
-        cmd = [ self.__KUBECTL_CMD, "delete", "pvc", "--kubeconfig", self.kubeconfig ]
-        for selector in selectors:
-            cmd.append("--selector")
-            cmd.append(selector)
+    def list_ingress_addresses(self, release_name):
+        """
+        Gets the address given to each ingress of a release by its load
+        balancer, or None for ingresses which have not been given one yet,
+        along with the resourceVersion to watch for changes from. Returns
+        (None, None) if the ingresses could not be read.
+        """
+        try:
+            ingresses = self.connection.request(
+                "GET",
+                self.__ingresses_path(),
+                fields=self.__release_selector(release_name)
+            )
+        except Exception:
+            logger.exception("Error reading the ingresses of release name: %s", release_name)
+            return None, None
+
+        addresses = {}
+        for ingress in ingresses["items"]:
+            addresses[ingress["metadata"]["name"]] = self.__get_address(ingress)
+        return addresses, ingresses["metadata"]["resourceVersion"]
+
+    def watch_ingress_addresses(self, release_name, resource_version, timeout_seconds):
+        """
+        Yields a tuple of the event type, name and address of each change made
+        to the ingresses of a release after resource_version. Stops when the
+        watch times out, or if it fails or falls too far behind to resume.
+        """
+        try:
+            events = self.connection.watch(
+                self.__ingresses_path(),
+                self.__release_selector(release_name),
+                resource_version,
+                timeout_seconds
+            )
+            for event in events:
+                if event["type"] == "ERROR":
+                    logger.info("Watch of the ingresses of release name: %s ended: %s", release_name, event["object"])
+                    return
+                if event["type"] in ("ADDED", "MODIFIED", "DELETED"):
+                    ingress = event["object"]
+                    yield event["type"], ingress["metadata"]["name"], self.__get_address(ingress)
+        except Exception:
+            logger.exception("Error watching the ingresses of release name: %s", release_name)
 
-        CommandHelper.run_command(cmd, release_name)
+    def __ingresses_path(self):
+        return "/apis/networking.k8s.io/v1beta1/namespaces/{}/ingresses".format(self.namespace)
 
-    def get_alb_endpoints(self, release_name):
-        cmd =[self.__KUBECTL_CMD, "get", "ing", "--kubeconfig", self.kubeconfig ]
-        output = CommandHelper.run_command(cmd, release_name)
-        if(type (output) == tuple):
-            return output[1]
-            
+    def __release_selector(self, release_name):
+        return { "labelSelector": "app.kubernetes.io/instance={}".format(release_name) }
 
+    def __get_address(self, ingress):
+        load_balancers = ingress.get("status", {}).get("loadBalancer", {}).get("ingress") or [ {} ]
+        return load_balancers[0].get("hostname") or load_balancers[0].get("ip")
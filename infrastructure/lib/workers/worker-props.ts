@@ -20,14 +20,20 @@ import { Cluster } from "@aws-cdk/aws-eks";
 import { Duration } from "@aws-cdk/core";
 import { Table } from "@aws-cdk/aws-dynamodb";
 import { PolicyStatement } from "@aws-cdk/aws-iam";
+import { IBucket } from "@aws-cdk/aws-s3";
 
 export interface WorkerProps {
     queue: Queue;
     kubectlLayer: ILayerVersion;
+    commonLayer: ILayerVersion;
     cluster: Cluster;
     graphTable: Table;
     handler: string;
     timeout: Duration;
     batchSize: number;
+    concurrency?: number; // how many records of a batch are processed at once, defaults to the batch size
     policyStatements: PolicyStatement[];
+    schemaBucket?: IBucket;
+    readinessQueue?: Queue; // where checks of whether submitted graphs are ready are scheduled
+    chartLayer?: ILayerVersion; // a packaged Gaffer chart, so the worker does not pull it
 }
\ No newline at end of file
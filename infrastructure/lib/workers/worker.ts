@@ -19,6 +19,7 @@ import { WorkerProps } from "./worker-props";
 import * as lambda from "@aws-cdk/aws-lambda";
 import * as path from "path";
 import { SqsEventSource } from "@aws-cdk/aws-lambda-event-sources";
+import { DEPLOYMENT_READINESS_POLL_INTERVAL, DEPLOYMENT_READINESS_DEADLINE, DEPLOYMENT_READINESS_WATCH_DURATION } from "../constants";
 
 export class Worker extends Construct {
 
@@ -31,22 +32,46 @@ export class Worker extends Construct {
 
     private createConstructs(id: string, props: WorkerProps) {
         const extraSecurityGroups = this.node.tryGetContext("extraIngressSecurityGroups");
+        const gafferChartVersion = this.node.tryGetContext("gafferChartVersion");
+        const namespacePerGraph = this.node.tryGetContext("namespacePerGraph");
 
         // Build environment for Lambda
         const environment: { [id: string] : string; } = {
             "cluster_name": props.cluster.clusterName,
-            "graph_table_name": props.graphTable.tableName
+            "graph_table_name": props.graphTable.tableName,
+            "record_concurrency": String(props.concurrency !== undefined ? props.concurrency : props.batchSize)
         };
         if (extraSecurityGroups) {
             environment["extra_security_groups"] = extraSecurityGroups;
         }
+        if (gafferChartVersion) {
+            environment["gaffer_chart_version"] = gafferChartVersion;
+        }
+        // Context passed on the command line is always a string
+        if (namespacePerGraph === true || namespacePerGraph === "true") {
+            environment["namespace_per_graph"] = "true";
+        }
+        if (props.schemaBucket) {
+            environment["schema_bucket_name"] = props.schemaBucket.bucketName;
+        }
+        if (props.readinessQueue) {
+            environment["readiness_queue_url"] = props.readinessQueue.queueUrl;
+            environment["readiness_poll_seconds"] = String(DEPLOYMENT_READINESS_POLL_INTERVAL.toSeconds());
+            environment["readiness_timeout_seconds"] = String(DEPLOYMENT_READINESS_DEADLINE.toSeconds());
+            environment["readiness_watch_seconds"] = String(DEPLOYMENT_READINESS_WATCH_DURATION.toSeconds());
+        }
+
+        const layers = [ props.kubectlLayer, props.commonLayer ];
+        if (props.chartLayer) {
+            layers.push(props.chartLayer);
+        }
 
         // Create worker from Lambda
         this._function = new lambda.Function(this, id + "Lambda", {
             runtime: lambda.Runtime.PYTHON_3_7,
             code: new lambda.AssetCode(path.join(__dirname, "lambdas")),
             handler: props.handler,
-            layers: [ props.kubectlLayer ],
+            layers: layers,
             timeout: props.timeout,
             environment: environment
         });
@@ -55,12 +80,27 @@ export class Worker extends Construct {
             batchSize: props.batchSize
         }));
 
+        // Workers report which records failed so that only those are redelivered
+        const eventSourceMapping = this._function.node.children.find(child => child instanceof lambda.EventSourceMapping);
+        if (eventSourceMapping === undefined) {
+            throw new Error("Worker must have an event source mapping");
+        }
+        (eventSourceMapping.node.defaultChild as lambda.CfnEventSourceMapping).addPropertyOverride(
+            "FunctionResponseTypes", [ "ReportBatchItemFailures" ]
+        );
+
         // Add policy statements to role
         for (const policyStatement of props.policyStatements) {
             this._function.addToRolePolicy(policyStatement);
         }
 
         props.graphTable.grantReadWriteData(this._function);
+        if (props.schemaBucket) {
+            props.schemaBucket.grantRead(this._function);
+        }
+        if (props.readinessQueue) {
+            props.readinessQueue.grantSendMessages(this._function);
+        }
     
         const workerRole = this._function.role;
 
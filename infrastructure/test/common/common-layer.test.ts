@@ -0,0 +1,50 @@
+/*
+ * Copyright 2020 Crown Copyright
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+
+/**
+ * @group unit
+ */
+
+import { expect as expectCDK, haveResource } from "@aws-cdk/assert";
+import { Stack } from "@aws-cdk/core";
+import { CommonLayer } from "../../lib/common/common-layer";
+
+test("should create a Lambda layer", () => {
+    // Given
+    const stack = new Stack();
+
+    // When
+    new CommonLayer(stack, "TestCommonLayer");
+
+    // Then
+    expectCDK(stack).to(haveResource("AWS::Lambda::LayerVersion"));
+});
+
+test("should be compatible with the runtime used by the Kai lambdas", () => {
+    // Given
+    const stack = new Stack();
+
+    // When
+    new CommonLayer(stack, "TestCommonLayer");
+
+    // Then
+    expectCDK(stack).to(haveResource("AWS::Lambda::LayerVersion", {
+        CompatibleRuntimes: [
+            "python3.7"
+        ]
+    }));
+});
@@ -20,7 +20,8 @@
 
 import { Stack } from "@aws-cdk/core";
 import { GraphDatabase } from "../../lib/database/graph-database";
-import { expect as expectCDK, haveResource } from "@aws-cdk/assert";
+import { expect as expectCDK, haveResource, haveResourceLike, arrayWith, objectLike } from "@aws-cdk/assert";
+import { GRAPH_ADMINISTRATOR_INDEX_NAME, GRAPH_STATE_INDEX_NAME } from "../../lib/constants";
 
 function createDB(stack: Stack, minCapacity = 1, maxCapacity=25, targetUtilization = 80) {
     return new GraphDatabase(stack, "TestDB", {
@@ -60,11 +61,94 @@ test("should use the releaseName as a primary key", () => {
             {
                 "AttributeName": "releaseName",
                 "AttributeType": "S"
+            },
+            {
+                "AttributeName": "administrator",
+                "AttributeType": "S"
+            },
+            {
+                "AttributeName": "graphReleaseName",
+                "AttributeType": "S"
+            },
+            {
+                "AttributeName": "currentState",
+                "AttributeType": "S"
             }
         ]
     }));
 });
 
+test("should create a sparse index of graphs by administrator", () => {
+    // Given
+    const stack = new Stack();
+
+    // When
+    createDB(stack);
+
+    // Then
+    expectCDK(stack).to(haveResourceLike("AWS::DynamoDB::Table", {
+        "GlobalSecondaryIndexes": arrayWith(objectLike({
+            "IndexName": GRAPH_ADMINISTRATOR_INDEX_NAME,
+            "KeySchema": [
+                {
+                    "AttributeName": "administrator",
+                    "KeyType": "HASH"
+                },
+                {
+                    "AttributeName": "graphReleaseName",
+                    "KeyType": "RANGE"
+                }
+            ],
+            "Projection": {
+                "ProjectionType": "KEYS_ONLY"
+            }
+        }))
+    }));
+});
+
+test("should create a sparse index of graphs by state", () => {
+    // Given
+    const stack = new Stack();
+
+    // When
+    createDB(stack);
+
+    // Then
+    expectCDK(stack).to(haveResourceLike("AWS::DynamoDB::Table", {
+        "GlobalSecondaryIndexes": arrayWith(objectLike({
+            "IndexName": GRAPH_STATE_INDEX_NAME,
+            "KeySchema": [
+                {
+                    "AttributeName": "currentState",
+                    "KeyType": "HASH"
+                },
+                {
+                    "AttributeName": "releaseName",
+                    "KeyType": "RANGE"
+                }
+            ],
+            "Projection": {
+                "ProjectionType": "KEYS_ONLY"
+            }
+        }))
+    }));
+});
+
+test("should stream the new image of changed graphs", () => {
+    // Given
+    const stack = new Stack();
+
+    // When
+    createDB(stack);
+
+    // Then
+    expectCDK(stack).to(haveResourceLike("AWS::DynamoDB::Table", {
+        "StreamSpecification": {
+            "StreamViewType": "NEW_IMAGE"
+        }
+    }));
+});
+
 test("should be able to pass in the autoscaling properties", () => {
     // Given
     const stack = new Stack();
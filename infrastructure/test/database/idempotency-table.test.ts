@@ -0,0 +1,59 @@
+/*
+ * Copyright 2020 Crown Copyright
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+
+/**
+ * @group unit
+ */
+
+import { expect as expectCDK, haveResource } from "@aws-cdk/assert";
+import { Stack } from "@aws-cdk/core";
+import { IdempotencyTable } from "../../lib/database/idempotency-table";
+
+test("should create an on demand table keyed by idempotency key", () => {
+    // Given
+    const stack = new Stack();
+
+    // When
+    new IdempotencyTable(stack, "TestIdempotencyTable");
+
+    // Then
+    expectCDK(stack).to(haveResource("AWS::DynamoDB::Table", {
+        "KeySchema": [
+            {
+                "AttributeName": "idempotencyKey",
+                "KeyType": "HASH"
+            }
+        ],
+        "BillingMode": "PAY_PER_REQUEST"
+    }));
+});
+
+test("should expire records", () => {
+    // Given
+    const stack = new Stack();
+
+    // When
+    new IdempotencyTable(stack, "TestIdempotencyTable");
+
+    // Then
+    expectCDK(stack).to(haveResource("AWS::DynamoDB::Table", {
+        "TimeToLiveSpecification": {
+            "AttributeName": "expiresAt",
+            "Enabled": true
+        }
+    }));
+});
@@ -0,0 +1,51 @@
+/*
+ * Copyright 2020 Crown Copyright
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+/**
+ * @group unit
+ */
+
+import { expect as expectCDK, haveResource, countResources } from "@aws-cdk/assert";
+import { Stack } from "@aws-cdk/core";
+import { Table, AttributeType } from "@aws-cdk/aws-dynamodb";
+import { LayerVersion } from "@aws-cdk/aws-lambda";
+import { MembershipBackfill } from "../../lib/database/membership-backfill";
+
+function createBackfill(stack: Stack): void {
+    const graphTable = new Table(stack, "TestTable", {
+        partitionKey: { name: "releaseName", type: AttributeType.STRING }
+    });
+    const commonLayer = LayerVersion.fromLayerVersionArn(stack, "TestCommonLayer", "testCommonLayerArn");
+    new MembershipBackfill(stack, "TestMembershipBackfill", {
+        graphTable: graphTable,
+        commonLayer: commonLayer
+    });
+}
+
+test("should create a custom resource which backfills membership items", () => {
+    // Given
+    const stack = new Stack();
+
+    // When
+    createBackfill(stack);
+
+    // Then
+    expectCDK(stack).to(countResources("AWS::CloudFormation::CustomResource", 1));
+    expectCDK(stack).to(haveResource("AWS::Lambda::Function", {
+        Handler: "backfill_memberships.handler",
+        Runtime: "python3.7"
+    }));
+});
@@ -0,0 +1,75 @@
+/*
+ * Copyright 2020 Crown Copyright
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+
+/**
+ * @group unit
+ */
+
+import { expect as expectCDK, haveResource, ResourcePart } from "@aws-cdk/assert";
+import { Stack } from "@aws-cdk/core";
+import { SchemaStore } from "../../lib/database/schema-store";
+
+test("should create a bucket", () => {
+    // Given
+    const stack = new Stack();
+
+    // When
+    new SchemaStore(stack, "TestSchemaStore");
+
+    // Then
+    expectCDK(stack).to(haveResource("AWS::S3::Bucket"));
+});
+
+test("should encrypt schemas and block public access to them", () => {
+    // Given
+    const stack = new Stack();
+
+    // When
+    new SchemaStore(stack, "TestSchemaStore");
+
+    // Then
+    expectCDK(stack).to(haveResource("AWS::S3::Bucket", {
+        BucketEncryption: {
+            ServerSideEncryptionConfiguration: [
+                {
+                    ServerSideEncryptionByDefault: {
+                        SSEAlgorithm: "AES256"
+                    }
+                }
+            ]
+        },
+        PublicAccessBlockConfiguration: {
+            BlockPublicAcls: true,
+            BlockPublicPolicy: true,
+            IgnorePublicAcls: true,
+            RestrictPublicBuckets: true
+        }
+    }));
+});
+
+test("should retain schemas when the stack is deleted", () => {
+    // Given
+    const stack = new Stack();
+
+    // When
+    new SchemaStore(stack, "TestSchemaStore");
+
+    // Then
+    expectCDK(stack).to(haveResource("AWS::S3::Bucket", {
+        DeletionPolicy: "Retain"
+    }, ResourcePart.CompleteDefinition));
+});
@@ -54,7 +54,7 @@ describe("Creating a graph", () => {
     test("GET /graphs returns success and an empty array when there are no graphs deployed.", async() => {
         const response: IResponse = await client.getGraphs(user1);
         expect(response.status).toBe(200);
-        expect(response.data).toEqual([]);
+        expect(response.data).toEqual({ graphs: [] });
     });
 
 
@@ -77,27 +77,30 @@ describe("GET /graphs tests", () => {
     test("GET /graphs returns 200 success and an empty array when user does not have permission to view any deployed graphs.", async() => {
         const response: IResponse = await client.getGraphs(user2);
         expect(response.status).toBe(200);
-        expect(response.data).toEqual([]);
+        expect(response.data).toEqual({ graphs: [] });
     });
 
 
     test("GET /graphs returns 200 success and an array containing the graphs visible to the creating user.", async() => {
         const response: IResponse = await client.getGraphs(user1);
         expect(response.status).toBe(200);
-        expect(response.data).toHaveLength(1);
-        expect(response.data[0]).toMatchObject({
-            graphName: testGraph1,
-            administrators: [
-                clusterHelper.userTokens[user1].user.userName,
-                clusterHelper.userTokens[user3].user.userName
-            ],
-            endpoints:{
-                "testgraph1-gaffer-api": expect.stringMatching(/.*eu-west-1.elb.amazonaws.com/),
-                "testgraph1-gaffer-monitor": expect.stringMatching(/.*eu-west-1.elb.amazonaws.com/),
-                "testgraph1-hdfs": expect.stringMatching(/.*eu-west-1.elb.amazonaws.com/)
-            },
-            currentState: "DEPLOYED",
-            releaseName: testGraph1.toLowerCase()
+        expect(response.data).toMatchObject({
+            graphs: [
+                {
+                    graphName: testGraph1,
+                    administrators: [
+                        clusterHelper.userTokens[user1].user.userName,
+                        clusterHelper.userTokens[user3].user.userName
+                    ],
+                    endpoints:{
+                        "testgraph1-gaffer-api": expect.stringMatching(/.*eu-west-1.elb.amazonaws.com/),
+                        "testgraph1-gaffer-monitor": expect.stringMatching(/.*eu-west-1.elb.amazonaws.com/),
+                        "testgraph1-hdfs": expect.stringMatching(/.*eu-west-1.elb.amazonaws.com/)
+                    },
+                    currentState: "DEPLOYED",
+                    releaseName: testGraph1.toLowerCase()
+                }
+            ]
         });
     });
 
@@ -105,20 +108,23 @@ describe("GET /graphs tests", () => {
     test("GET /graphs returns 200 success and an array containing the graphs visible to users declared as administrator.", async() => {
         const response: IResponse = await client.getGraphs(user3);
         expect(response.status).toBe(200);
-        expect(response.data).toHaveLength(1);
-        expect(response.data[0]).toMatchObject({
-            graphName: testGraph1,
-            administrators: [
-                clusterHelper.userTokens[user1].user.userName,
-                clusterHelper.userTokens[user3].user.userName
-            ],
-            endpoints:{
-                "testgraph1-gaffer-api": expect.stringMatching(/.*eu-west-1.elb.amazonaws.com/),
-                "testgraph1-gaffer-monitor": expect.stringMatching(/.*eu-west-1.elb.amazonaws.com/),
-                "testgraph1-hdfs": expect.stringMatching(/.*eu-west-1.elb.amazonaws.com/)
-            },
-            currentState: "DEPLOYED",
-            releaseName: testGraph1.toLowerCase()
+        expect(response.data).toMatchObject({
+            graphs: [
+                {
+                    graphName: testGraph1,
+                    administrators: [
+                        clusterHelper.userTokens[user1].user.userName,
+                        clusterHelper.userTokens[user3].user.userName
+                    ],
+                    endpoints:{
+                        "testgraph1-gaffer-api": expect.stringMatching(/.*eu-west-1.elb.amazonaws.com/),
+                        "testgraph1-gaffer-monitor": expect.stringMatching(/.*eu-west-1.elb.amazonaws.com/),
+                        "testgraph1-hdfs": expect.stringMatching(/.*eu-west-1.elb.amazonaws.com/)
+                    },
+                    currentState: "DEPLOYED",
+                    releaseName: testGraph1.toLowerCase()
+                }
+            ]
         });
     });
 
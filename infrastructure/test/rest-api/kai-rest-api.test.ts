@@ -18,22 +18,30 @@
  * @group unit
  */
 
-import { expect as expectCDK, haveResource, haveResourceLike, countResourcesLike } from "@aws-cdk/assert";
+import { expect as expectCDK, haveResource, haveResourceLike, countResourcesLike, arrayWith, objectLike } from "@aws-cdk/assert";
 import * as cdk from "@aws-cdk/core";
 import * as api from "@aws-cdk/aws-apigateway";
 import * as rest from "../../lib/rest-api/kai-rest-api";
-import { Table, AttributeType } from "@aws-cdk/aws-dynamodb";
-import { ADD_GRAPH_TIMEOUT, DELETE_GRAPH_TIMEOUT } from "../../lib/constants";
+import { Table, AttributeType, StreamViewType } from "@aws-cdk/aws-dynamodb";
+import { LayerVersion } from "@aws-cdk/aws-lambda";
+import { Bucket } from "@aws-cdk/aws-s3";
+import { ADD_GRAPH_TIMEOUT, DELETE_GRAPH_TIMEOUT, GRAPH_ADMINISTRATOR_INDEX_NAME, REST_API_MINIMUM_COMPRESSION_SIZE } from "../../lib/constants";
 
 function createRestAPI(stack: cdk.Stack, id = "Test"): rest.KaiRestApi {
     const table = new Table(stack, "test", {
-        partitionKey: {name: "testKey", type: AttributeType.STRING}
+        partitionKey: {name: "testKey", type: AttributeType.STRING},
+        stream: StreamViewType.NEW_IMAGE
     });
 
     return new rest.KaiRestApi(stack, id, {
         "graphTable": table,
+        "idempotencyTable": new Table(stack, "testIdempotency", {
+            partitionKey: {name: "idempotencyKey", type: AttributeType.STRING}
+        }),
         "userPoolArn": "userPoolArn",
-        "userPoolId": "userPoolId"
+        "userPoolId": "userPoolId",
+        "commonLayer": LayerVersion.fromLayerVersionArn(stack, "testCommonLayer", "testCommonLayerArn"),
+        "schemaBucket": new Bucket(stack, "testBucket")
     });
 }
 
@@ -61,6 +69,57 @@ test("The REST API's name should be derived from the parent construct's id", ()
     }));
 });
 
+test("Should tell the add graph Lambdas which bucket to store schemas in", () => {
+    // Given
+    const stack = new cdk.Stack();
+
+    // When
+    createRestAPI(stack);
+
+    // Then
+    expectCDK(stack).to(countResourcesLike("AWS::Lambda::Function", 2, {
+        Environment: {
+            Variables: {
+                schema_bucket_name: {
+                    "Ref": "testBucketDF4D7D1A"
+                }
+            }
+        }
+    }));
+});
+
+test("Should tell the add and delete graph Lambdas where idempotency records are kept", () => {
+    // Given
+    const stack = new cdk.Stack();
+
+    // When
+    createRestAPI(stack);
+
+    // Then
+    expectCDK(stack).to(countResourcesLike("AWS::Lambda::Function", 3, {
+        Environment: {
+            Variables: {
+                idempotency_table_name: {
+                    "Ref": "testIdempotencyAAD40A25"
+                }
+            }
+        }
+    }));
+});
+
+test("The REST API should compress large responses", () => {
+    // Given
+    const stack = new cdk.Stack();
+
+    // When
+    createRestAPI(stack);
+
+    // Then
+    expectCDK(stack).to(haveResource("AWS::ApiGateway::RestApi", {
+        MinimumCompressionSize: REST_API_MINIMUM_COMPRESSION_SIZE
+    }));
+});
+
 test("The Rest API should have a graph resource which can be POSTed to", () => {
     // Given
     const stack = new cdk.Stack();
@@ -142,6 +201,24 @@ test("Should create a lambda function to serve GET requests", () => {
     }));
 });
 
+test("Should tell the GetGraphs Lambda which index lists graphs by administrator", () => {
+    // Given
+    const stack = new cdk.Stack();
+
+    // When
+    createRestAPI(stack);
+
+    // Then
+    expectCDK(stack).to(haveResourceLike("AWS::Lambda::Function", {
+        Handler: "get_graph_request.handler",
+        Environment: {
+            Variables: {
+                graph_administrator_index_name: GRAPH_ADMINISTRATOR_INDEX_NAME
+            }
+        }
+    }));
+});
+
 test("Should allow GetGraphs Lambda to read from backend database", () => {
     // Given
     const stack = new cdk.Stack();
@@ -232,7 +309,7 @@ test("Should create a lambda to send messages to the deleteGraph queue", () => {
     }));
 });
 
-test("Should allow the Delete Graph Lambda to read/write to the backend database and Send messages to the Queue", () => {
+test("Should allow the Delete Graph Lambda to read/write to the backend database and idempotency records and Send messages to the Queue", () => {
     // Given
     const stack = new cdk.Stack();
 
@@ -282,6 +359,32 @@ test("Should allow the Delete Graph Lambda to read/write to the backend database
                             "Arn"
                         ]
                     }
+                },
+                {
+                    "Action": [
+                        "dynamodb:BatchGetItem",
+                        "dynamodb:GetRecords",
+                        "dynamodb:GetShardIterator",
+                        "dynamodb:Query",
+                        "dynamodb:GetItem",
+                        "dynamodb:Scan",
+                        "dynamodb:BatchWriteItem",
+                        "dynamodb:PutItem",
+                        "dynamodb:UpdateItem",
+                        "dynamodb:DeleteItem"
+                    ],
+                    "Effect": "Allow",
+                    "Resource": [
+                        {
+                            "Fn::GetAtt": [
+                                "testIdempotencyAAD40A25",
+                                "Arn"
+                            ]
+                        },
+                        {
+                            "Ref": "AWS::NoValue"
+                        }
+                    ]
                 }
             ],
             "Version": "2012-10-17"
@@ -298,16 +401,9 @@ test("Should allow the Delete Graph Lambda to read/write to the backend database
 test("should create a queue for AddGraph messages to be sent to workers", () => {
     // Given
     const stack = new cdk.Stack();
-    const table = new Table(stack, "test", {
-        partitionKey: {name: "test", type: AttributeType.STRING}
-    });
 
     // When
-    new rest.KaiRestApi(stack, "Test", {
-        "graphTable": table,
-        "userPoolArn": "userPoolArn",
-        "userPoolId": "userPoolId"
-    });
+    createRestAPI(stack);
 
     // Then
     expectCDK(stack).to(haveResource("AWS::SQS::Queue", {
@@ -318,16 +414,9 @@ test("should create a queue for AddGraph messages to be sent to workers", () =>
 test("should create lambda to write messages to the Add Graph Queue", () => {
     // Given
     const stack = new cdk.Stack();
-    const table = new Table(stack, "test", {
-        partitionKey: {name: "test", type: AttributeType.STRING}
-    });
 
     // When
-    new rest.KaiRestApi(stack, "Test", {
-        "graphTable": table,
-        "userPoolArn": "userPoolArn",
-        "userPoolId": "userPoolId"
-    });
+    createRestAPI(stack);
 
     // Then
     expectCDK(stack).to(haveResource("AWS::Lambda::Function", {
@@ -335,26 +424,19 @@ test("should create lambda to write messages to the Add Graph Queue", () => {
     }));
 });
 
-test("should allow AddGraphLambda to write messages to queue, list Cognito users and read/write to Dynamodb", () => {
+test("should allow AddGraphLambda to write messages to queue, look up Cognito users, store schemas and read/write to Dynamodb and idempotency records", () => {
     // Given
     const stack = new cdk.Stack();
-    const table = new Table(stack, "test", {
-        partitionKey: {name: "test", type: AttributeType.STRING}
-    });
 
     // When
-    new rest.KaiRestApi(stack, "Test", {
-        "graphTable": table,
-        "userPoolArn": "userPoolArn",
-        "userPoolId": "userPoolId"
-    });
+    createRestAPI(stack);
 
     // Then
     expectCDK(stack).to(haveResource("AWS::IAM::Policy", {
         "PolicyDocument": {
             "Statement": [
                 {
-                    "Action": "cognito-idp:ListUsers",
+                    "Action": "cognito-idp:AdminGetUser",
                     "Effect": "Allow",
                     "Resource": "userPoolArn"
                 },
@@ -384,6 +466,57 @@ test("should allow AddGraphLambda to write messages to queue, list Cognito users
                         }
                     ]
                 },
+                {
+                    "Action": [
+                        "s3:GetObject*",
+                        "s3:GetBucket*",
+                        "s3:List*"
+                    ],
+                    "Effect": "Allow",
+                    "Resource": [
+                        {
+                            "Fn::GetAtt": [
+                                "testBucketDF4D7D1A",
+                                "Arn"
+                            ]
+                        },
+                        {
+                            "Fn::Join": [
+                                "",
+                                [
+                                    {
+                                        "Fn::GetAtt": [
+                                            "testBucketDF4D7D1A",
+                                            "Arn"
+                                        ]
+                                    },
+                                    "/*"
+                                ]
+                            ]
+                        }
+                    ]
+                },
+                {
+                    "Action": [
+                        "s3:PutObject*",
+                        "s3:Abort*"
+                    ],
+                    "Effect": "Allow",
+                    "Resource": {
+                        "Fn::Join": [
+                            "",
+                            [
+                                {
+                                    "Fn::GetAtt": [
+                                        "testBucketDF4D7D1A",
+                                        "Arn"
+                                    ]
+                                },
+                                "/*"
+                            ]
+                        ]
+                    }
+                },
                 {
                     "Action": [
                         "sqs:SendMessage",
@@ -397,6 +530,32 @@ test("should allow AddGraphLambda to write messages to queue, list Cognito users
                             "Arn"
                         ]
                     }
+                },
+                {
+                    "Action": [
+                        "dynamodb:BatchGetItem",
+                        "dynamodb:GetRecords",
+                        "dynamodb:GetShardIterator",
+                        "dynamodb:Query",
+                        "dynamodb:GetItem",
+                        "dynamodb:Scan",
+                        "dynamodb:BatchWriteItem",
+                        "dynamodb:PutItem",
+                        "dynamodb:UpdateItem",
+                        "dynamodb:DeleteItem"
+                    ],
+                    "Effect": "Allow",
+                    "Resource": [
+                        {
+                            "Fn::GetAtt": [
+                                "testIdempotencyAAD40A25",
+                                "Arn"
+                            ]
+                        },
+                        {
+                            "Ref": "AWS::NoValue"
+                        }
+                    ]
                 }
             ],
             "Version": "2012-10-17"
@@ -410,6 +569,169 @@ test("should allow AddGraphLambda to write messages to queue, list Cognito users
     }));
 });
 
+test("The Rest API should have a batch graphs resource which can be POSTed to", () => {
+    // Given
+    const stack = new cdk.Stack();
+
+    // When
+    createRestAPI(stack);
+
+    // Then
+    expectCDK(stack).to(haveResource("AWS::ApiGateway::Resource", {
+        PathPart: "batch"
+    }));
+
+    expectCDK(stack).to(haveResourceLike("AWS::ApiGateway::Method", {
+        HttpMethod: "POST",
+        ResourceId: {
+            Ref: "TestTestRestApibatchgraphs75405E74"
+        },
+        RestApiId: {
+            Ref: "TestTestRestApiF3AB3CBC"
+        }
+    }));
+});
+
+test("should create lambda to write batches of messages to the Add Graph Queue", () => {
+    // Given
+    const stack = new cdk.Stack();
+
+    // When
+    createRestAPI(stack);
+
+    // Then
+    expectCDK(stack).to(haveResourceLike("AWS::Lambda::Function", {
+        Handler: "add_graph_request.batch_handler",
+        Environment: {
+            Variables: {
+                sqs_queue_url: {
+                    Ref: "TestAddGraphQueue2C2BD89D"
+                }
+            }
+        }
+    }));
+});
+
+test("The specific Graph resource should have a status resource which can be long polled", () => {
+    // Given
+    const stack = new cdk.Stack();
+
+    // When
+    createRestAPI(stack);
+
+    // Then
+    expectCDK(stack).to(haveResource("AWS::ApiGateway::Resource", {
+        PathPart: "status",
+        ParentId: {
+            "Ref": "TestTestRestApigraphsgraphNameB9AC8DA7"
+        }
+    }));
+
+    expectCDK(stack).to(haveResourceLike("AWS::ApiGateway::Method", {
+        HttpMethod: "GET",
+        ResourceId: {
+            Ref: "TestTestRestApigraphsgraphNamestatus91ECC262"
+        },
+        RestApiId: {
+            Ref: "TestTestRestApiF3AB3CBC"
+        }
+    }));
+});
+
+test("Should tell the GetGraphStatus Lambda which stream to wait on", () => {
+    // Given
+    const stack = new cdk.Stack();
+
+    // When
+    createRestAPI(stack);
+
+    // Then
+    expectCDK(stack).to(haveResourceLike("AWS::Lambda::Function", {
+        Handler: "get_graph_status_request.handler",
+        Environment: {
+            Variables: {
+                graph_table_stream_arn: {
+                    "Fn::GetAtt": [
+                        "testAF53AC38",
+                        "StreamArn"
+                    ]
+                }
+            }
+        }
+    }));
+});
+
+test("Should allow the GetGraphStatus Lambda to read the backend database's stream", () => {
+    // Given
+    const stack = new cdk.Stack();
+
+    // When
+    createRestAPI(stack);
+
+    // Then
+    expectCDK(stack).to(haveResourceLike("AWS::IAM::Policy", {
+        "PolicyDocument": {
+            "Statement": arrayWith(objectLike({
+                "Action": [
+                    "dynamodb:DescribeStream",
+                    "dynamodb:GetRecords",
+                    "dynamodb:GetShardIterator"
+                ],
+                "Effect": "Allow",
+                "Resource": {
+                    "Fn::GetAtt": [
+                        "testAF53AC38",
+                        "StreamArn"
+                    ]
+                }
+            }))
+        },
+        "Roles": [
+            {
+                "Ref": "TestGetGraphStatusHandlerServiceRole5E8CF3C4"
+            }
+        ]
+    }));
+});
+
+test("Should fail if the backend database does not have a stream", () => {
+    // Given
+    const stack = new cdk.Stack();
+    const table = new Table(stack, "test", {
+        partitionKey: {name: "testKey", type: AttributeType.STRING}
+    });
+
+    // When
+    const create = () => new rest.KaiRestApi(stack, "Test", {
+        "graphTable": table,
+        "idempotencyTable": new Table(stack, "testIdempotency", {
+            partitionKey: {name: "idempotencyKey", type: AttributeType.STRING}
+        }),
+        "userPoolArn": "userPoolArn",
+        "userPoolId": "userPoolId",
+        "commonLayer": LayerVersion.fromLayerVersionArn(stack, "testCommonLayer", "testCommonLayerArn"),
+        "schemaBucket": new Bucket(stack, "testBucket")
+    });
+
+    // Then
+    expect(create).toThrow("The graph table must have a stream");
+});
+
+test("All Rest API Lambdas should include the common layer", () => {
+    // Given
+    const stack = new cdk.Stack();
+
+    // When
+    createRestAPI(stack);
+
+    // Then
+    expectCDK(stack).to(countResourcesLike("AWS::Lambda::Function", 5, {
+        Layers: [
+            "testCommonLayerArn"
+        ]
+    }));
+});
+
 test("All Rest API Methods should be configured with the KaiRestAuthorizer", () => {
     // Given
     const stack = new cdk.Stack();
@@ -18,17 +18,19 @@
  * @group unit
  */
 
-import { expect as expectCDK, haveResource, haveResourceLike } from "@aws-cdk/assert";
+import { expect as expectCDK, haveResource, haveResourceLike, arrayWith, objectLike, SynthUtils } from "@aws-cdk/assert";
 import * as cdk from "@aws-cdk/core";
 import { Cluster, KubernetesVersion } from "@aws-cdk/aws-eks";
 import { Queue } from "@aws-cdk/aws-sqs";
 import { LayerVersion } from "@aws-cdk/aws-lambda";
-import { LAMBDA_LAYER_ARN } from "../../lib/constants";
+import { LAMBDA_LAYER_ARN, DEPLOYMENT_READINESS_POLL_INTERVAL, DEPLOYMENT_READINESS_DEADLINE, DEPLOYMENT_READINESS_WATCH_DURATION } from "../../lib/constants";
 import { Worker } from "../../lib/workers/worker";
 import { Table, AttributeType } from "@aws-cdk/aws-dynamodb";
 import { PolicyStatement } from "@aws-cdk/aws-iam";
+import { Bucket } from "@aws-cdk/aws-s3";
 
-function createWorker(stack: cdk.Stack, extraSGs?: string, handler = "testHandler", timeout = cdk.Duration.minutes(10), batchSize = 3): Worker {
+function createWorker(stack: cdk.Stack, extraSGs?: string, handler = "testHandler", timeout = cdk.Duration.minutes(10), batchSize = 3, withSchemaBucket = false,
+    withReadinessQueue = false, withChartLayer = false): Worker {
     if (extraSGs !== undefined) {
         stack.node.setContext("extraIngressSecurityGroups", extraSGs);
     }
@@ -38,11 +40,13 @@ function createWorker(stack: cdk.Stack, extraSGs?: string, handler = "testHandle
         partitionKey: {name: "test", type: AttributeType.STRING}
     });
     const layer = LayerVersion.fromLayerVersionArn(stack, "testLayer", LAMBDA_LAYER_ARN);
+    const commonLayer = LayerVersion.fromLayerVersionArn(stack, "testCommonLayer", "testCommonLayerArn");
 
     return new Worker(stack, "testWorker", {
         queue: donorQueue,
         cluster: donorCluster,
         kubectlLayer: layer,
+        commonLayer: commonLayer,
         graphTable: table,
         handler: handler,
         timeout: timeout,
@@ -52,7 +56,10 @@ function createWorker(stack: cdk.Stack, extraSGs?: string, handler = "testHandle
                 actions: [ "eks:DescribeCluster" ],
                 resources: [ donorCluster.clusterArn ]
             })
-        ]
+        ],
+        schemaBucket: withSchemaBucket ? new Bucket(stack, "testBucket") : undefined,
+        readinessQueue: withReadinessQueue ? new Queue(stack, "testReadinessQueue") : undefined,
+        chartLayer: withChartLayer ? LayerVersion.fromLayerVersionArn(stack, "testChartLayer", "testChartLayerArn") : undefined
     });
 }
 
@@ -137,12 +144,46 @@ function expectLambdaEnvironmentContainsNoExtraSecurityGroups(stack: cdk.Stack)
                 },
                 "graph_table_name": {
                     "Ref": "testAF53AC38"
-                }
+                },
+                "record_concurrency": "3"
             }
         }
     }));
 }
 
+test("Should include the kubectl and common layers", () => {
+    // Given
+    const stack = new cdk.Stack();
+
+    // When
+    createWorker(stack);
+
+    // Then
+    expectCDK(stack).to(haveResource("AWS::Lambda::Function", {
+        Layers: [
+            LAMBDA_LAYER_ARN,
+            "testCommonLayerArn"
+        ]
+    }));
+});
+
+test("Should include the chart layer when one is supplied", () => {
+    // Given
+    const stack = new cdk.Stack();
+
+    // When
+    createWorker(stack, undefined, undefined, undefined, undefined, undefined, undefined, true);
+
+    // Then
+    expectCDK(stack).to(haveResource("AWS::Lambda::Function", {
+        Layers: [
+            LAMBDA_LAYER_ARN,
+            "testCommonLayerArn",
+            "testChartLayerArn"
+        ]
+    }));
+});
+
 test("should allow lambda to consume messages from queue and describe cluster", () => {
     // Given
     const stack = new cdk.Stack();
@@ -185,4 +226,197 @@ test("should allow lambda to consume messages from queue and describe cluster",
     }));
 });
 
+test("Should tell the worker which bucket schemas are stored in when one is supplied", () => {
+    // Given
+    const stack = new cdk.Stack();
+
+    // When
+    createWorker(stack, undefined, undefined, undefined, undefined, true);
+
+    // Then
+    expectCDK(stack).to(haveResourceLike("AWS::Lambda::Function", {
+        Environment: {
+            Variables: {
+                schema_bucket_name: {
+                    "Ref": "testBucketDF4D7D1A"
+                }
+            }
+        }
+    }));
+});
+
+test("Should allow the worker to read schemas when a schema bucket is supplied", () => {
+    // Given
+    const stack = new cdk.Stack();
+
+    // When
+    createWorker(stack, undefined, undefined, undefined, undefined, true);
+
+    // Then
+    expectCDK(stack).to(haveResourceLike("AWS::IAM::Policy", {
+        "PolicyDocument": {
+            "Statement": arrayWith(objectLike({
+                "Action": [
+                    "s3:GetObject*",
+                    "s3:GetBucket*",
+                    "s3:List*"
+                ],
+                "Effect": "Allow"
+            }))
+        }
+    }));
+});
+
+test("Should process as many records at once as are in a batch", () => {
+    // Given
+    const stack = new cdk.Stack();
+
+    // When
+    createWorker(stack, undefined, undefined, undefined, 5);
+
+    // Then
+    expectCDK(stack).to(haveResourceLike("AWS::Lambda::Function", {
+        Environment: {
+            Variables: {
+                record_concurrency: "5"
+            }
+        }
+    }));
+});
+
+test("Should report failures of individual records in a batch", () => {
+    // Given
+    const stack = new cdk.Stack();
+
+    // When
+    createWorker(stack);
+
+    // Then
+    expectCDK(stack).to(haveResource("AWS::Lambda::EventSourceMapping", {
+        FunctionResponseTypes: [
+            "ReportBatchItemFailures"
+        ]
+    }));
+});
+
+test("Should tell the worker where to schedule readiness checks when a readiness queue is supplied", () => {
+    // Given
+    const stack = new cdk.Stack();
+
+    // When
+    createWorker(stack, undefined, undefined, undefined, undefined, undefined, true);
+
+    // Then
+    expectCDK(stack).to(haveResourceLike("AWS::Lambda::Function", {
+        Environment: {
+            Variables: {
+                readiness_queue_url: {
+                    "Ref": "testReadinessQueue242832A9"
+                },
+                readiness_poll_seconds: String(DEPLOYMENT_READINESS_POLL_INTERVAL.toSeconds()),
+                readiness_timeout_seconds: String(DEPLOYMENT_READINESS_DEADLINE.toSeconds()),
+                readiness_watch_seconds: String(DEPLOYMENT_READINESS_WATCH_DURATION.toSeconds())
+            }
+        }
+    }));
+});
+
+test("Should allow the worker to schedule readiness checks when a readiness queue is supplied", () => {
+    // Given
+    const stack = new cdk.Stack();
+
+    // When
+    createWorker(stack, undefined, undefined, undefined, undefined, undefined, true);
+
+    // Then
+    expectCDK(stack).to(haveResourceLike("AWS::IAM::Policy", {
+        "PolicyDocument": {
+            "Statement": arrayWith(objectLike({
+                "Action": [
+                    "sqs:SendMessage",
+                    "sqs:GetQueueAttributes",
+                    "sqs:GetQueueUrl"
+                ],
+                "Effect": "Allow",
+                "Resource": {
+                    "Fn::GetAtt": [
+                        "testReadinessQueue242832A9",
+                        "Arn"
+                    ]
+                }
+            }))
+        }
+    }));
+});
+
+test("Should tell the worker which version of the Gaffer chart to deploy when one is supplied", () => {
+    // Given
+    const stack = new cdk.Stack();
+    stack.node.setContext("gafferChartVersion", "1.2.3");
+
+    // When
+    createWorker(stack);
 
+    // Then
+    expectCDK(stack).to(haveResourceLike("AWS::Lambda::Function", {
+        Environment: {
+            Variables: {
+                gaffer_chart_version: "1.2.3"
+            }
+        }
+    }));
+});
+
+test("Should tell the worker to deploy each graph into its own namespace when asked to", () => {
+    // Given
+    const stack = new cdk.Stack();
+    stack.node.setContext("namespacePerGraph", true);
+
+    // When
+    createWorker(stack);
+
+    // Then
+    expectCDK(stack).to(haveResourceLike("AWS::Lambda::Function", {
+        Environment: {
+            Variables: {
+                namespace_per_graph: "true"
+            }
+        }
+    }));
+});
+
+test("Should tell the worker to deploy each graph into its own namespace when asked to on the command line", () => {
+    // Given
+    const stack = new cdk.Stack();
+    stack.node.setContext("namespacePerGraph", "true");
+
+    // When
+    createWorker(stack);
+
+    // Then
+    expectCDK(stack).to(haveResourceLike("AWS::Lambda::Function", {
+        Environment: {
+            Variables: {
+                namespace_per_graph: "true"
+            }
+        }
+    }));
+});
+
+test("Should not deploy each graph into its own namespace when told not to on the command line", () => {
+    // Given
+    const stack = new cdk.Stack();
+    stack.node.setContext("namespacePerGraph", "false");
+
+    // When
+    createWorker(stack);
+
+    // Then
+    const resources = SynthUtils.toCloudFormation(stack).Resources;
+    const functions = Object.values(resources).filter((resource: any) => resource.Type === "AWS::Lambda::Function");
+    expect(functions.length).toBeGreaterThan(0);
+    functions.forEach((resource: any) => {
+        const variables = (resource.Properties.Environment || {}).Variables || {};
+        expect(variables.namespace_per_graph).toBeUndefined();
+    });
+});